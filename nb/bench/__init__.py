@@ -0,0 +1,3 @@
+"""Offline benchmarks of nb: a fake Telegram client and the ``nb bench`` scenarios."""
+
+from nb.bench.fake_client import FakeMedia, FakeMessage, FakeTelegramClient
@@ -0,0 +1,753 @@
+"""An in-memory stand-in for ``TelegramClient``.
+
+``FakeTelegramClient`` keeps every chat in a dict of ``FakeChat`` objects
+and implements the part of the Telethon API that nb uses: reading history
+with ``iter_messages`` / ``get_messages``, ``send_message``, ``send_file``
+(albums included), ``forward_messages``, edits, deletes, discussion
+groups linked to channels and event handlers.
+
+Every API call can be slowed down by ``latency`` seconds, and every
+``flood_every``-th write raises ``FloodWaitError`` just like Telegram's
+flood limits, so the scheduler's retry paths get exercised too.
+
+Third parties act on the fake world through ``publish``, ``comment``,
+``edit`` and ``delete``, which also fire the matching events.
+"""
+
+import asyncio
+import itertools
+import logging
+import os
+import re
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from telethon import events
+from telethon.errors.rpcerrorlist import FloodWaitError
+from telethon.tl import functions
+
+_chat_ids = itertools.count(1000000001)
+_grouped_ids = itertools.count(9000000000001)
+
+
+def new_grouped_id() -> int:
+    return next(_grouped_ids)
+
+
+class FakeMedia:
+    """Media of a fake message; only its kind and size matter."""
+
+    def __init__(self, kind: str = "photo", size: int = 100 * 1024) -> None:
+        self.kind = kind
+        self.size = size
+
+
+def _media_property(kind: str) -> property:
+    return property(
+        lambda self: self.media if self.media is not None and self.media.kind == kind else None
+    )
+
+
+class FakeMessage:
+    """The attributes and coroutines of ``telethon``'s Message used by nb."""
+
+    def __init__(
+        self,
+        client: "FakeTelegramClient",
+        chat_id: int,
+        msg_id: int,
+        text: str = "",
+        media: Optional[FakeMedia] = None,
+        grouped_id: Optional[int] = None,
+        reply_to: Optional[SimpleNamespace] = None,
+        fwd_from: Optional[SimpleNamespace] = None,
+        reply_markup: Any = None,
+        sender_id: Optional[int] = None,
+        entities: Optional[list] = None,
+    ) -> None:
+        self._client = client
+        self.chat_id = chat_id
+        self.id = msg_id
+        self.message = text
+        self.media = media
+        self.grouped_id = grouped_id
+        self.reply_to = reply_to
+        self.fwd_from = fwd_from
+        self.reply_markup = reply_markup
+        self.sender_id = sender_id if sender_id is not None else chat_id
+        self.entities = entities
+        self.date = time.time()
+        self.edit_date = None
+        self.out = False
+        self.post = sender_id is None
+
+    photo = _media_property("photo")
+    video = _media_property("video")
+    gif = _media_property("gif")
+    audio = _media_property("audio")
+    voice = _media_property("voice")
+    video_note = _media_property("video_note")
+    sticker = _media_property("sticker")
+    contact = _media_property("contact")
+
+    @property
+    def document(self):
+        if self.media is not None and self.media.kind not in ("photo", "contact"):
+            return self.media
+        return None
+
+    @property
+    def file(self):
+        if self.media is None:
+            return None
+        return SimpleNamespace(size=self.media.size, name=None, ext=None, mime_type=None)
+
+    @property
+    def client(self) -> "FakeTelegramClient":
+        return self._client
+
+    @property
+    def text(self) -> str:
+        return self.message
+
+    @property
+    def raw_text(self) -> str:
+        return self.message
+
+    @property
+    def is_reply(self) -> bool:
+        return self.reply_to is not None
+
+    @property
+    def reply_to_msg_id(self) -> Optional[int]:
+        return self.reply_to.reply_to_msg_id if self.reply_to else None
+
+    @property
+    def buttons(self):
+        return getattr(self.reply_markup, "rows", None)
+
+    async def get_sender(self):
+        return SimpleNamespace(id=self.sender_id, bot=False, username=None)
+
+    async def get_chat(self):
+        return self._client.chats[self.chat_id]
+
+    async def download_media(self, file: Any = None, **kwargs) -> Optional[str]:
+        return await self._client.download_media(self, file)
+
+    async def delete(self, **kwargs) -> None:
+        await self._client.delete_messages(self.chat_id, [self.id])
+
+    async def edit(self, text: str = None, **kwargs) -> "FakeMessage":
+        return await self._client.edit_message(self.chat_id, self.id, text, **kwargs)
+
+    def __repr__(self) -> str:
+        return f"FakeMessage(chat={self.chat_id}, id={self.id}, grouped_id={self.grouped_id})"
+
+
+class FakeChat:
+    """A channel or group: its messages and the linked discussion group."""
+
+    def __init__(self, title: str, username: Optional[str] = None, broadcast: bool = True) -> None:
+        self.id = -(next(_chat_ids) + 1000000000000)
+        self.title = title
+        self.username = username
+        self.broadcast = broadcast
+        self.megagroup = not broadcast
+        self.messages: Dict[int, FakeMessage] = {}
+        self.last_id = 0
+        self.linked_chat_id: Optional[int] = None
+        # copy every post into the discussion group, as Telegram does;
+        # a replay turns this off and feeds the recorded copies itself
+        self.auto_copy = True
+        # channel post id -> id of its automatic copy in the discussion group
+        self.discussion_copies: Dict[int, int] = {}
+
+    def next_id(self, msg_id: Optional[int] = None) -> int:
+        if msg_id is None:
+            msg_id = self.last_id + 1
+        self.last_id = max(self.last_id, msg_id)
+        return msg_id
+
+
+class FakeEvent:
+    """NewMessage / MessageEdited / MessageDeleted event of the fake client."""
+
+    def __init__(
+        self,
+        client: "FakeTelegramClient",
+        chat_id: int,
+        message: Optional[FakeMessage] = None,
+        deleted_ids: Optional[List[int]] = None,
+    ) -> None:
+        self.client = client
+        self.chat_id = chat_id
+        self.message = message
+        self.deleted_ids = deleted_ids
+        self.deleted_id = deleted_ids[0] if deleted_ids else None
+
+    def __getattr__(self, name: str):
+        if self.message is None:
+            raise AttributeError(name)
+        return getattr(self.message, name)
+
+
+def _kind_of(builder) -> str:
+    # MessageEdited is a subclass of NewMessage
+    if isinstance(builder, events.MessageEdited):
+        return "edited"
+    if isinstance(builder, events.MessageDeleted):
+        return "deleted"
+    return "new"
+
+
+class FakeTelegramClient:
+    """In-memory ``TelegramClient`` for benchmarks and offline runs.
+
+    ``latency`` seconds are awaited on every API call. When
+    ``flood_every`` is set, every n-th write raises
+    ``FloodWaitError(seconds=flood_seconds)``.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        flood_every: int = 0,
+        flood_seconds: int = 1,
+        bot: bool = False,
+    ) -> None:
+        self.latency = latency
+        self.flood_every = flood_every
+        self.flood_seconds = flood_seconds
+        self.bot = bot
+        self.me = SimpleNamespace(id=next(_chat_ids), bot=bot, username="nb_bench", first_name="nb")
+        self.chats: Dict[int, FakeChat] = {}
+        self._usernames: Dict[str, int] = {}
+        self._handlers: List[Tuple[Callable, Any, str]] = []
+        self._dispatching: set = set()
+        self._disconnected: Optional[asyncio.Event] = None
+        self._connected = False
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.writes = 0
+        self.floods = 0
+        # messages this client put into each chat, edited and deleted
+        self.sent: Dict[int, int] = defaultdict(int)
+        self.edited = 0
+        self.deleted = 0
+        # on_write(kind, chat_id, messages or ids) for every send, edit and delete
+        self.on_write: Optional[Callable[[str, int, list], None]] = None
+        self.media_dir = "."
+
+    # ------------------------------------------------------------ world
+
+    def add_chat(
+        self, title: str, username: Optional[str] = None, broadcast: bool = True, discussion: bool = False
+    ) -> FakeChat:
+        """Create a channel (or group); ``discussion`` links a new discussion group to it."""
+        chat = FakeChat(title, username, broadcast)
+        self.chats[chat.id] = chat
+        if username:
+            self._usernames[username.lower().lstrip("@")] = chat.id
+        if discussion:
+            group = self.add_chat(f"{title} chat", broadcast=False)
+            chat.linked_chat_id = group.id
+        return chat
+
+    def _chat(self, entity: Any) -> FakeChat:
+        chat_id = self._peer_id(entity)
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            raise ValueError(f"Could not find the input entity for {entity!r}")
+        return chat
+
+    def _peer_id(self, entity: Any) -> int:
+        if isinstance(entity, int):
+            return entity
+        if isinstance(entity, FakeChat):
+            return entity.id
+        if isinstance(entity, str):
+            name = entity.strip()
+            name = re.sub(r"^(https?://)?t\.me/", "", name).lstrip("@").lower()
+            if name.lstrip("-").isdigit():
+                return int(name)
+            if name in self._usernames:
+                return self._usernames[name]
+        chat_id = getattr(entity, "id", None)
+        if isinstance(chat_id, int):
+            return chat_id
+        raise ValueError(f"Cannot find any entity corresponding to {entity!r}")
+
+    def _store(
+        self, chat: FakeChat, text: str = "", fire: bool = True, msg_id: Optional[int] = None, **kwargs
+    ) -> FakeMessage:
+        message = FakeMessage(self, chat.id, chat.next_id(msg_id), text or "", **kwargs)
+        chat.messages[message.id] = message
+        if chat.linked_chat_id is not None and chat.broadcast and chat.auto_copy:
+            # Telegram copies every channel post into the discussion group
+            group = self.chats[chat.linked_chat_id]
+            copy = self._store(
+                group,
+                text,
+                fire=fire,
+                media=message.media,
+                grouped_id=message.grouped_id,
+                fwd_from=channel_post_header(chat.id, message.id),
+                sender_id=chat.id,
+            )
+            chat.discussion_copies[message.id] = copy.id
+        if fire:
+            self._fire("new", chat.id, message)
+        return message
+
+    def publish(
+        self,
+        chat: Union[FakeChat, int],
+        text: str = "",
+        media: Optional[FakeMedia] = None,
+        grouped_id: Optional[int] = None,
+        reply_to: Optional[int] = None,
+        reply_markup: Any = None,
+        fire: bool = True,
+        msg_id: Optional[int] = None,
+        reply_top: Optional[int] = None,
+        sender_id: Optional[int] = None,
+        fwd_from: Optional[SimpleNamespace] = None,
+    ) -> FakeMessage:
+        """A post by someone else; fires NewMessage unless ``fire`` is False.
+
+        ``msg_id`` keeps the id of a recorded message instead of the next free one.
+        """
+        return self._store(
+            self._chat(chat),
+            text,
+            fire=fire,
+            msg_id=msg_id,
+            media=media,
+            grouped_id=grouped_id,
+            reply_to=_reply_header(reply_to, reply_top),
+            reply_markup=reply_markup,
+            sender_id=sender_id,
+            fwd_from=fwd_from,
+        )
+
+    def publish_album(
+        self, chat: Union[FakeChat, int], captions: List[str], kind: str = "photo", fire: bool = True
+    ) -> List[FakeMessage]:
+        grouped_id = new_grouped_id()
+        return [
+            self.publish(chat, caption, media=FakeMedia(kind), grouped_id=grouped_id, fire=fire)
+            for caption in captions
+        ]
+
+    def comment(
+        self,
+        channel: Union[FakeChat, int],
+        post_id: int,
+        text: str = "",
+        media: Optional[FakeMedia] = None,
+        sender_id: int = 42,
+        fire: bool = True,
+    ) -> FakeMessage:
+        """A user's comment under a channel post, posted in its discussion group."""
+        chat = self._chat(channel)
+        group = self.chats[chat.linked_chat_id]
+        top_id = chat.discussion_copies[post_id]
+        return self._store(
+            group, text, fire=fire, media=media, reply_to=_reply_header(top_id), sender_id=sender_id
+        )
+
+    def edit(self, chat: Union[FakeChat, int], msg_id: int, text: str) -> FakeMessage:
+        """Someone else edits a message; fires MessageEdited."""
+        message = self._chat(chat).messages[msg_id]
+        message.message = text
+        message.edit_date = time.time()
+        self._fire("edited", message.chat_id, message)
+        return message
+
+    def delete(self, chat: Union[FakeChat, int], msg_ids: Iterable[int]) -> None:
+        """Someone else deletes messages; fires MessageDeleted."""
+        chat = self._chat(chat)
+        ids = list(msg_ids)
+        for msg_id in ids:
+            chat.messages.pop(msg_id, None)
+        if ids:
+            self._fire("deleted", chat.id, None, ids)
+
+    # -------------------------------------------------------- plumbing
+
+    async def _request(self, name: str, write: bool = False) -> None:
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if write:
+            self.writes += 1
+            if self.flood_every and self.writes % self.flood_every == 0:
+                self.floods += 1
+                raise FloodWaitError(None, capture=self.flood_seconds)
+
+    def _fire(
+        self, kind: str, chat_id: int, message: Optional[FakeMessage], deleted_ids: Optional[List[int]] = None
+    ) -> None:
+        if not self._handlers:
+            return
+        event = FakeEvent(self, chat_id, message, deleted_ids)
+        task = asyncio.ensure_future(self._dispatch(kind, event))
+        self._dispatching.add(task)
+        task.add_done_callback(self._dispatching.discard)
+
+    async def _dispatch(self, kind: str, event: FakeEvent) -> None:
+        for callback, builder, builder_kind in list(self._handlers):
+            if builder_kind != kind or not self._matches(builder, event):
+                continue
+            try:
+                await callback(event)
+            except events.StopPropagation:
+                break
+            except Exception:
+                logging.exception("Unhandled exception on %s", callback.__name__)
+
+    def _matches(self, builder, event: FakeEvent) -> bool:
+        chats = getattr(builder, "chats", None)
+        if chats is not None:
+            if not isinstance(chats, (list, tuple, set)):
+                chats = [chats]
+            try:
+                ids = {self._peer_id(chat) for chat in chats}
+            except ValueError:
+                ids = set()
+            if (event.chat_id in ids) == bool(getattr(builder, "blacklist_chats", False)):
+                return False
+        if event.message is not None:
+            pattern = getattr(builder, "pattern", None)
+            if pattern is not None and not pattern(event.message.message or ""):
+                return False
+            if getattr(builder, "outgoing", None) and not event.message.out:
+                return False
+        func = getattr(builder, "func", None)
+        return not func or bool(func(event))
+
+    async def idle(self) -> None:
+        """Wait until every fired event went through its handlers."""
+        while self._dispatching:
+            await asyncio.gather(*list(self._dispatching), return_exceptions=True)
+
+    # ------------------------------------------------------- lifecycle
+
+    async def __aenter__(self) -> "FakeTelegramClient":
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.disconnect()
+
+    async def start(self, *args, **kwargs) -> "FakeTelegramClient":
+        self._connected = True
+        self._disconnected = asyncio.Event()
+        return self
+
+    async def connect(self) -> None:
+        await self.start()
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    async def disconnect(self) -> None:
+        self._connected = False
+        if self._disconnected is not None:
+            self._disconnected.set()
+
+    async def run_until_disconnected(self) -> None:
+        if self._disconnected is None:
+            await self.start()
+        await self._disconnected.wait()
+
+    async def is_bot(self) -> bool:
+        return self.bot
+
+    async def get_me(self, input_peer: bool = False):
+        return self.me
+
+    # --------------------------------------------------------- events
+
+    def add_event_handler(self, callback: Callable, event: Any = None) -> None:
+        if event is None:
+            event = getattr(callback, "_nb_event", None) or events.NewMessage()
+        elif isinstance(event, type):
+            event = event()
+        self._handlers.append((callback, event, _kind_of(event)))
+
+    def remove_event_handler(self, callback: Callable, event: Any = None) -> int:
+        before = len(self._handlers)
+        if event is not None and not isinstance(event, type):
+            event = type(event)
+        self._handlers = [
+            h for h in self._handlers
+            if h[0] != callback or (event is not None and not isinstance(h[1], event))
+        ]
+        return before - len(self._handlers)
+
+    def list_event_handlers(self) -> List[Tuple[Callable, Any]]:
+        return [(callback, builder) for callback, builder, _ in self._handlers]
+
+    # ----------------------------------------------------------- reads
+
+    async def get_peer_id(self, peer: Any, add_mark: bool = True) -> int:
+        await self._request("get_peer_id")
+        return self._chat(peer).id
+
+    async def get_entity(self, entity: Any):
+        await self._request("get_entity")
+        return self._chat(entity)
+
+    async def get_input_entity(self, peer: Any):
+        return self._chat(peer)
+
+    async def iter_messages(
+        self,
+        entity: Any,
+        limit: Optional[int] = None,
+        *,
+        offset_id: int = 0,
+        min_id: int = 0,
+        max_id: int = 0,
+        reverse: bool = False,
+        reply_to: Optional[int] = None,
+        ids: Any = None,
+        **kwargs,
+    ):
+        if ids is not None:
+            for message in await self.get_messages(entity, ids=ids if isinstance(ids, list) else [ids]):
+                yield message
+            return
+        chat = self._chat(entity)
+        msg_ids = sorted(chat.messages, reverse=not reverse)
+        if reverse:
+            msg_ids = [i for i in msg_ids if i > max(offset_id, min_id) and (not max_id or i < max_id)]
+        else:
+            msg_ids = [
+                i for i in msg_ids
+                if (not offset_id or i < offset_id) and i > min_id and (not max_id or i < max_id)
+            ]
+        returned = 0
+        for n, msg_id in enumerate(msg_ids):
+            if n % 100 == 0:
+                # Telegram hands out history in pages of 100
+                await self._request("iter_messages")
+            message = chat.messages.get(msg_id)
+            if message is None:
+                continue
+            if reply_to is not None:
+                header = message.reply_to
+                if header is None or reply_to not in (header.reply_to_msg_id, header.reply_to_top_id):
+                    continue
+            yield message
+            returned += 1
+            if limit is not None and returned >= limit:
+                return
+
+    async def get_messages(self, entity: Any, limit: Optional[int] = None, *, ids: Any = None, **kwargs):
+        if ids is None:
+            return [m async for m in self.iter_messages(entity, limit, **kwargs)]
+        await self._request("get_messages")
+        chat = self._chat(entity)
+        if isinstance(ids, int):
+            return chat.messages.get(ids)
+        return [chat.messages.get(i) for i in ids]
+
+    async def download_media(self, message: FakeMessage, file: Any = None, **kwargs) -> Optional[str]:
+        if message.media is None:
+            return None
+        await self._request("download_media")
+        if isinstance(file, str) and file and not file.endswith(os.sep):
+            path = file
+        else:
+            path = os.path.join(
+                file or self.media_dir, f"{message.chat_id}_{message.id}.{message.media.kind}"
+            )
+        with open(path, "wb") as out:
+            out.truncate(message.media.size)
+        return path
+
+    async def __call__(self, request, ordered: bool = False):
+        if isinstance(request, functions.channels.GetFullChannelRequest):
+            await self._request("GetFullChannelRequest")
+            chat = self._chat(request.channel)
+            return SimpleNamespace(
+                full_chat=SimpleNamespace(id=chat.id, linked_chat_id=chat.linked_chat_id),
+                chats=[chat],
+            )
+        if isinstance(request, functions.messages.GetDiscussionMessageRequest):
+            await self._request("GetDiscussionMessageRequest")
+            chat = self._chat(request.peer)
+            copy_id = chat.discussion_copies.get(request.msg_id)
+            if copy_id is None:
+                raise ValueError("The message ID used in the peer was invalid")
+            group = self.chats[chat.linked_chat_id]
+            return SimpleNamespace(messages=[group.messages[copy_id]], chats=[group])
+        raise NotImplementedError(f"{type(request).__name__} is not supported by the fake client")
+
+    # ---------------------------------------------------------- writes
+
+    def _thread(self, chat: FakeChat, reply_to: Any, comment_to: Any) -> Tuple[FakeChat, Optional[int]]:
+        """Resolve ``comment_to`` to the discussion group and its thread top."""
+        if comment_to is not None:
+            post_id = getattr(comment_to, "id", comment_to)
+            copy_id = chat.discussion_copies.get(post_id)
+            if copy_id is None:
+                raise ValueError("The message ID used in the peer was invalid")
+            return self.chats[chat.linked_chat_id], copy_id
+        return chat, getattr(reply_to, "id", reply_to)
+
+    def _write(self, chat: FakeChat, text: str, **kwargs) -> FakeMessage:
+        message = self._store(chat, text, **kwargs)
+        message.out = True
+        message.sender_id = self.me.id
+        self.sent[chat.id] += 1
+        if self.on_write is not None:
+            self.on_write("send", chat.id, [message])
+        return message
+
+    async def send_message(
+        self,
+        entity: Any,
+        message: Any = "",
+        *,
+        reply_to: Any = None,
+        file: Any = None,
+        buttons: Any = None,
+        comment_to: Any = None,
+        **kwargs,
+    ):
+        if file is not None:
+            return await self.send_file(
+                entity, file, caption=message, reply_to=reply_to, buttons=buttons, comment_to=comment_to
+            )
+        await self._request("send_message", write=True)
+        if isinstance(message, FakeMessage):
+            message = message.message
+        chat, reply_to = self._thread(self._chat(entity), reply_to, comment_to)
+        return self._write(chat, message or "", reply_to=_reply_header(reply_to), reply_markup=buttons)
+
+    async def send_file(
+        self,
+        entity: Any,
+        file: Any,
+        *,
+        caption: Any = None,
+        reply_to: Any = None,
+        buttons: Any = None,
+        comment_to: Any = None,
+        **kwargs,
+    ):
+        await self._request("send_file", write=True)
+        chat, reply_to = self._thread(self._chat(entity), reply_to, comment_to)
+        if not isinstance(file, (list, tuple)):
+            text = caption[0] if isinstance(caption, (list, tuple)) else caption
+            return self._write(
+                chat,
+                text or "",
+                media=_as_media(file),
+                reply_to=_reply_header(reply_to),
+                reply_markup=buttons,
+            )
+        if not isinstance(caption, (list, tuple)):
+            caption = [caption] + [""] * (len(file) - 1)
+        grouped_id = new_grouped_id() if len(file) > 1 else None
+        return [
+            self._write(
+                chat,
+                text or "",
+                media=_as_media(item),
+                grouped_id=grouped_id,
+                reply_to=_reply_header(reply_to),
+            )
+            for item, text in itertools.zip_longest(file, caption[: len(file)])
+        ]
+
+    async def forward_messages(self, entity: Any, messages: Any, from_peer: Any = None, **kwargs):
+        await self._request("forward_messages", write=True)
+        single = not isinstance(messages, (list, tuple))
+        items = [messages] if single else list(messages)
+        chat = self._chat(entity)
+        grouped_id = new_grouped_id() if len(items) > 1 else None
+        result = []
+        for item in items:
+            if not isinstance(item, FakeMessage):
+                item = self._chat(from_peer).messages[item]
+            result.append(
+                self._write(
+                    chat,
+                    item.message,
+                    media=item.media,
+                    grouped_id=grouped_id if item.grouped_id else None,
+                    fwd_from=SimpleNamespace(
+                        channel_post=None,
+                        from_id=SimpleNamespace(channel_id=item.chat_id),
+                        saved_from_peer=None,
+                        saved_from_msg_id=None,
+                        from_name=None,
+                        date=item.date,
+                    ),
+                )
+            )
+        return result[0] if single else result
+
+    async def edit_message(self, entity: Any, message: Any = None, text: str = None, **kwargs):
+        await self._request("edit_message", write=True)
+        chat = self._chat(entity)
+        message = chat.messages.get(getattr(message, "id", message))
+        if message is None:
+            raise ValueError("The message ID used in the peer was invalid")
+        if text is not None:
+            message.message = text
+        message.edit_date = time.time()
+        self.edited += 1
+        if self.on_write is not None:
+            self.on_write("edit", chat.id, [message])
+        return message
+
+    async def delete_messages(self, entity: Any, message_ids: Any, **kwargs) -> list:
+        await self._request("delete_messages", write=True)
+        chat = self._chat(entity)
+        if not isinstance(message_ids, (list, tuple)):
+            message_ids = [message_ids]
+        ids = [getattr(msg_id, "id", msg_id) for msg_id in message_ids]
+        for msg_id in ids:
+            if chat.messages.pop(msg_id, None) is not None:
+                self.deleted += 1
+        if self.on_write is not None:
+            self.on_write("delete", chat.id, ids)
+        return [SimpleNamespace(pts_count=len(message_ids))]
+
+
+def _reply_header(msg_id: Optional[int], top_id: Optional[int] = None) -> Optional[SimpleNamespace]:
+    if msg_id is None:
+        return None
+    return SimpleNamespace(
+        reply_to_msg_id=msg_id, reply_to_top_id=top_id, reply_to_peer_id=None, forum_topic=False
+    )
+
+
+def channel_post_header(channel_id: int, post_id: int) -> SimpleNamespace:
+    """``fwd_from`` of the automatic copy of a channel post in its discussion group."""
+    return SimpleNamespace(
+        channel_post=post_id,
+        from_id=SimpleNamespace(channel_id=channel_id),
+        saved_from_peer=SimpleNamespace(channel_id=channel_id),
+        saved_from_msg_id=post_id,
+        from_name=None,
+        date=time.time(),
+    )
+
+
+def _as_media(file: Any) -> FakeMedia:
+    if isinstance(file, FakeMedia):
+        return file
+    media = getattr(file, "media", None)
+    if isinstance(media, FakeMedia):
+        return media
+    if isinstance(file, str) and os.path.exists(file):
+        return FakeMedia("document", os.path.getsize(file))
+    return FakeMedia("document", 0)
@@ -0,0 +1,301 @@
+"""Micro-benchmarks of the plugin chain with regression baselines.
+
+Synthetic corpora (short and long text, entity-heavy markdown, albums,
+inline keyboards) are run through single plugins with rule tables of
+10, 1k and 10k entries, through ``_process_reply_markup``,
+``apply_plugins_to_group`` and the full ``apply_plugins`` pipeline.
+
+Every case reports the median and p90 time per message over several
+rounds and the peak memory allocated while handling one message
+(tracemalloc). ``save_baseline`` stores the results as JSON and
+``compare`` flags cases that got slower, or allocate more, by more than
+a threshold. Timings depend on the machine: compare against a baseline
+recorded on the same one.
+"""
+
+import asyncio
+import inspect
+import json
+import logging
+import random
+import statistics
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from telethon.tl.types import (
+    KeyboardButtonCallback,
+    KeyboardButtonRow,
+    KeyboardButtonUrl,
+    ReplyInlineMarkup,
+)
+
+from nb.bench.fake_client import FakeMedia, FakeMessage, FakeTelegramClient, new_grouped_id
+
+CORPUS_SIZE = 50
+ROUND_BUDGET = 0.5  # seconds of rounds per case
+MIN_ROUNDS, MAX_ROUNDS = 5, 50
+RULE_SIZES = (10, 1000, 10000)
+DEFAULT_THRESHOLD = 0.2
+# 低于这些绝对差值的变化视为噪声，不算退化
+NOISE_US = 1.0
+NOISE_KB = 0.5
+
+_WORDS = (
+    "频道 更新 今日 新闻 速报 合集 高清 资源 分享 推荐 通知 活动 福利 精选 "
+    "update daily news release weekly digest photo video link download"
+).split()
+
+Case = Tuple[Callable[[Any], Any], List[Any]]
+
+
+# ------------------------------------------------------------- corpora
+
+
+def _words(rnd: random.Random, count: int) -> str:
+    return " ".join(rnd.choice(_WORDS) for _ in range(count))
+
+
+def _messages(client: FakeTelegramClient, texts: List[str], media: bool = False) -> List[FakeMessage]:
+    return [
+        FakeMessage(client, -1001, i + 1, text, media=FakeMedia("photo") if media else None)
+        for i, text in enumerate(texts)
+    ]
+
+
+def corpora(client: FakeTelegramClient) -> Dict[str, List[FakeMessage]]:
+    rnd = random.Random(45)
+    short = [_words(rnd, 8) for _ in range(CORPUS_SIZE)]
+    long = [_words(rnd, 400) for _ in range(CORPUS_SIZE)]
+    markdown = [
+        " ".join(
+            f"**{_words(rnd, 2)}** __{_words(rnd, 2)}__ `{rnd.choice(_WORDS)}` "
+            f"[{rnd.choice(_WORDS)}](https://t.me/c/{i}/{j}) #{rnd.choice(_WORDS)}"
+            for j in range(20)
+        )
+        for i in range(CORPUS_SIZE)
+    ]
+    albums = []
+    for i in range(CORPUS_SIZE // 5):
+        grouped_id = new_grouped_id()
+        album = _messages(client, [_words(rnd, 30)] + [""] * 9, media=True)
+        for msg in album:
+            msg.grouped_id = grouped_id
+        albums.append(album)
+    keyboards = _messages(client, short)
+    for n, msg in enumerate(keyboards):
+        msg.reply_markup = _keyboard(rows=3 if n % 2 else 10, cols=3 if n % 2 else 8)
+    return {
+        "short": _messages(client, short),
+        "long": _messages(client, long),
+        "markdown": _messages(client, markdown),
+        "album": albums,
+        "keyboard": keyboards,
+    }
+
+
+def _keyboard(rows: int, cols: int) -> ReplyInlineMarkup:
+    return ReplyInlineMarkup(
+        rows=[
+            KeyboardButtonRow(
+                buttons=[
+                    KeyboardButtonUrl(text=f"链接 {r}-{c}", url=f"https://t.me/src_channel/{r * cols + c}")
+                    if c % 2 == 0
+                    else KeyboardButtonCallback(text=f"按钮 {r}-{c}", data=b"cb")
+                    for c in range(cols)
+                ]
+            )
+            for r in range(rows)
+        ]
+    )
+
+
+def _rules(size: int) -> Dict[str, str]:
+    # a few rules that hit, the rest never match, as in real rule tables
+    rules = {f"keyword{i}": f"kw{i}" for i in range(size - 3)}
+    rules.update({"速报": "快讯", "news": "NEWS", "t.me/c/": "t.me/d/"})
+    return rules
+
+
+# --------------------------------------------------------------- cases
+
+
+def _plugin(pid: str, cfg: Any):
+    module = __import__(f"nb.plugins.{pid}", fromlist=[""])
+    return getattr(module, f"Nb{pid.title()}")(cfg)
+
+
+def _wrap(modify: Callable) -> Callable[[FakeMessage], Any]:
+    from nb.plugins import NbMessage
+
+    return lambda msg: modify(NbMessage(msg))
+
+
+def cases() -> Dict[str, Case]:
+    from nb import plugins
+    from nb.plugin_models import (
+        Caption,
+        Filters,
+        Format,
+        InlineButtonMode,
+        Replace,
+        Style,
+    )
+
+    client = FakeTelegramClient()
+    data = corpora(client)
+    result: Dict[str, Case] = {}
+
+    def filter_cfg(size: int) -> Filters:
+        cfg = Filters(check=True)
+        cfg.text.blacklist = [f"spam{i}" for i in range(size)]
+        return cfg
+
+    def replace_cfg(size: int) -> Replace:
+        return Replace(check=True, text=_rules(size))
+
+    caption_cfg = Caption(check=True, header="📢 频道更新", footer="— via nb")
+    fmt_cfg = Format(check=True, style=Style.BOLD)
+
+    for corpus in ("short", "long", "markdown"):
+        result[f"filter/{corpus}"] = (_wrap(_plugin("filter", filter_cfg(10)).modify), data[corpus])
+        result[f"replace/{corpus}"] = (_wrap(_plugin("replace", replace_cfg(10)).modify), data[corpus])
+        result[f"caption/{corpus}"] = (_wrap(_plugin("caption", caption_cfg).modify), data[corpus])
+        result[f"fmt/{corpus}"] = (_wrap(_plugin("fmt", fmt_cfg).modify), data[corpus])
+    for size in RULE_SIZES:
+        result[f"filter/rules_{size}"] = (_wrap(_plugin("filter", filter_cfg(size)).modify), data["long"])
+        result[f"replace/rules_{size}"] = (_wrap(_plugin("replace", replace_cfg(size)).modify), data["long"])
+
+    caption = _plugin("caption", caption_cfg)
+    result["caption/album"] = (
+        lambda album: caption.modify_group([plugins.NbMessage(m) for m in album]),
+        data["album"],
+    )
+
+    url_rules = {"t.me/src_channel": "t.me/dest_channel"}
+    text_rules = {"链接": "link", "按钮": "button"}
+    for mode in (InlineButtonMode.REPLACE_URL, InlineButtonMode.REPLACE_ALL):
+        result[f"reply_markup/{mode.value}"] = (
+            lambda msg, mode=mode: plugins._process_reply_markup(
+                msg.reply_markup, mode, url_rules, text_rules
+            ),
+            data["keyboard"],
+        )
+
+    # the benchmark runs in its own process, so the loaded chain can simply be replaced
+    plugins._plugins.clear()
+    plugins._plugins.update(
+        filter=_plugin("filter", filter_cfg(10)),
+        replace=_plugin("replace", replace_cfg(1000)),
+        caption=_plugin("caption", caption_cfg),
+        fmt=_plugin("fmt", Format(check=True, style=Style.PRESERVE)),
+    )
+    result["group/album"] = (plugins.apply_plugins_to_group, data["album"])
+    for corpus in ("short", "long", "markdown"):
+        result[f"pipeline/{corpus}"] = (plugins.apply_plugins, data[corpus])
+    return result
+
+
+# ------------------------------------------------------------- measure
+
+
+async def _call(func: Callable, arg: Any) -> Any:
+    result = func(arg)
+    if inspect.isawaitable(result):
+        result = await result
+    return result
+
+
+async def _measure(func: Callable, items: List[Any]) -> Dict[str, float]:
+    # album cases take a whole album per call, results are per message
+    messages = sum(len(item) if isinstance(item, list) else 1 for item in items)
+    for item in items[:5]:
+        await _call(func, item)
+
+    rounds: List[float] = []
+    spent = 0.0
+    while len(rounds) < MIN_ROUNDS or (spent < ROUND_BUDGET and len(rounds) < MAX_ROUNDS):
+        started = time.perf_counter()
+        for item in items:
+            await _call(func, item)
+        took = time.perf_counter() - started
+        spent += took
+        rounds.append(took / messages)
+    rounds.sort()
+
+    tracemalloc.start()
+    peaks = []
+    for item in items:
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        await _call(func, item)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+
+    return {
+        "per_msg_us": round(statistics.median(rounds) * 1e6, 2),
+        "p90_us": round(rounds[min(len(rounds) - 1, int(0.9 * len(rounds)))] * 1e6, 2),
+        "alloc_kb": round(sum(peaks) / messages / 1024, 2),
+        "rounds": len(rounds),
+    }
+
+
+def run_plugin_cases(only: Optional[List[str]] = None) -> Dict[str, Dict[str, float]]:
+    """Measure every case (or those starting with one of ``only``).
+
+    Must run in its own process: the loaded plugin chain is replaced.
+    """
+    # 与默认的 WARNING 日志级别一致，插件的 info 日志不输出
+    logging.disable(logging.INFO)
+    results = {}
+    for name, (func, items) in cases().items():
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        results[name] = asyncio.run(_measure(func, items))
+    return results
+
+
+# ------------------------------------------------------------ baseline
+
+
+def save_baseline(results: Dict[str, Dict[str, float]], path: str) -> None:
+    with open(path, "w", encoding="utf8") as file:
+        json.dump({"time": time.time(), "cases": results}, file, indent=2, ensure_ascii=False)
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    with open(path, encoding="utf8") as file:
+        return json.load(file)["cases"]
+
+
+def _change(current: float, base: float, noise: float) -> float:
+    if abs(current - base) < noise or not base:
+        return 0.0
+    return current / base - 1
+
+
+def compare(
+    baseline: Dict[str, Dict[str, float]],
+    current: Dict[str, Dict[str, float]],
+    threshold: float = DEFAULT_THRESHOLD,
+) -> List[Dict[str, Any]]:
+    """One row per case; ``regressed`` when time or allocations grew beyond ``threshold``."""
+    rows = []
+    for name, cur in current.items():
+        base = baseline.get(name)
+        if base is None:
+            rows.append({"case": name, "current": cur, "baseline": None, "regressed": False})
+            continue
+        time_change = _change(cur["per_msg_us"], base["per_msg_us"], NOISE_US)
+        alloc_change = _change(cur["alloc_kb"], base["alloc_kb"], NOISE_KB)
+        rows.append(
+            {
+                "case": name,
+                "current": cur,
+                "baseline": base,
+                "time_change": time_change,
+                "alloc_change": alloc_change,
+                "regressed": time_change > threshold or alloc_change > threshold,
+            }
+        )
+    return rows
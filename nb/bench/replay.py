@@ -0,0 +1,250 @@
+"""Replay a recorded live event stream (see ``nb.event_log``) into a live worker.
+
+Every recorded chat becomes a chat of the fake client: source channels
+get one destination each, comment groups are linked back to their
+channel. The events are then published with their recorded message ids
+and timing, sped up by ``speed`` (0 replays as fast as possible).
+
+Each replayed text carries a marker, so a send or edit that shows up on
+a destination can be traced back to its event; deletes are traced by
+the destination ids. The report has the end-to-end latency per event
+kind and the worker's memory over the run.
+"""
+
+import asyncio
+import os
+import re
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from nb import metrics
+from nb.bench.fake_client import FakeChat, FakeMedia, FakeTelegramClient, channel_post_header
+from nb.event_log import read_events
+
+# 全部事件发出后，超过此秒数没有任何新的写入即认为回放结束
+IDLE_TIMEOUT = 10.0
+MEMORY_INTERVAL = 0.25
+# 每隔多少个事件让出一次事件循环（最大速度回放时）
+BURST = 50
+
+_MARKER = re.compile(r"⟦(\d+)⟧")
+
+
+def _rss_mb() -> Optional[float]:
+    try:
+        with open("/proc/self/statm") as file:
+            pages = int(file.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class Replay:
+    def __init__(self, client: FakeTelegramClient, records: List[Dict[str, Any]]) -> None:
+        self.client = client
+        self.records = records
+        self.chats: Dict[int, FakeChat] = {}
+        self.dests: Dict[int, FakeChat] = {}
+        # event index -> (kind, time it was published)
+        self.published: Dict[int, Tuple[str, float]] = {}
+        # source (chat, msg) -> time its delete was published
+        self.deleted_at: Dict[Tuple[int, int], float] = {}
+        # destination (chat, msg) -> source (chat, msg)
+        self.origin: Dict[Tuple[int, int], Tuple[int, int]] = {}
+        self.latency: Dict[str, List[float]] = defaultdict(list)
+        self.memory: List[float] = []
+        self.last_write = time.monotonic()
+        client.on_write = self._on_write
+
+    # ------------------------------------------------------------ world
+
+    def build(self) -> List[Any]:
+        """Create the chats of the recording and return the forwards to configure."""
+        from nb.config import Forward
+
+        comment_groups = {r["c"]: r["src"] for r in self.records if r["k"] == "comment" and r.get("src")}
+        linked = {src: group for group, src in comment_groups.items()}
+        sources = {r["c"] for r in self.records if r["k"] != "comment" and r["c"] is not None}
+        sources |= set(linked)
+
+        forwards = []
+        for n, src in enumerate(sorted(sources)):
+            chat = self.client.add_chat(f"source {n}")
+            # the recorded copies in the discussion group are replayed as they were
+            chat.auto_copy = False
+            self.chats[src] = chat
+            if src in linked:
+                group = self.client.add_chat(f"source {n} chat", broadcast=False)
+                chat.linked_chat_id = group.id
+                self.chats[linked[src]] = group
+            dest = self.client.add_chat(f"dest {n}", discussion=src in linked)
+            self.dests[dest.id] = dest
+            forward = Forward(
+                con_name=f"replay {n}",
+                source=chat.id,
+                dest=[dest.id],
+                bot_media_enabled=False,
+                auto_comment_trigger_enabled=False,
+            )
+            forward.comments.enabled = src in linked
+            forwards.append(forward)
+        return forwards
+
+    # ---------------------------------------------------------- tracing
+
+    def _on_write(self, kind: str, chat_id: int, items: list) -> None:
+        now = time.monotonic()
+        self.last_write = now
+        if kind == "delete":
+            for msg_id in items:
+                source = self.origin.get((chat_id, msg_id))
+                started = self.deleted_at.get(source) if source else None
+                if started is not None:
+                    self.latency["deleted"].append(now - started)
+            return
+        for message in items:
+            match = _MARKER.search(message.message or "")
+            if not match:
+                continue
+            index = int(match.group(1))
+            event_kind, started = self.published.get(index, (None, None))
+            if started is None:
+                continue
+            self.latency[event_kind].append(now - started)
+            if kind == "send":
+                record = self.records[index]
+                self.origin[(chat_id, message.id)] = (self.chats[record["c"]].id, record["m"])
+
+    def _text(self, index: int, record: Dict[str, Any]) -> str:
+        text = record.get("x", "")
+        if not text and record.get("g") is not None:
+            # album items without a caption stay empty, the captioned one is traced
+            return ""
+        return f"{text} ⟦{index}⟧"
+
+    # ------------------------------------------------------------ feed
+
+    def _publish(self, index: int, record: Dict[str, Any]) -> None:
+        kind = record["k"]
+        chat = self.chats.get(record["c"])
+        if chat is None:
+            return
+        now = time.monotonic()
+        if kind == "deleted":
+            for msg_id in record.get("d", []):
+                self.deleted_at[(chat.id, msg_id)] = now
+            self.client.delete(chat, record.get("d", []))
+            return
+
+        self.published[index] = (kind, now)
+        text = self._text(index, record)
+        if kind == "edited":
+            if record["m"] not in chat.messages:
+                self._store(chat, record, text, fire=False)
+            self.client.edit(chat, record["m"], text)
+            return
+        self._store(chat, record, text, fire=True)
+
+    def _store(self, chat: FakeChat, record: Dict[str, Any], text: str, fire: bool) -> None:
+        fwd_from = None
+        if record.get("fp"):
+            channel = self.chats.get(record.get("src"))
+            fwd_from = channel_post_header(channel.id if channel else chat.id, record["fp"])
+            if channel is not None:
+                channel.discussion_copies[record["fp"]] = record["m"]
+        self.client.publish(
+            chat,
+            text,
+            media=FakeMedia(record["md"], record.get("sz", 100 * 1024)) if record.get("md") else None,
+            grouped_id=record.get("g"),
+            reply_to=record.get("r"),
+            reply_top=record.get("tp"),
+            sender_id=record.get("s"),
+            fwd_from=fwd_from,
+            msg_id=record["m"],
+            fire=fire,
+        )
+
+    async def feed(self, speed: float) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for index, record in enumerate(self.records):
+            if speed > 0:
+                delay = started + record["t"] / speed - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            elif index % BURST == BURST - 1:
+                await asyncio.sleep(0)
+            self._publish(index, record)
+
+    async def sample_memory(self) -> None:
+        while True:
+            rss = _rss_mb()
+            if rss is not None:
+                self.memory.append(rss)
+            await asyncio.sleep(MEMORY_INTERVAL)
+
+    async def drain(self) -> None:
+        """Wait until the worker stopped writing for IDLE_TIMEOUT seconds."""
+        while time.monotonic() - self.last_write < IDLE_TIMEOUT:
+            await asyncio.sleep(0.1)
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        kinds = defaultdict(int)
+        for record in self.records:
+            kinds[record["k"]] += 1
+        latency = {}
+        for kind, samples in self.latency.items():
+            stats = metrics.percentiles(samples)
+            latency[kind] = {k: round(v * 1000, 1) if k != "count" else v for k, v in stats.items()}
+        return {
+            "events": dict(kinds),
+            "seconds": round(elapsed, 3),
+            "recorded_seconds": round(self.records[-1]["t"], 3) if self.records else 0,
+            "latency_ms": latency,
+            "rss_mb": {
+                "start": self.memory[0] if self.memory else None,
+                "peak": max(self.memory) if self.memory else None,
+                "end": self.memory[-1] if self.memory else None,
+            },
+            "sends": sum(self.client.sent.values()),
+            "edits": self.client.edited,
+            "deletes": self.client.deleted,
+        }
+
+
+async def replay_live(client: FakeTelegramClient, replay: Replay, speed: float) -> float:
+    """Run the live worker on ``client``, feed the recording and wait until it is handled."""
+    from nb import live
+
+    live.TelegramClient = lambda *args, **kwargs: client
+    live.get_SESSION = lambda *args, **kwargs: None
+    worker = asyncio.create_task(live.start_sync())
+    sampler = asyncio.create_task(replay.sample_memory())
+    while not client.list_event_handlers() and not worker.done():
+        await asyncio.sleep(0.01)
+
+    started = time.monotonic()
+    await replay.feed(speed)
+    await replay.drain()
+    elapsed = replay.last_write - started
+
+    sampler.cancel()
+    await client.disconnect()
+    await worker
+    return elapsed
+
+
+def run_replay(path: str, speed: float, latency: float) -> Dict[str, Any]:
+    """Replay ``path`` in this process; the working directory must be empty."""
+    from nb.bench.runner import configure
+
+    header, records = read_events(path)
+    client = FakeTelegramClient(latency=latency)
+    replay = Replay(client, records)
+    configure(replay.build(), send_interval=0, delete_sync=True)
+    elapsed = asyncio.run(replay_live(client, replay, speed))
+    result = replay.report(elapsed)
+    result["anonymized"] = bool(header.get("anon"))
+    return result
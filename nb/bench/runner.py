@@ -0,0 +1,330 @@
+"""Run benchmark scenarios against ``forward_job`` and the live handlers.
+
+Each scenario runs in its own Python process inside an empty temporary
+directory, so the config file, the live queue and the mapping database
+start out empty, module level state does not leak between scenarios and
+the peak memory reported is that of the scenario alone. The plugin
+micro-benchmarks of ``nb.bench.plugin_bench`` and the replays of
+``nb.bench.replay`` run the same way.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+from nb.bench.plugin_bench import DEFAULT_THRESHOLD, compare, load_baseline, save_baseline
+from nb.const import BENCH_BASELINE_FILE
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 等待进度时，超过此秒数没有任何新的发送即视为卡住
+STALL_TIMEOUT = 15.0
+
+# 不能带进子进程的环境变量：子进程只使用临时目录中的本地配置
+_CHILD_ENV_DROP = ("MONGO_CON_STR", "NB_LOG_FILE", "NB_METRICS_PORT", "NB_CONFIG")
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def configure(forwards: list, **live: Any) -> None:
+    """Write the benchmark config: ``forwards``, the ``live`` overrides and a plugin chain."""
+    from nb import const
+    from nb.config import CONFIG, write_config
+
+    CONFIG.login.user_type = 1
+    CONFIG.forwards = forwards
+    for key, value in live.items():
+        setattr(CONFIG.live, key, value)
+    # the fake client has no limits to respect; measure nb itself
+    CONFIG.rate_limit.enabled = False
+    # a typical plugin chain: filter, replace and caption
+    CONFIG.plugins.filter.check = True
+    CONFIG.plugins.filter.text.blacklist = ["casino", "博彩"]
+    CONFIG.plugins.replace.check = True
+    CONFIG.plugins.replace.text = {"t.me/bench_src": "t.me/bench_dest", "速报": "快讯", "news": "NEWS"}
+    CONFIG.plugins.caption.check = True
+    CONFIG.plugins.caption.footer = "\n— nb bench"
+    write_config(CONFIG)
+    const.PAST_DELAY_RANGE = (0, 0)
+
+
+async def _wait_done(client, workload) -> None:
+    from nb.bench.scenarios import progress
+
+    last, last_change = progress(client), time.monotonic()
+    while True:
+        done = progress(client)
+        if done >= workload.expected:
+            return
+        if done != last:
+            last, last_change = done, time.monotonic()
+        elif time.monotonic() - last_change > STALL_TIMEOUT + client.flood_seconds:
+            logging.warning("⚠️ 基准测试停滞: %s/%s", done, workload.expected)
+            return
+        await asyncio.sleep(0.01)
+
+
+async def _run_past(client) -> None:
+    from nb import past
+
+    past.TelegramClient = lambda *args, **kwargs: client
+    past.get_SESSION = lambda *args, **kwargs: None
+    await past.forward_job()
+
+
+async def _run_live(client, workload) -> None:
+    from nb import live
+
+    live.TelegramClient = lambda *args, **kwargs: client
+    live.get_SESSION = lambda *args, **kwargs: None
+    worker = asyncio.create_task(live.start_sync())
+    while not client.is_connected() and not worker.done():
+        await asyncio.sleep(0.01)
+    # start_sync registers its handlers right before run_until_disconnected
+    while not client.list_event_handlers() and not worker.done():
+        await asyncio.sleep(0.01)
+    await workload.feed()
+    await _wait_done(client, workload)
+    await client.disconnect()
+    await worker
+
+
+def run_scenario(name: str, messages: int, latency: float, flood_every: int) -> Dict[str, Any]:
+    """Run one scenario in this process; the working directory must be empty."""
+    from nb.bench.fake_client import FakeTelegramClient
+    from nb.bench.scenarios import SCENARIOS, progress
+
+    client = FakeTelegramClient(latency=latency, flood_every=flood_every)
+    workload = SCENARIOS[name](client, messages)
+    configure(workload.forwards, send_interval=0, edit_debounce=0, delete_sync=True)
+
+    rss_before = _peak_rss_mb()
+    cpu_start = time.process_time()
+    started = time.perf_counter()
+    if name.startswith("past"):
+        asyncio.run(_run_past(client))
+    else:
+        asyncio.run(_run_live(client, workload))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_start
+    rss_after = _peak_rss_mb()
+
+    return {
+        "scenario": name,
+        "messages": workload.messages,
+        "done": progress(client),
+        "expected": workload.expected,
+        "seconds": round(elapsed, 3),
+        "msgs_per_s": round(workload.messages / elapsed, 1) if elapsed else None,
+        "cpu_seconds": round(cpu, 3),
+        "cpu_percent": round(100 * cpu / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": rss_after,
+        "rss_growth_mb": round(rss_after - rss_before, 1) if rss_after is not None else None,
+        "api_calls": sum(client.calls.values()),
+        "flood_waits": client.floods,
+    }
+
+
+def _run_child(*args: Any) -> Any:
+    """Run ``main(*args)`` of this module in a fresh process in an empty temp dir."""
+    env = {k: v for k, v in os.environ.items() if k not in _CHILD_ENV_DROP}
+    # the child starts in an empty directory; keep this copy of nb importable
+    package_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_root, env.get("PYTHONPATH")]))
+    with tempfile.TemporaryDirectory(prefix="nb-bench-") as workdir:
+        proc = subprocess.run(
+            [sys.executable, "-m", "nb.bench.runner", json.dumps(args)],
+            cwd=workdir,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+    if proc.returncode != 0 or not proc.stdout.strip():
+        raise RuntimeError((proc.stderr.strip().splitlines() or ["failed"])[-1])
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_benchmarks(
+    names: List[str],
+    messages: int = 1000,
+    latency: float = 0.0,
+    flood_every: int = 0,
+    output: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Run the scenarios one after another, print a table and return the results."""
+    from rich.console import Console
+    from rich.table import Table
+
+    from nb.bench.scenarios import SCENARIOS
+
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise ValueError(f"Unknown scenarios {unknown}, choose from {list(SCENARIOS)}")
+
+    con = Console()
+    results = []
+    for name in names or list(SCENARIOS):
+        with con.status(f"running {name} ..."):
+            try:
+                results.append(_run_child("scenario", name, messages, latency, flood_every))
+            except RuntimeError as err:
+                results.append({"scenario": name, "error": str(err)})
+
+    table = Table(title=f"nb bench ({messages} messages, latency {latency}s)")
+    for column in ("scenario", "msgs/s", "seconds", "done", "cpu %", "peak MB", "+MB", "api calls", "flood waits"):
+        table.add_column(column, justify="left" if column == "scenario" else "right")
+    for res in results:
+        if "error" in res:
+            table.add_row(res["scenario"], "[red]failed[/red]", *[""] * 7)
+            continue
+        done = f"{res['done']}/{res['expected']}"
+        if res["done"] < res["expected"]:
+            done = f"[yellow]{done}[/yellow]"
+        table.add_row(
+            res["scenario"],
+            str(res["msgs_per_s"]),
+            str(res["seconds"]),
+            done,
+            str(res["cpu_percent"]),
+            str(res["peak_rss_mb"]),
+            str(res["rss_growth_mb"]),
+            str(res["api_calls"]),
+            str(res["flood_waits"]),
+        )
+    con.print(table)
+    for res in results:
+        if "error" in res:
+            con.print(f"{res['scenario']}: {res['error']}", style="red")
+
+    if output:
+        with open(output, "w", encoding="utf8") as file:
+            json.dump(results, file, indent=2)
+    return results
+
+
+def _pct(change: Optional[float]) -> str:
+    if change is None:
+        return "-"
+    text = f"{change:+.0%}"
+    return f"[red]{text}[/red]" if change > 0 else text
+
+
+def run_plugin_benchmarks(
+    only: List[str],
+    baseline: str = BENCH_BASELINE_FILE,
+    save: bool = False,
+    check: bool = False,
+    threshold: float = DEFAULT_THRESHOLD,
+) -> bool:
+    """Run the plugin micro-benchmarks; returns False when ``check`` found regressions."""
+    from rich.console import Console
+    from rich.table import Table
+
+    con = Console()
+    with con.status("running plugin benchmarks ..."):
+        current = _run_child("plugins", only)
+
+    previous: Dict[str, Dict[str, float]] = {}
+    if check:
+        try:
+            previous = load_baseline(baseline)
+        except (OSError, ValueError, KeyError) as err:
+            con.print(f"Cannot read baseline {baseline}: {err}", style="bold red")
+            return False
+    rows = compare(previous, current, threshold)
+
+    table = Table(title="nb plugin bench (per message)")
+    for column in ("case", "µs p50", "µs p90", "alloc KB"):
+        table.add_column(column, justify="left" if column == "case" else "right")
+    if check:
+        for column in ("base µs", "Δ time", "base KB", "Δ alloc"):
+            table.add_column(column, justify="right")
+    for row in rows:
+        cur, base = row["current"], row["baseline"]
+        cells = [row["case"], str(cur["per_msg_us"]), str(cur["p90_us"]), str(cur["alloc_kb"])]
+        if check:
+            if base is None:
+                cells += ["new", "", "", ""]
+            else:
+                cells += [
+                    str(base["per_msg_us"]),
+                    _pct(row["time_change"]),
+                    str(base["alloc_kb"]),
+                    _pct(row["alloc_change"]),
+                ]
+        table.add_row(*cells, style="bold" if row["regressed"] else None)
+    con.print(table)
+
+    if save:
+        save_baseline(current, baseline)
+        con.print(f"Baseline saved to {baseline}", style="green")
+    regressed = [row["case"] for row in rows if row["regressed"]]
+    if regressed:
+        con.print(f"Regressions beyond {threshold:.0%}: {', '.join(regressed)}", style="bold red")
+    return not regressed
+
+
+def run_replay_benchmark(
+    path: str, speed: float = 1.0, latency: float = 0.0, output: Optional[str] = None
+) -> Dict[str, Any]:
+    """Replay a recording of ``nb live`` in a child process and print the latencies."""
+    from rich.console import Console
+    from rich.table import Table
+
+    con = Console()
+    with con.status(f"replaying {path} ..."):
+        result = _run_child("replay", os.path.abspath(path), speed, latency)
+
+    events = ", ".join(f"{k} {v}" for k, v in result["events"].items())
+    rss = result["rss_mb"]
+    table = Table(
+        title=f"nb replay {os.path.basename(path)} (speed {speed or 'max'}, latency {latency}s)",
+        caption=(
+            f"{events} in {result['seconds']}s (recorded {result['recorded_seconds']}s); "
+            f"RSS start {rss['start']} MB, peak {rss['peak']} MB, end {rss['end']} MB"
+        ),
+    )
+    for column in ("event", "delivered", "p50 ms", "p90 ms", "p99 ms", "max ms"):
+        table.add_column(column, justify="left" if column == "event" else "right")
+    for kind, stats in result["latency_ms"].items():
+        table.add_row(
+            kind, str(stats["count"]), *(str(stats.get(q, "-")) for q in ("p50", "p90", "p99", "max"))
+        )
+    con.print(table)
+
+    if output:
+        with open(output, "w", encoding="utf8") as file:
+            json.dump(result, file, indent=2)
+    return result
+
+
+def main(kind: str, *args: Any) -> Any:
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+    if kind == "plugins":
+        from nb.bench.plugin_bench import run_plugin_cases
+
+        return run_plugin_cases(*args)
+    if kind == "replay":
+        from nb.bench.replay import run_replay
+
+        return run_replay(*args)
+    return run_scenario(*args)
+
+
+if __name__ == "__main__":
+    print(json.dumps(main(*json.loads(sys.argv[1]))))
@@ -0,0 +1,207 @@
+"""Benchmark workloads for ``nb bench``.
+
+Every scenario builds its chats on a ``FakeTelegramClient``, returns the
+forwards to configure and says how much work a complete run does. Past
+scenarios fill the source history up front; live scenarios publish their
+messages through ``feed`` once the live handlers are registered.
+"""
+
+import asyncio
+import random
+from typing import TYPE_CHECKING, Awaitable, Callable, Dict, List, Optional
+
+from nb.bench.fake_client import FakeChat, FakeMedia, FakeTelegramClient
+
+if TYPE_CHECKING:
+    from nb.config import Forward
+
+DESTS = 2
+ALBUM_SIZE = 5
+COMMENTS_PER_POST = 9
+# 发布消息时每隔多少条让出一次事件循环，模拟成批到达的更新
+FEED_BURST = 50
+
+_WORDS = (
+    "频道 更新 今日 新闻 速报 合集 高清 资源 分享 推荐 通知 活动 福利 精选 "
+    "update daily news release weekly digest photo video link download"
+).split()
+
+
+def _text(rnd: random.Random, i: int) -> str:
+    """Short and long posts with links, hashtags and markdown."""
+    words = " ".join(rnd.choice(_WORDS) for _ in range(rnd.choice((5, 12, 40, 120))))
+    return f"**#{rnd.choice(_WORDS)}** {words} https://t.me/bench_src/{i} __{i}__"
+
+
+class Workload:
+    """What a scenario needs from the runner.
+
+    ``expected`` is the number of sends, edits and deletes a complete run
+    performs on the destinations; ``feed`` publishes the live messages.
+    """
+
+    def __init__(
+        self,
+        forwards: List["Forward"],
+        messages: int,
+        expected: int,
+        feed: Optional[Callable[[], Awaitable[None]]] = None,
+    ) -> None:
+        self.forwards = forwards
+        self.messages = messages
+        self.expected = expected
+        self.feed = feed
+
+
+def progress(client: FakeTelegramClient) -> int:
+    return sum(client.sent.values()) + client.edited + client.deleted
+
+
+def _channels(client: FakeTelegramClient, comments: bool = False):
+    src = client.add_chat("bench source", "bench_src", discussion=comments)
+    dests = [client.add_chat(f"bench dest {i}", discussion=comments) for i in range(DESTS)]
+    return src, dests
+
+
+def _forward(src: FakeChat, dests: List[FakeChat], comments: bool = False) -> "Forward":
+    # nb.config reads the config on import, only do that inside the scenario's process
+    from nb.config import Forward
+
+    forward = Forward(
+        con_name="bench",
+        source=src.id,
+        dest=[d.id for d in dests],
+        bot_media_enabled=False,
+        auto_comment_trigger_enabled=False,
+    )
+    forward.comments.enabled = comments
+    forward.comments.include_text_comments = True
+    return forward
+
+
+def _publish_history(client: FakeTelegramClient, src: FakeChat, n: int, albums: bool, fire: bool) -> None:
+    rnd = random.Random(n)
+    i = 0
+    while i < n:
+        if albums:
+            size = min(ALBUM_SIZE, n - i)
+            client.publish_album(src, [_text(rnd, i)] + [""] * (size - 1), fire=fire)
+            i += size
+        else:
+            media = FakeMedia("photo") if i % 4 == 0 else None
+            client.publish(src, _text(rnd, i), media=media, fire=fire)
+            i += 1
+
+
+async def _feed(client: FakeTelegramClient, src: FakeChat, n: int, albums: bool = False) -> None:
+    rnd = random.Random(n)
+    for i in range(n):
+        if albums:
+            if i % ALBUM_SIZE == 0:
+                captions = [_text(rnd, i)] + [""] * (min(ALBUM_SIZE, n - i) - 1)
+                client.publish_album(src, captions)
+        else:
+            media = FakeMedia("photo") if i % 4 == 0 else None
+            client.publish(src, _text(rnd, i), media=media)
+        if i % FEED_BURST == FEED_BURST - 1:
+            await asyncio.sleep(0)
+
+
+async def _wait_for(client: FakeTelegramClient, count: int, timeout: float = 60.0) -> None:
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while progress(client) < count and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+# ---------------------------------------------------------------- past
+
+
+def past_text(client: FakeTelegramClient, n: int) -> Workload:
+    src, dests = _channels(client)
+    _publish_history(client, src, n, albums=False, fire=False)
+    return Workload([_forward(src, dests)], n, n * DESTS)
+
+
+def past_album(client: FakeTelegramClient, n: int) -> Workload:
+    src, dests = _channels(client)
+    _publish_history(client, src, n, albums=True, fire=False)
+    return Workload([_forward(src, dests)], n, n * DESTS)
+
+
+def past_comments(client: FakeTelegramClient, n: int) -> Workload:
+    src, dests = _channels(client, comments=True)
+    rnd = random.Random(n)
+    posts = max(n // (COMMENTS_PER_POST + 1), 1)
+    for i in range(posts):
+        post = client.publish(src, _text(rnd, i), fire=False)
+        for j in range(COMMENTS_PER_POST):
+            client.comment(src, post.id, _text(rnd, j), fire=False)
+    total = posts * (COMMENTS_PER_POST + 1)
+    return Workload([_forward(src, dests, comments=True)], total, total * DESTS)
+
+
+# ---------------------------------------------------------------- live
+
+
+def live_text(client: FakeTelegramClient, n: int) -> Workload:
+    src, dests = _channels(client)
+    return Workload([_forward(src, dests)], n, n * DESTS, lambda: _feed(client, src, n))
+
+
+def live_album(client: FakeTelegramClient, n: int) -> Workload:
+    src, dests = _channels(client)
+    return Workload([_forward(src, dests)], n, n * DESTS, lambda: _feed(client, src, n, albums=True))
+
+
+def live_comments(client: FakeTelegramClient, n: int) -> Workload:
+    src, dests = _channels(client, comments=True)
+    posts = max(n // (COMMENTS_PER_POST + 1), 1)
+    total = posts * (COMMENTS_PER_POST + 1)
+
+    async def feed() -> None:
+        rnd = random.Random(n)
+        published = [client.publish(src, _text(rnd, i)) for i in range(posts)]
+        # 评论只有在帖子转发完成后才能找到目标讨论组
+        await _wait_for(client, posts * DESTS)
+        for j in range(COMMENTS_PER_POST):
+            for post in published:
+                client.comment(src, post.id, _text(rnd, j))
+            await asyncio.sleep(0)
+
+    return Workload([_forward(src, dests, comments=True)], total, total * DESTS, feed)
+
+
+def live_edit_delete(client: FakeTelegramClient, n: int) -> Workload:
+    src, dests = _channels(client)
+    edits, deletes = n // 2, n // 4
+
+    async def feed() -> None:
+        await _feed(client, src, n)
+        await _wait_for(client, n * DESTS)
+        ids = sorted(src.messages)
+        for msg_id in ids[:edits]:
+            client.edit(src, msg_id, f"{src.messages[msg_id].message} (edited)")
+        await _wait_for(client, (n + edits) * DESTS)
+        for start in range(0, deletes, 100):
+            client.delete(src, ids[start:min(start + 100, deletes)])
+
+    return Workload([_forward(src, dests)], n, (n + edits + deletes) * DESTS, feed)
+
+
+def live_flood(client: FakeTelegramClient, n: int) -> Workload:
+    """live_text with a FloodWait every 200 writes."""
+    client.flood_every = client.flood_every or 200
+    return live_text(client, n)
+
+
+SCENARIOS: Dict[str, Callable[[FakeTelegramClient, int], Workload]] = {
+    "past_text": past_text,
+    "past_album": past_album,
+    "past_comments": past_comments,
+    "live_text": live_text,
+    "live_album": live_album,
+    "live_comments": live_comments,
+    "live_edit_delete": live_edit_delete,
+    "live_flood": live_flood,
+}
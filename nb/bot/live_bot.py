@@ -1,5 +1,6 @@
 """A bot to controll settings for nb live mode."""
 
+import asyncio
 import logging
 
 import yaml
@@ -47,21 +48,23 @@ async def forward_command_handler(event):
 
         # ✅ Pydantic v2 实例化
         forward = config.Forward(**parsed_args)
-        
+
+        # 只解析这一条转发；解析失败时配置与路由表都不变（nb.live 导入本模块，故在此导入）
+        from nb.live import add_forward_route
+
+        await add_forward_route(event.client, forward)
         try:
             remove_source(forward.source, config.CONFIG.forwards)
-        except:
+        except ValueError:
             pass
         CONFIG.forwards.append(forward)
-        config.from_to = await config.load_from_to(event.client, config.CONFIG.forwards)
-        config.forward_map = await config.load_forward_map(event.client, config.CONFIG.forwards)
 
+        await asyncio.to_thread(write_config, config.CONFIG)
         await event.respond("Success")
-        write_config(config.CONFIG)
     
     # ✅ 修复：同时捕获 ValueError 和 ValidationError
-    except (ValueError, ValidationError) as err:
-        logging.error(f"Command Error: {err}")
+    except (ValueError, ValidationError, config.ConfigWriteError) as err:
+        logging.error("Command Error: %s", err)
         # 转换为字符串发送给用户
         await event.respond(f"Error:\n`{str(err)}`")
 
@@ -91,15 +94,19 @@ async def remove_command_handler(event):
             raise ValueError("Invalid YAML.")
             
         source_to_remove = parsed_args.get("source")
+        # 来源不在配置中时不能动路由：拼错的来源也可能解析到正在转发的聊天
+        if not any(f.source == source_to_remove for f in config.CONFIG.forwards):
+            raise ValueError("The source does not exist")
+        from nb.live import remove_forward_route
+
+        await remove_forward_route(event.client, source_to_remove)
         CONFIG.forwards = remove_source(source_to_remove, config.CONFIG.forwards)
-        config.from_to = await config.load_from_to(event.client, config.CONFIG.forwards)
-        config.forward_map = await config.load_forward_map(event.client, config.CONFIG.forwards)
 
+        await asyncio.to_thread(write_config, config.CONFIG)
         await event.respond("Success")
-        write_config(config.CONFIG)
     
     # ✅ 修复：异常捕获
-    except (ValueError, ValidationError) as err:
+    except (ValueError, ValidationError, config.ConfigWriteError) as err:
         logging.error(err)
         await event.respond(str(err))
 
@@ -128,8 +135,8 @@ async def style_command_handler(event):
         if args not in _valid:
             raise ValueError(f"Invalid style. Choose from {_valid}")
         CONFIG.plugins.fmt.style = args
-        await event.respond("Success")
         write_config(CONFIG)
+        await event.respond("Success")
     except Exception as err:
         logging.error(err)
         await event.respond(str(err))
@@ -150,7 +157,7 @@ async def help_command_handler(event):
 
 def get_events():
     _ = get_command_prefix()
-    logging.info(f"Command prefix is . for userbot and / for bot")
+    logging.info("Command prefix is . for userbot and / for bot")
     command_events = {
         "start": (start_command_handler, events.NewMessage(pattern=f"{_}start")),
         "forward": (forward_command_handler, events.NewMessage(pattern=f"{_}forward")),
@@ -13,7 +13,7 @@ def admin_protect(org_func):
 
     async def wrapper_func(event):
         """Wrap the original function."""
-        logging.info(f"Applying admin protection! Admins are {config.ADMINS}")
+        logging.info("Applying admin protection! Admins are %s", config.ADMINS)
         if event.sender_id not in config.ADMINS:
             await event.respond("You are not authorized.")
             raise events.StopPropagation
@@ -33,7 +33,7 @@ def get_args(text: str) -> str:
 
     prefix, args = splitted
     args = args.strip()
-    logging.info(f"Got command {prefix} with args {args}")
+    logging.info("Got command %s with args %s", prefix, args)
     return args
 
 
@@ -1,19 +1,33 @@
 """This module implements the command line interface for nb."""
 
 import asyncio
+import importlib
+import json
 import logging
 import os
 import sys
+import threading
+import time
 from enum import Enum
-from typing import Optional
+from typing import List, Optional, Tuple
 
 import typer
 from dotenv import load_dotenv
 from rich import console, traceback
 from rich.logging import RichHandler
-from verlat import latest_release
+from rich.table import Table
 
 from nb import __version__
+from nb.const import (
+    BENCH_BASELINE_FILE,
+    LOG_FILE_ENV_VAR,
+    RECORD_ANONYMIZE_ENV_VAR,
+    RECORD_ENV_VAR,
+    SHARD_ENV_VAR,
+    VERSION_CHECK_FILE,
+    VERSION_CHECK_TTL,
+    WORKERS_ENV_VAR,
+)
 
 load_dotenv(".env")
 
@@ -30,10 +44,15 @@ def topper():
 
 
 class Mode(str, Enum):
-    """nb works in two modes."""
+    """nb works in two modes; bench runs both against a fake client."""
 
     PAST = "past"
     LIVE = "live"
+    BENCH = "bench"
+
+
+def _log_uncaught(exc_type, exc, tb):
+    logging.critical("Uncaught exception", exc_info=(exc_type, exc, tb))
 
 
 def verbosity_callback(value: bool):
@@ -43,17 +62,25 @@ def verbosity_callback(value: bool):
         level = logging.INFO
     else:
         level = logging.WARNING
-    logging.basicConfig(
-        level=level,
-        format="%(asctime)s %(levelname)s %(message)s",
-        handlers=[
-            RichHandler(
-                rich_tracebacks=True,
-                markup=True,
-            )
-        ],
-        force=True,
-    )
+    log_file = os.getenv(LOG_FILE_ENV_VAR)
+    if log_file:
+        # started from the web UI: JSON lines written by a background thread
+        from nb.log_files import setup_worker_logging
+
+        setup_worker_logging(log_file, level)
+        sys.excepthook = _log_uncaught
+    else:
+        logging.basicConfig(
+            level=level,
+            format="%(asctime)s %(levelname)s %(message)s",
+            handlers=[
+                RichHandler(
+                    rich_tracebacks=True,
+                    markup=True,
+                )
+            ],
+            force=True,
+        )
     topper()
     logging.info("Verbosity turned on! This is suitable for debugging")
 
@@ -66,19 +93,89 @@ def version_callback(value: bool):
         raise typer.Exit()
 
 
-def version_check():
+def _print_version(latver: str) -> None:
+    if __version__ != latver:
+        con.print(
+            f"nb has a newer release {latver} available!\n"
+            "Visit http://bit.ly/update-nb",
+            style="bold yellow",
+        )
+    else:
+        con.print(f"Running latest nb version {__version__}", style="bold green")
+
+
+def _cached_latest() -> Optional[str]:
+    try:
+        with open(VERSION_CHECK_FILE, encoding="utf8") as file:
+            data = json.load(file)
+        if time.time() - data["checked_at"] < VERSION_CHECK_TTL:
+            return data["version"]
+    except Exception:
+        pass
+    return None
+
+
+def _fetch_latest() -> None:
     try:
+        from verlat import latest_release
+
         latver = latest_release("nb").version
-        if __version__ != latver:
-            con.print(
-                f"nb has a newer release {latver} available!\n"
-                "Visit http://bit.ly/update-nb",
-                style="bold yellow",
-            )
-        else:
-            con.print(f"Running latest nb version {__version__}", style="bold green")
+        with open(VERSION_CHECK_FILE, "w", encoding="utf8") as file:
+            json.dump({"version": latver, "checked_at": time.time()}, file)
     except Exception:
-        con.print(f"Running nb version {__version__}", style="bold green")
+        return
+    if __version__ != latver:
+        _print_version(latver)
+
+
+def version_check():
+    """Report the latest release without blocking startup.
+
+    The result is cached for a day; on a cache miss the lookup runs in a
+    background thread and only speaks up if a newer release exists.
+    """
+    latver = _cached_latest()
+    if latver is not None:
+        _print_version(latver)
+        return
+    con.print(f"Running nb version {__version__}", style="bold green")
+    threading.Thread(target=_fetch_latest, daemon=True).start()
+
+
+STARTUP_STAGES = ["nb.config", "nb.plugins", "nb.bot", "nb.live", "nb.past"]
+
+
+def _time_import(name: str) -> Tuple[float, List[str]]:
+    before = {mod.split(".")[0] for mod in sys.modules}
+    start = time.perf_counter()
+    importlib.import_module(name)
+    elapsed = time.perf_counter() - start
+    after = {mod.split(".")[0] for mod in sys.modules}
+    # only third party packages are interesting here
+    new = after - before - set(sys.stdlib_module_names) - {"nb"}
+    return elapsed, sorted(pkg for pkg in new if not pkg.startswith("_"))
+
+
+def startup_report_callback(value: bool):
+    """Import the worker stage by stage, print how long each took and exit."""
+    if not value:
+        return
+    table = Table(title="nb startup")
+    table.add_column("stage")
+    table.add_column("seconds", justify="right")
+    table.add_column("new packages")
+    total = 0.0
+    for name in STARTUP_STAGES:
+        try:
+            elapsed, packages = _time_import(name)
+        except Exception as err:
+            table.add_row(name, "-", f"[red]{err}[/red]")
+            continue
+        total += elapsed
+        table.add_row(name, f"{elapsed:.3f}", ", ".join(packages))
+    table.add_row("[bold]total[/bold]", f"[bold]{total:.3f}[/bold]", "")
+    con.print(table)
+    raise typer.Exit()
 
 
 @app.command()
@@ -101,6 +198,55 @@ def main(
         callback=version_callback,
         help="Show version and exit.",
     ),
+    startup_report: Optional[bool] = typer.Option(
+        None,
+        "--startup-report",
+        callback=startup_report_callback,
+        is_eager=True,
+        help="Show how long each part of the worker takes to import and exit.",
+    ),
+    scenario: Optional[List[str]] = typer.Option(
+        None,
+        "--scenario",
+        "-s",
+        help="bench: scenario (or plugin case prefix) to run, can be repeated. Runs all by default.",
+    ),
+    messages: int = typer.Option(1000, "--messages", "-n", help="bench: messages per scenario."),
+    latency: float = typer.Option(0.0, "--latency", help="bench: seconds every fake API call takes."),
+    flood_every: int = typer.Option(
+        0, "--flood-every", help="bench: raise a FloodWait every n writes, 0 to disable."
+    ),
+    output: Optional[str] = typer.Option(None, "--output", "-o", help="bench: save the results as JSON."),
+    plugins: bool = typer.Option(
+        False, "--plugins", help="bench: run the plugin micro-benchmarks instead."
+    ),
+    baseline: str = typer.Option(
+        BENCH_BASELINE_FILE, "--baseline", help="bench --plugins: baseline JSON file."
+    ),
+    save_baseline: bool = typer.Option(
+        False, "--save-baseline", help="bench --plugins: store the results as the baseline."
+    ),
+    compare: bool = typer.Option(
+        False, "--compare", help="bench --plugins: compare with the baseline, exit 1 on regressions."
+    ),
+    threshold: float = typer.Option(
+        0.2, "--threshold", help="bench --plugins --compare: allowed slowdown, 0.2 = 20%."
+    ),
+    replay: Optional[str] = typer.Option(
+        None, "--replay", help="bench: replay an event recording of nb live instead."
+    ),
+    speed: float = typer.Option(
+        1.0, "--speed", help="bench --replay: replay speed, 10 = ten times faster, 0 = as fast as possible."
+    ),
+    record: Optional[str] = typer.Option(
+        None, "--record", envvar=RECORD_ENV_VAR, help="live: record incoming events to this file (.gz to compress)."
+    ),
+    anonymize: bool = typer.Option(
+        False, "--anonymize", help="live --record: replace ids and words of the text by pseudonyms."
+    ),
+    workers: int = typer.Option(
+        1, "--workers", "-w", envvar=WORKERS_ENV_VAR, help="live: split the forwards over this many processes."
+    ),
 ):
     """The ultimate tool to automate custom telegram message forwarding.
 
@@ -111,17 +257,53 @@ def main(
     To run web interface run `nb-web` command.
     """
     if FAKE:
-        logging.critical(f"You are running fake with {mode} mode")
+        logging.critical("You are running fake with %s mode", mode)
         sys.exit(1)
 
-    if mode == Mode.PAST:
+    if mode == Mode.BENCH and replay:
+        from nb.bench.runner import run_replay_benchmark
+
+        try:
+            run_replay_benchmark(replay, speed, latency, output)
+        except RuntimeError as err:
+            con.print(str(err), style="bold red")
+            raise typer.Exit(1)
+    elif mode == Mode.BENCH and plugins:
+        from nb.bench.runner import run_plugin_benchmarks
+
+        try:
+            ok = run_plugin_benchmarks(scenario or [], baseline, save_baseline, compare, threshold)
+        except RuntimeError as err:
+            con.print(str(err), style="bold red")
+            raise typer.Exit(1)
+        if not ok:
+            raise typer.Exit(1)
+    elif mode == Mode.BENCH:
+        from nb.bench.runner import run_benchmarks
+
+        try:
+            run_benchmarks(scenario or [], messages, latency, flood_every, output)
+        except ValueError as err:
+            con.print(str(err), style="bold red")
+            raise typer.Exit(1)
+    elif mode == Mode.PAST:
         from nb.past import forward_job
 
         asyncio.run(forward_job())
     else:
-        from nb.live import start_sync
+        if record:
+            os.environ[RECORD_ENV_VAR] = record
+            if anonymize:
+                os.environ[RECORD_ANONYMIZE_ENV_VAR] = "1"
+        if workers > 1 and not os.getenv(SHARD_ENV_VAR):
+            from nb.supervisor import run_supervisor
+
+            loud = logging.getLogger().isEnabledFor(logging.INFO)
+            run_supervisor(workers, ["--loud"] if loud else [])
+        else:
+            from nb.live import start_sync
 
-        asyncio.run(start_sync())
+            asyncio.run(start_sync())
 
 
 # ★ 关键：允许 python -m nb.cli live --loud 直接运行
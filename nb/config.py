@@ -1,21 +1,22 @@
 """Load all user defined config and env vars."""
 
+import copy
 import logging
 import os
 import sys
-from typing import Any, Dict, List, Optional, Union
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 from dotenv import load_dotenv
 try:
-    from pydantic import BaseModel, Field, field_validator
+    from pydantic import BaseModel, Field, PrivateAttr, field_validator
 except Exception:
-    from pydantic import BaseModel, Field, validator as field_validator
-from pymongo import MongoClient
+    from pydantic import BaseModel, Field, PrivateAttr, validator as field_validator
 from telethon import TelegramClient
 from telethon.sessions import StringSession
 
 from nb import storage as stg
-from nb.const import CONFIG_FILE_NAME
+from nb.const import CONFIG_CACHE_TTL, CONFIG_FILE_NAME
 from nb.plugin_models import PluginConfig
 
 pwd = os.getcwd()
@@ -73,6 +74,22 @@ class LiveSettings(BaseModel):
     sequential_updates: bool = False
     delete_sync: bool = False
     delete_on_edit: Optional[str] = ".deleteMe"
+    # 同一目标两次发送之间的最小间隔（秒），各目标互不影响
+    send_interval: float = 3.0
+    # 同一条消息的连续编辑在此窗口（秒）内合并，只同步最终状态；0 表示不合并
+    edit_debounce: float = 5.0
+
+
+class RateLimitSettings(BaseModel):
+    """Send rate limits shared by all nb processes of the account on this host."""
+
+    enabled: bool = True
+    # 整个账号每秒最多发送条数及突发上限；0 表示不限制
+    per_second: float = 20.0
+    burst: float = 20.0
+    # 同一目标每秒最多发送条数及突发上限；0 表示不限制
+    dest_per_second: float = 1.0
+    dest_burst: float = 5.0
 
 
 class PastSettings(BaseModel):
@@ -139,11 +156,20 @@ class Config(BaseModel):
     mode: int = 0
     live: LiveSettings = Field(default_factory=LiveSettings)
     past: PastSettings = Field(default_factory=PastSettings)
+    rate_limit: RateLimitSettings = Field(default_factory=RateLimitSettings)
 
     plugins: PluginConfig = Field(default_factory=PluginConfig)
     bot_messages: BotMessages = Field(default_factory=BotMessages)
     bot_media: BotMediaSettings = Field(default_factory=BotMediaSettings)
 
+    # mongo only: the stored config this copy was read from or last saved as.
+    # A save writes only what this copy changed since then (see update_db).
+    _db_base: Optional[Dict[str, Any]] = PrivateAttr(default=None)
+
+
+class ConfigWriteError(RuntimeError):
+    """The config could not be saved."""
+
 
 def write_config_to_file(config: Config):
     with open(CONFIG_FILE_NAME, "w", encoding="utf8") as file:
@@ -157,11 +183,13 @@ def write_config_to_file(config: Config):
 def detect_config_type() -> int:
     if MONGO_CON_STR:
         logging.info("Using mongo db for storing config!")
+        from pymongo import MongoClient
+
         client = MongoClient(MONGO_CON_STR)
         stg.mycol = setup_mongo(client)
         return 2
     if CONFIG_FILE_NAME in os.listdir():
-        logging.info(f"{CONFIG_FILE_NAME} detected!")
+        logging.info("%s detected!", CONFIG_FILE_NAME)
         return 1
     else:
         logging.info(
@@ -169,37 +197,143 @@ def detect_config_type() -> int:
         )
         cfg = Config()
         write_config_to_file(cfg)
-        logging.info(f"{CONFIG_FILE_NAME} created!")
+        logging.info("%s created!", CONFIG_FILE_NAME)
         return 1
 
 
-def read_config(count=1) -> Config:
-    """Load the configuration defined by user."""
+def load_config() -> Config:
+    """Read the config from its backend, raising on any failure."""
+    if stg.CONFIG_TYPE == 1:
+        with open(CONFIG_FILE_NAME, encoding="utf8") as file:
+            validate_json = getattr(Config, "model_validate_json", None)
+            if callable(validate_json):
+                return validate_json(file.read())
+            else:
+                return Config.parse_raw(file.read())
+    elif stg.CONFIG_TYPE == 2:
+        return read_db()
+    else:
+        return Config()
+
+
+def _read_config(count=1) -> Config:
     if count > 3:
         logging.warning("Failed to read config, returning default config")
         return Config()
     if count != 1:
-        logging.info(f"Trying to read config time:{count}")
+        logging.info("Trying to read config time:%s", count)
     try:
-        if stg.CONFIG_TYPE == 1:
-            with open(CONFIG_FILE_NAME, encoding="utf8") as file:
-                validate_json = getattr(Config, "model_validate_json", None)
-                if callable(validate_json):
-                    return validate_json(file.read())
-                else:
-                    return Config.parse_raw(file.read())
-        elif stg.CONFIG_TYPE == 2:
-            return read_db()
-        else:
-            return Config()
+        token = config_version()
+        cfg = load_config()
     except Exception as err:
         logging.warning(err)
         stg.CONFIG_TYPE = detect_config_type()
-        return read_config(count=count + 1)
+        return _read_config(count=count + 1)
+    _remember_config(token, cfg)
+    return cfg
+
+
+# (version token, validated config) of the last successful read
+_config_cache: Optional[Tuple[Any, Config]] = None
+_config_checked_at = 0.0
+
+
+def _remember_config(token: Any, cfg: Config) -> None:
+    global _config_cache, _config_checked_at
+    _config_cache = (token, cfg) if token is not None else None
+    _config_checked_at = time.monotonic()
+
+
+def _copy_config(cfg: Config) -> Config:
+    model_copy = getattr(cfg, "model_copy", None)
+    return model_copy(deep=True) if callable(model_copy) else cfg.copy(deep=True)
+
+
+def read_config(count=1) -> Config:
+    """Load the configuration defined by user.
+
+    The validated config is cached per process and reused while its
+    version token (file mtime/size, or the mongo ``version`` field) is
+    unchanged. Mongo is asked for the token at most once every
+    ``CONFIG_CACHE_TTL`` seconds. Every caller gets its own copy.
+    """
+    global _config_checked_at
+    if _config_cache is not None:
+        token, cached = _config_cache
+        now = time.monotonic()
+        if stg.CONFIG_TYPE == 2 and now - _config_checked_at < CONFIG_CACHE_TTL:
+            return _copy_config(cached)
+        _config_checked_at = now
+        try:
+            fresh = config_version() == token
+        except Exception:
+            fresh = False
+        if fresh:
+            return _copy_config(cached)
+    cfg = _read_config(count)
+    return _copy_config(cfg) if _config_cache is not None else cfg
+
+
+def config_version() -> Any:
+    """Return a cheap token that changes whenever the stored config changes."""
+    if stg.CONFIG_TYPE == 2:
+        doc = stg.mycol.find_one({"_id": 0}, {"version": 1})
+        return doc.get("version", 0) if doc else None
+    try:
+        stat = os.stat(CONFIG_FILE_NAME)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _model_fields(model) -> List[str]:
+    fields = getattr(type(model), "model_fields", None)
+    if fields is None:
+        fields = model.__fields__
+    return list(fields)
+
+
+# fields only nb past reads; past writes offset after every message
+PAST_ONLY_FIELDS = ("offset", "end")
+
+
+def same_route(a: Forward, b: Forward) -> bool:
+    """Whether two forwards behave the same in live mode (past-only fields ignored)."""
+    return all(getattr(a, name) == getattr(b, name) for name in _model_fields(a) if name not in PAST_ONLY_FIELDS)
+
+
+def apply_config(new: Config) -> Tuple[Set[str], Set[str]]:
+    """Copy a freshly read config into CONFIG in place.
+
+    Modules hold ``CONFIG`` (and ``CONFIG.plugins``) by reference, so the
+    objects are updated field by field instead of being replaced.
+    Returns the names of changed top level fields and changed plugin ids.
+    """
+    changed = set()
+    for name in _model_fields(CONFIG):
+        if name in ("pid", "plugins"):
+            continue
+        if getattr(CONFIG, name) != getattr(new, name):
+            setattr(CONFIG, name, getattr(new, name))
+            changed.add(name)
+
+    plugins_changed = set()
+    for pid in _model_fields(CONFIG.plugins):
+        if getattr(CONFIG.plugins, pid) != getattr(new.plugins, pid):
+            setattr(CONFIG.plugins, pid, getattr(new.plugins, pid))
+            plugins_changed.add(pid)
+    # CONFIG now matches the stored config new was read from
+    CONFIG._db_base = new._db_base
+    return changed, plugins_changed
 
 
 def write_config(config: Config, persist=True):
-    """Write changes in config back to file."""
+    """Write changes in config back to file.
+
+    Raises ``ConfigWriteError`` when a mongo save keeps conflicting with other writers.
+    """
+    global _config_cache
+    _config_cache = None
     if stg.CONFIG_TYPE == 1 or stg.CONFIG_TYPE == 0:
         write_config_to_file(config)
     elif stg.CONFIG_TYPE == 2:
@@ -239,7 +373,7 @@ async def load_from_to(
             continue
         src = await _(forward.source)
         from_to_dict[src] = [await _(dest) for dest in forward.dest]
-    logging.info(f"From to dict is {from_to_dict}")
+    logging.info("From to dict is %s", from_to_dict)
     return from_to_dict
 
 
@@ -265,7 +399,7 @@ async def load_forward_map(
 async def load_admins(client: TelegramClient):
     for admin in CONFIG.admins:
         ADMINS.append(await get_id(client, admin))
-    logging.info(f"Loaded admins are {ADMINS}")
+    logging.info("Loaded admins are %s", ADMINS)
     return ADMINS
 
 
@@ -275,20 +409,184 @@ def setup_mongo(client):
     if not mycol.find_one({"_id": 0}):
         model_dump = getattr(Config(), "model_dump", None)
         data = model_dump() if callable(model_dump) else Config().dict()
-        mycol.insert_one({"_id": 0, "author": "nb", "config": data})
+        mycol.insert_one({"_id": 0, "author": "nb", "version": 0, "config": data})
     return mycol
 
 
+# the config document in mongo at _db_version, as last read or written by us
+_db_snapshot: Optional[Dict[str, Any]] = None
+_db_version: Optional[int] = None
+
+MAX_DB_WRITE_RETRIES = 3
+
+
+def _safe_key(key: Any) -> bool:
+    return isinstance(key, str) and key != "" and "." not in key and not key.startswith("$")
+
+
+def _diff(old: Any, new: Any, path: str, sets: Dict[str, Any], unsets: Set[str]) -> None:
+    """Collect the dotted-path $set/$unset operations turning old into new."""
+    if old == new:
+        return
+    if isinstance(old, dict) and isinstance(new, dict) and all(map(_safe_key, new)) and all(
+        map(_safe_key, old)
+    ):
+        for key, value in new.items():
+            if key in old:
+                _diff(old[key], value, f"{path}.{key}", sets, unsets)
+            else:
+                sets[f"{path}.{key}"] = value
+        for key in old.keys() - new.keys():
+            unsets.add(f"{path}.{key}")
+    elif isinstance(old, list) and isinstance(new, list) and len(old) == len(new):
+        for i, (a, b) in enumerate(zip(old, new)):
+            _diff(a, b, f"{path}.{i}", sets, unsets)
+    else:
+        sets[path] = new
+
+
+def _under(path: str, parent: str) -> bool:
+    return path == parent or path.startswith(parent + ".")
+
+
+def _overlaps(paths: Set[str], others: Set[str]) -> Set[str]:
+    return {p for p in paths for o in others if _under(p, o) or _under(o, p)}
+
+
+def _step(node: Any, key: str) -> Any:
+    return node[int(key)] if isinstance(node, list) else node[key]
+
+
+def _lookup(doc: Dict[str, Any], path: str) -> Tuple[bool, Any]:
+    node: Any = doc
+    try:
+        for key in path.split("."):
+            node = _step(node, key)
+    except (KeyError, IndexError, ValueError, TypeError):
+        return False, None
+    return True, node
+
+
+def _apply_ops(doc: Dict[str, Any], sets: Dict[str, Any], unsets: Set[str]) -> None:
+    """Apply $set/$unset paths to a plain document, the way mongo does."""
+    for path, value in sets.items():
+        *parents, last = path.split(".")
+        node: Any = doc
+        for key in parents:
+            if isinstance(node, dict):
+                node = node.setdefault(key, {})
+            else:
+                node = _step(node, key)
+        if isinstance(node, list):
+            node[int(last)] = value
+        else:
+            node[last] = value
+    for path in unsets:
+        *parents, last = path.split(".")
+        found, node = _lookup(doc, ".".join(parents)) if parents else (True, doc)
+        if found and isinstance(node, dict):
+            node.pop(last, None)
+        elif found and isinstance(node, list) and last.isdigit() and int(last) < len(node):
+            node[int(last)] = None
+
+
+def _resolve_conflicts(
+    data: Dict[str, Any], sets: Dict[str, Any], unsets: Set[str], theirs: Set[str]
+) -> Tuple[Dict[str, Any], Set[str]]:
+    """Our operations rewritten so that only the overlapping settings are overwritten.
+
+    Where the other writer replaced a parent of a path we changed (e.g. the
+    whole forwards list), our value of that parent is written instead; all
+    their other changes are kept.
+    """
+    ours = set(sets) | unsets
+    wider = sorted({o for o in theirs for p in ours if _under(p, o) and p != o}, key=len)
+    for parent in wider:
+        if any(_under(parent, p) for p in set(sets) | unsets):
+            continue  # already covered by a wider path of ours
+        sets = {p: v for p, v in sets.items() if not _under(p, parent)}
+        unsets = {p for p in unsets if not _under(p, parent)}
+        found, value = _lookup({"config": data}, parent)
+        if found:
+            sets[parent] = value
+        else:
+            unsets.add(parent)
+    return sets, unsets
+
+
+def _load_db_snapshot() -> None:
+    global _db_snapshot, _db_version
+    doc = stg.mycol.find_one({"_id": 0}, {"config": 1, "version": 1})
+    _db_snapshot = doc["config"]
+    _db_version = doc.get("version")
+
+
 def update_db(cfg):
+    """Write only the parts of the config that changed since cfg was read or saved.
+
+    The base of the diff is kept on the config object itself, so two
+    writers in one process (web UI sessions, the bot) never send each
+    other's edits. Every write is conditional on the version seen at that
+    time. If another writer got in first, the latest document is reloaded
+    and the same changes are re-applied on top of it, so edits to
+    different settings merge instead of overwriting each other. Where both
+    sides changed the same setting, this save wins for that setting only.
+    """
+    global _db_snapshot, _db_version
     model_dump = getattr(cfg, "model_dump", None)
     data = model_dump() if callable(model_dump) else cfg.dict()
-    stg.mycol.update_one({"_id": 0}, {"$set": {"config": data}})
+    if _db_snapshot is None:
+        _load_db_snapshot()
+    # a config built in code instead of read from mongo: diff against the stored one
+    base = cfg._db_base if cfg._db_base is not None else _db_snapshot
+
+    sets: Dict[str, Any] = {}
+    unsets: Set[str] = set()
+    _diff(base, data, "config", sets, unsets)
+    if not sets and not unsets:
+        return
+
+    for _ in range(MAX_DB_WRITE_RETRIES):
+        update: Dict[str, Any] = {"$inc": {"version": 1}}
+        if sets:
+            update["$set"] = sets
+        if unsets:
+            update["$unset"] = {path: "" for path in unsets}
+        result = stg.mycol.update_one({"_id": 0, "version": _db_version}, update)
+        if result.matched_count:
+            # the stored doc is theirs + ours; keep it so later saves only send our new edits
+            merged = {"config": copy.deepcopy(_db_snapshot)}
+            _apply_ops(merged, sets, unsets)
+            _db_snapshot = merged["config"]
+            _db_version = (_db_version or 0) + 1
+            cfg._db_base = data
+            return
+
+        # someone else saved in between, rebase our changes onto theirs
+        base = _db_snapshot
+        _load_db_snapshot()
+        their_sets: Dict[str, Any] = {}
+        their_unsets: Set[str] = set()
+        _diff(base, _db_snapshot, "config", their_sets, their_unsets)
+        theirs = set(their_sets) | their_unsets
+        conflicts = _overlaps(set(sets) | unsets, theirs)
+        if conflicts:
+            logging.warning("⚠️ 配置被其他进程同时修改，冲突的设置以本次保存为准: %s", sorted(conflicts))
+            sets, unsets = _resolve_conflicts(data, sets, unsets, theirs)
+
+    _db_snapshot = None
+    logging.error("❌ 配置保存失败：多次与其他写入冲突")
+    raise ConfigWriteError(f"config not saved: it kept conflicting with other writers ({MAX_DB_WRITE_RETRIES} tries)")
 
 
 def read_db():
+    global _db_snapshot, _db_version
     obj = stg.mycol.find_one({"_id": 0})
+    _db_snapshot = obj["config"]
+    _db_version = obj.get("version")
     validate = getattr(Config, "model_validate", None)
     cfg = validate(obj["config"]) if callable(validate) else Config.parse_obj(obj["config"])
+    cfg._db_base = copy.deepcopy(obj["config"])
     return cfg
 
 
@@ -11,5 +11,58 @@ REGISTER_COMMANDS = True
 
 KEEP_LAST_MANY = 10000
 
+# past 模式预先批量执行插件的消息数；每条消息之后还要休息 PAST_DELAY_RANGE，
+# 窗口过大时插件生成的文件会在磁盘上停留很久
+PAST_BATCH_SIZE = 4
+# seconds to rest after each message / album / comment in past mode.
+# This paces the account's sends against Telegram's limits, so it stays
+# per message; batching only saves plugin time, not send time.
+PAST_DELAY_RANGE = (60, 300)
+
+CONFIG_POLL_INTERVAL = 1.0
+CONFIG_CACHE_TTL = 2.0
+
+LIVE_QUEUE_FILE = "nb.queue.db"
+# Mongo 队列中已确认记录的保留时间（秒），防止较慢节点的重复写入让记录再次出现
+LIVE_QUEUE_TOMBSTONE_TTL = 24 * 60 * 60
+LIVE_MAX_INFLIGHT = 200
+# 重新拉取积压消息失败后的重试等待（秒），连续失败时翻倍直到上限
+LIVE_REFETCH_RETRY = 5.0
+LIVE_REFETCH_MAX_DELAY = 300.0
+
+MAPPING_DB_FILE = "nb.mapping.db"
+
+RATE_LIMIT_FILE = "nb.ratelimit.db"
+
+# 多节点（Mongo）运行时，转发来源的租约有效期、续期间隔与交还后的保留时间（秒）
+LEASE_TTL = 30.0
+LEASE_HEARTBEAT = 10.0
+LEASE_RELEASE_GRACE = 5.0
+NODE_ID_ENV_VAR = "NB_NODE_ID"
+
+SHARD_ENV_VAR = "NB_SHARD"
+WORKERS_ENV_VAR = "NB_WORKERS"
+# 工作进程崩溃后的重启等待（秒），连续崩溃时翻倍直到上限
+WORKER_RESTART_DELAY = 1.0
+WORKER_RESTART_MAX_DELAY = 60.0
+
+METRICS_FILE = "nb.metrics.json"
+METRICS_INTERVAL = 5.0
+METRICS_PORT_ENV_VAR = "NB_METRICS_PORT"
+
+BENCH_BASELINE_FILE = "nb.bench.json"
+RECORD_ENV_VAR = "NB_RECORD_EVENTS"
+RECORD_ANONYMIZE_ENV_VAR = "NB_RECORD_ANONYMIZE"
+
+VERSION_CHECK_FILE = "nb.version.json"
+VERSION_CHECK_TTL = 24 * 60 * 60
+
+LOG_FILE_ENV_VAR = "NB_LOG_FILE"
+LOG_MAX_BYTES = 5 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+WORKER_OUTPUT_FILE = "nb.out.txt"
+LOG_RATE_LIMIT = 20  # records per call site per window, below ERROR
+LOG_RATE_WINDOW = 10.0
+
 CONFIG_FILE_NAME = "nb.config.json"
 CONFIG_ENV_VAR_NAME = "NB_CONFIG"
\ No newline at end of file
@@ -0,0 +1,165 @@
+"""Record the live event stream for replay.
+
+When ``NB_RECORD_EVENTS`` names a file, the live handlers append one
+compact JSON line per new, edited, deleted and comment event: its time
+offset, chat, message ids, album, reply and discussion headers, sender,
+text and media kind/size. A ``.gz`` file name writes it gzip compressed.
+
+With ``NB_RECORD_ANONYMIZE`` set, chat and sender ids are replaced by
+stable pseudonyms and every word of the text by a pseudo word of the
+same length, using a random salt that is never written down. Message
+ids, albums, timings and text shapes survive, so a replay still
+reproduces bursts, edit storms and repeated texts.
+
+``nb bench --replay FILE`` feeds a recording back into a live worker.
+"""
+
+import atexit
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from typing import IO, Any, Dict, List, Optional, Tuple
+
+from nb.const import RECORD_ANONYMIZE_ENV_VAR, RECORD_ENV_VAR
+
+FORMAT_VERSION = 1
+FLUSH_INTERVAL = 1.0
+
+_MEDIA_KINDS = ("photo", "video", "gif", "audio", "voice", "video_note", "sticker", "contact", "document")
+_WORD = re.compile(r"\w+")
+
+
+def _open(path: str, mode: str) -> IO[str]:
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf8")
+    return open(path, mode, encoding="utf8")
+
+
+def _media_kind(message) -> Optional[str]:
+    if not getattr(message, "media", None):
+        return None
+    for kind in _MEDIA_KINDS:
+        if getattr(message, kind, None):
+            return kind
+    return "other"
+
+
+class EventRecorder:
+    def __init__(self, path: str, anonymize: bool = False) -> None:
+        self.path = path
+        self.anonymize = anonymize
+        self._salt = os.urandom(16)
+        self._started = time.monotonic()
+        self._last_flush = self._started
+        self._file = _open(path, "a")
+        self._write({"v": FORMAT_VERSION, "started": time.time(), "anon": anonymize})
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")) + "\n")
+        now = time.monotonic()
+        if now - self._last_flush >= FLUSH_INTERVAL:
+            self._last_flush = now
+            self._file.flush()
+
+    def _pseudo(self, word: str) -> str:
+        digest = hashlib.blake2b(word.encode(), key=self._salt, digest_size=16).hexdigest()
+        return (digest * (len(word) // 32 + 1))[: len(word)]
+
+    def _id(self, value: Optional[int]) -> Optional[int]:
+        if value is None or not self.anonymize:
+            return value
+        digest = hashlib.blake2b(str(value).encode(), key=self._salt, digest_size=6).digest()
+        return -int.from_bytes(digest, "big") if value < 0 else int.from_bytes(digest, "big")
+
+    def _text(self, text: str) -> str:
+        if not self.anonymize or not text:
+            return text
+        return _WORD.sub(lambda m: self._pseudo(m.group()), text)
+
+    def record(self, kind: str, event, source: Optional[int] = None) -> None:
+        """kind is new, edited, deleted or comment; ``source`` is the channel of a comment."""
+        try:
+            data: Dict[str, Any] = {
+                "t": round(time.monotonic() - self._started, 3),
+                "k": kind,
+                "c": self._id(event.chat_id),
+            }
+            if kind == "deleted":
+                data["d"] = list(getattr(event, "deleted_ids", None) or [])
+            else:
+                self._add_message(data, event.message)
+            if source is not None:
+                data["src"] = self._id(source)
+            self._write(data)
+        except Exception as e:
+            logging.debug("event record failed: %s", e)
+
+    def _add_message(self, data: Dict[str, Any], message) -> None:
+        data["m"] = message.id
+        text = message.raw_text or ""
+        if text:
+            data["x"] = self._text(text)
+        if message.grouped_id is not None:
+            data["g"] = self._id(message.grouped_id)
+        reply_to = getattr(message, "reply_to", None)
+        if reply_to is not None:
+            data["r"] = getattr(reply_to, "reply_to_msg_id", None)
+            if getattr(reply_to, "reply_to_top_id", None):
+                data["tp"] = reply_to.reply_to_top_id
+        fwd_from = getattr(message, "fwd_from", None)
+        if fwd_from is not None and getattr(fwd_from, "channel_post", None):
+            data["fp"] = fwd_from.channel_post
+        if message.sender_id is not None and message.sender_id != message.chat_id:
+            data["s"] = self._id(message.sender_id)
+        media = _media_kind(message)
+        if media:
+            data["md"] = media
+            size = getattr(getattr(message, "file", None), "size", None)
+            if size:
+                data["sz"] = size
+
+    def close(self) -> None:
+        if not self._file.closed:
+            self._file.close()
+
+
+def open_recorder() -> Optional[EventRecorder]:
+    """Start recording when NB_RECORD_EVENTS is set."""
+    path = os.getenv(RECORD_ENV_VAR)
+    if not path:
+        return None
+    recorder = EventRecorder(path, anonymize=bool(os.getenv(RECORD_ANONYMIZE_ENV_VAR)))
+    atexit.register(recorder.close)
+    logging.info("⏺️ 正在记录 live 事件到 %s%s", path, ' (已匿名化)' if recorder.anonymize else '')
+    return recorder
+
+
+def read_events(path: str) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Header and events of a recording; several runs appended to one file are chained.
+
+    A truncated last line (or gzip member) of a worker that was killed is skipped.
+    """
+    header: Dict[str, Any] = {}
+    records: List[Dict[str, Any]] = []
+    offset = 0.0
+    with _open(path, "r") as file:
+        try:
+            for line in file:
+                try:
+                    data = json.loads(line)
+                except ValueError:
+                    continue
+                if "v" in data:
+                    # a new run appended to the same file: continue after the previous one
+                    header = header or data
+                    offset = records[-1]["t"] if records else 0.0
+                    continue
+                data["t"] += offset
+                records.append(data)
+        except EOFError:
+            pass
+    return header, records
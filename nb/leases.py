@@ -0,0 +1,152 @@
+"""Forward ownership across several nb live nodes sharing one Mongo config.
+
+With ``MONGO_CON_STR`` set, every container (and every worker of
+``nb live --workers``) is a node. Each source chat has a lease document
+in ``<collection>-leases``; only the node holding an unexpired lease
+forwards that source. Nodes renew their leases and a node heartbeat
+every ``LEASE_HEARTBEAT`` seconds. Every node aims at an equal share of
+the sources: it claims free or expired leases, preferring the sources
+that hash closest to it, and hands back leases above its share so new
+nodes get work.
+
+A node that dies stops renewing; ``LEASE_TTL`` seconds later its sources
+are taken over. The live queue in Mongo is shared by all nodes and every
+node stores the events of all sources in it, so the new owner also
+forwards what arrived while the old one was gone. The message mappings
+are kept in Mongo as well (see ``nb.mapping_db``), so it also keeps
+syncing edits, deletes, replies and comments of earlier messages.
+
+A node that cannot reach Mongo treats its leases as lost once they would
+have expired, so two nodes never forward the same source for long.
+"""
+
+import asyncio
+import logging
+import math
+import os
+import socket
+import time
+import zlib
+from typing import Awaitable, Callable, Iterable, Optional, Set
+
+from nb.const import LEASE_HEARTBEAT, LEASE_RELEASE_GRACE, LEASE_TTL, NODE_ID_ENV_VAR
+
+
+def node_id() -> str:
+    return os.getenv(NODE_ID_ENV_VAR) or f"{socket.gethostname()}-{os.getpid()}"
+
+
+class LeaseManager:
+    def __init__(self, collection, node: Optional[str] = None) -> None:
+        self.col = collection
+        self.node = node or node_id()
+        self.sources: Set[int] = set()
+        self.owned: Set[int] = set()
+        self.valid_until = 0.0
+        self.col.create_index("owner")
+
+    def owns(self, chat_id: int) -> bool:
+        return chat_id in self.owned and time.time() < self.valid_until
+
+    def _preference(self, src: int) -> int:
+        # rendezvous hashing: each node prefers different sources, stable across rounds
+        return zlib.crc32(f"{src}:{self.node}".encode())
+
+    def _claim(self, src: int, now: float) -> bool:
+        from pymongo.errors import DuplicateKeyError
+
+        try:
+            doc = self.col.find_one_and_update(
+                {"_id": src, "expires": {"$lt": now}},
+                {"$set": {"owner": self.node, "expires": now + LEASE_TTL}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # the lease exists and is held by another node
+            return False
+        if doc is not None and doc.get("owner") not in (None, self.node):
+            logging.info("🔑 接管来源 %s (原节点 %s)", src, doc['owner'])
+        return True
+
+    def step(self) -> bool:
+        """One round: heartbeat, renew, rebalance. Returns whether ``owned`` changed."""
+        now = time.time()
+        self.col.update_one(
+            {"_id": f"node:{self.node}"},
+            {"$set": {"node": True, "expires": now + LEASE_TTL}},
+            upsert=True,
+        )
+        self.col.delete_many({"node": True, "expires": {"$lt": now - LEASE_TTL}})
+        nodes = self.col.count_documents({"node": True, "expires": {"$gt": now}})
+        sources = sorted(self.sources)
+        share = math.ceil(len(sources) / max(nodes, 1))
+
+        self.col.update_many(
+            {"owner": self.node, "_id": {"$in": sources}, "expires": {"$gt": now}},
+            {"$set": {"expires": now + LEASE_TTL}},
+        )
+        # sources removed from the config
+        self.col.delete_many({"owner": self.node, "_id": {"$nin": sources}, "node": {"$exists": False}})
+        owned = {doc["_id"] for doc in self.col.find({"owner": self.node, "expires": {"$gt": now}}, {"_id": 1})}
+
+        if len(owned) > share:
+            extra = sorted(owned, key=self._preference)[share:]
+            self._release(extra, now)
+            owned -= set(extra)
+        elif len(owned) < share:
+            for src in sorted(set(sources) - owned, key=self._preference):
+                if len(owned) >= share:
+                    break
+                if self._claim(src, now):
+                    owned.add(src)
+
+        self.valid_until = now + LEASE_TTL
+        changed = owned != self.owned
+        self.owned = owned
+        return changed
+
+    def _release(self, sources: Iterable[int], now: float) -> None:
+        # 短暂保留，让本节点手上的发送先完成，再由其他节点接手
+        self.col.update_many(
+            {"owner": self.node, "_id": {"$in": list(sources)}},
+            {"$set": {"owner": None, "expires": now + LEASE_RELEASE_GRACE}},
+        )
+
+    def release_all(self) -> None:
+        now = time.time()
+        self._release(self.owned, now)
+        self.col.delete_one({"_id": f"node:{self.node}"})
+        self.owned = set()
+
+    async def run(self, on_change: Callable[[], Awaitable[None]]) -> None:
+        """Renew every LEASE_HEARTBEAT seconds, calling ``on_change`` when ownership changed."""
+        while True:
+            await asyncio.sleep(LEASE_HEARTBEAT)
+            if await self.refresh():
+                try:
+                    await on_change()
+                except Exception as e:
+                    logging.error("❌ 应用租约变化失败: %s", e)
+
+    async def refresh(self) -> bool:
+        try:
+            return await asyncio.to_thread(self.step)
+        except Exception as e:
+            logging.error("❌ 租约续期失败: %s", e)
+            if time.time() >= self.valid_until and self.owned:
+                logging.warning("⚠️ 租约已过期，暂停转发本节点的来源")
+                self.owned = set()
+                return True
+            return False
+
+
+def open_leases() -> Optional[LeaseManager]:
+    """A lease manager when the config lives in Mongo, None otherwise."""
+    from nb import storage as stg
+
+    if stg.CONFIG_TYPE != 2 or stg.mycol is None:
+        return None
+    col = stg.mycol.database[f"{stg.mycol.name}-leases"]
+    manager = LeaseManager(col)
+    logging.info("🔑 使用 mongo 租约分配转发，节点 %s", manager.node)
+    return manager
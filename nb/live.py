@@ -1,18 +1,31 @@
 # nb/live.py
 
 import asyncio
+import contextvars
+import copy
+import functools
 import logging
-import random
-from typing import Union, List, Optional, Dict
+import os
+import time
+from typing import Callable, Union, List, Optional, Dict, Tuple
 
 from telethon import TelegramClient, events
+from telethon.errors.rpcbaseerrors import BadRequestError, ForbiddenError
 from telethon.tl.custom.message import Message
 
-from nb import config, const
+from nb import config, const, event_log, leases, metrics, rate_limit, shard
 from nb import storage as st
 from nb.bot import get_events
 from nb.config import CONFIG, get_SESSION
-from nb.plugins import apply_plugins, apply_plugins_to_group, load_async_plugins
+from nb.live_queue import LiveQueue, Record, next_seq, open_live_queue
+from nb.scheduler import KeyedExecutor, LiveScheduler
+from nb.plugins import (
+    NbMessage,
+    apply_plugins,
+    apply_plugins_to_group,
+    load_async_plugins,
+    reload_plugins,
+)
 from nb.utils import (
     clean_session_files,
     send_message,
@@ -25,6 +38,9 @@ from nb.utils import (
     _auto_comment_keyword,
 )
 
+# 与其他进程（例如 nb past）共享账号的发送速率，FloodWait 时一起暂停
+send_message = rate_limit.limit_send(send_message)
+
 
 def _extract_msg_id(fwded) -> Optional[int]:
     if fwded is None:
@@ -59,27 +75,112 @@ def _bot_media_allowed(forward) -> bool:
     return forward is None or forward.bot_media_enabled is not False
 
 
-LIVE_QUEUE: asyncio.Queue = asyncio.Queue()
-_queue_task: Optional[asyncio.Task] = None
+SCHEDULER = LiveScheduler(lambda: CONFIG.live.send_interval)
+EXECUTOR = KeyedExecutor()
+LIVE_STORE: Optional[LiveQueue] = None
+_config_task: Optional[asyncio.Task] = None
+_dispatch_task: Optional[asyncio.Task] = None
+_metrics_task: Optional[asyncio.Task] = None
+# 设置 NB_RECORD_EVENTS 时记录事件流，供 nb bench --replay 回放
+RECORDER: Optional[event_log.EventRecorder] = None
+# 配置存放在 Mongo 时，多个节点通过租约分配转发来源
+LEASES: Optional[leases.LeaseManager] = None
+_lease_task: Optional[asyncio.Task] = None
+# 未按节点/分片过滤的转发关系
+_all_from_to: Dict[int, List[int]] = {}
+_all_forward_map: Dict[int, config.Forward] = {}
+
+# 当前正在处理的事件所提交的发送任务，用于在全部发送完成后确认持久化记录
+_event_sends: contextvars.ContextVar[Optional[List[asyncio.Future]]] = contextvars.ContextVar(
+    "_event_sends", default=None
+)
 
 
-async def _queue_worker() -> None:
-    while True:
-        handler, payload = await LIVE_QUEUE.get()
-        try:
-            await handler(payload)
-        except Exception as e:
-            logging.error(f"❌ live 队列处理失败: {e}")
-        finally:
-            LIVE_QUEUE.task_done()
-        delay_seconds = random.randint(60, 300)
-        logging.info(f"⏸️ live 队列休息 {delay_seconds} 秒")
-        await asyncio.sleep(delay_seconds)
+# 媒体组 grouped_id -> 整组发送完成时结束的 Future
+_album_sends: Dict[int, asyncio.Future] = {}
+
+
+def _album_done(grouped_id: int) -> asyncio.Future:
+    done = _album_sends.get(grouped_id)
+    if done is None:
+        done = _album_sends[grouped_id] = asyncio.get_running_loop().create_future()
+    return done
+
+
+async def _clear_when_done(futures: List[asyncio.Future], tms: List[NbMessage]) -> None:
+    await asyncio.gather(*futures, return_exceptions=True)
+    for tm in tms:
+        tm.clear()
+
+
+def _count_send(chat_id: int, upload: int, fut: asyncio.Future) -> None:
+    ok = not fut.cancelled() and fut.exception() is None
+    metrics.record_out(chat_id, ok)
+    if ok and upload:
+        metrics.record_bytes("up", upload)
 
 
-async def _enqueue_task(handler, payload) -> None:
-    await LIVE_QUEUE.put((handler, payload))
+def _upload_size(tms: List[NbMessage]) -> int:
+    """插件生成的新文件需要上传，统计其大小"""
+    size = 0
+    for tm in tms:
+        if tm.new_file:
+            try:
+                size += os.path.getsize(tm.new_file)
+            except OSError:
+                pass
+    return size
+
+
+def _submit_sends(jobs: List[Tuple[int, Callable, tuple]], tms: List[NbMessage]) -> List[asyncio.Future]:
+    """每个目标一个发送任务；全部完成后清理插件产生的临时文件
+
+    发送任务的第一个参数总是源聊天 ID，用于按转发统计。
+    """
+    futures = [SCHEDULER.submit(d, func, *args) for d, func, args in jobs]
+    upload = _upload_size(tms)
+    for (_, _, args), fut in zip(jobs, futures):
+        fut.add_done_callback(functools.partial(_count_send, args[0], upload))
+    sends = _event_sends.get()
+    if sends is not None:
+        sends.extend(futures)
+    if tms:
+        asyncio.ensure_future(_clear_when_done(futures, tms))
+    return futures
+
+
+async def _record_digest_when_sent(
+    event_uid: st.EventUid, dest: List[int], digest: str, futures: List[asyncio.Future]
+) -> None:
+    """所有目标都发送成功后才记录文本摘要，发送失败时之后相同内容的编辑仍会同步"""
+    results = await asyncio.gather(*futures, return_exceptions=True)
+    if any(isinstance(r, BaseException) for r in results):
+        return
+    if not await st.stored.load(event_uid):
+        return
+    if all(_extract_msg_id(st.stored[event_uid].get(d)) is not None for d in dest):
+        # 编辑可能已经同步了更新的内容
+        st.delivered_digest.setdefault(event_uid, digest)
+
+
+async def _lookup_reply_to(chat_id: int, reply_msg_id: Optional[int], d: int) -> Optional[int]:
+    if reply_msg_id is None:
+        return None
+    r_event_uid = st.EventUid(st.DummyEvent(chat_id, reply_msg_id))
+    if not await st.stored.load(r_event_uid):
+        return None
+    return _extract_msg_id(st.stored[r_event_uid].get(d))
+
 
+async def _record_sent(event_uid: st.EventUid, chat_id: int, msg_id: int, d: int, fwded_msg) -> None:
+    if fwded_msg is None:
+        return
+    if not await st.stored.load(event_uid):
+        st.stored[event_uid] = {}
+    st.stored[event_uid][d] = fwded_msg
+    fwded_id = _extract_msg_id(fwded_msg)
+    if fwded_id is not None:
+        st.add_post_mapping(chat_id, msg_id, d, fwded_id)
 
 
 async def _send_bot_media_album(
@@ -133,7 +234,7 @@ async def _resolve_comment_dest(
     if src_channel_id is None:
         return None
 
-    channel_post_id = st.discussion_to_channel_post.get((chat_id, top_id))
+    channel_post_id = await st.discussion_to_channel_post.load((chat_id, top_id))
 
     if channel_post_id is None:
         try:
@@ -143,7 +244,7 @@ async def _resolve_comment_dest(
                 if channel_post_id:
                     st.discussion_to_channel_post[(chat_id, top_id)] = channel_post_id
         except Exception as e:
-            logging.warning(f"⚠️ 反查帖子失败: {e}")
+            logging.warning("⚠️ 反查帖子失败: %s", e)
 
     if channel_post_id is None:
         return None
@@ -157,7 +258,7 @@ async def _resolve_comment_dest(
             except Exception:
                 continue
 
-        dest_post_id = st.get_dest_post_id(src_channel_id, channel_post_id, dest_channel_resolved)
+        dest_post_id = await st.get_dest_post_id(src_channel_id, channel_post_id, dest_channel_resolved)
         if dest_post_id is None:
             continue
 
@@ -178,11 +279,54 @@ async def _resolve_comment_dest(
     return result if result else None
 
 
+async def _send_group_to_dest(chat_id: int, d: int, messages: List[Message], tms: List[NbMessage]) -> None:
+    fwded_msgs = await send_message(d, tms[0], grouped_messages=[tm.message for tm in tms], grouped_tms=tms)
+    for i, original_msg in enumerate(messages):
+        event_uid = st.EventUid(st.DummyEvent(chat_id, original_msg.id))
+        if not await st.stored.load(event_uid):
+            st.stored[event_uid] = {}
+        if isinstance(fwded_msgs, list) and i < len(fwded_msgs):
+            st.stored[event_uid][d] = fwded_msgs[i]
+        elif not isinstance(fwded_msgs, list):
+            st.stored[event_uid][d] = fwded_msgs
+
+
+async def _send_group_bot_media_to_dest(
+    chat_id: int, d: int, messages: List[Message], bot_media: List[Message], trigger_text: Optional[str]
+) -> None:
+    fwded_msg = await _send_bot_media_album(d, bot_media, base_text=trigger_text)
+    for original_msg in messages:
+        event_uid = st.EventUid(st.DummyEvent(chat_id, original_msg.id))
+        if not await st.stored.load(event_uid):
+            st.stored[event_uid] = {}
+        st.stored[event_uid][d] = fwded_msg
+
+
+async def _settle_album(done: asyncio.Future, sends: List[asyncio.Future]) -> None:
+    if sends:
+        await asyncio.gather(*sends, return_exceptions=True)
+    if not done.done():
+        done.set_result(None)
+
+
 async def _send_grouped_messages(grouped_id: int) -> None:
     if grouped_id not in st.GROUPED_CACHE:
         return
 
-    chat_messages_map = st.GROUPED_CACHE[grouped_id]
+    chat_messages_map = st.pop_group(grouped_id)
+    done = _album_sends.pop(grouped_id, None)
+    # 定时器触发时不在任何事件的上下文中，单独收集本组的发送任务
+    sends: List[asyncio.Future] = []
+    token = _event_sends.set(sends)
+    try:
+        await _submit_group(chat_messages_map)
+    finally:
+        _event_sends.reset(token)
+        if done is not None:
+            asyncio.ensure_future(_settle_album(done, sends))
+
+
+async def _submit_group(chat_messages_map: Dict[int, List[Message]]) -> None:
     for chat_id, messages in chat_messages_map.items():
         if chat_id not in config.from_to:
             continue
@@ -200,47 +344,51 @@ async def _send_grouped_messages(grouped_id: int) -> None:
                     break
         if bot_media:
             bot_media = _dedupe_messages(bot_media)
-            for d in dest:
-                try:
-                    fwded_msg = await _send_bot_media_album(
-                        d,
-                        bot_media,
-                        base_text=trigger_text,
-                    )
-                    for original_msg in messages:
-                        event_uid = st.EventUid(st.DummyEvent(chat_id, original_msg.id))
-                        if event_uid not in st.stored:
-                            st.stored[event_uid] = {}
-                        st.stored[event_uid][d] = fwded_msg
-                except Exception as e:
-                    logging.critical(f"🚨 live bot 媒体组播失败: {e}")
+            _submit_sends(
+                [(d, _send_group_bot_media_to_dest, (chat_id, d, messages, bot_media, trigger_text)) for d in dest],
+                [],
+            )
             continue
         tms = await apply_plugins_to_group(messages)
         if not tms:
             continue
 
-        tm_template = tms[0]
-        for d in dest:
-            try:
-                fwded_msgs = await send_message(d, tm_template, grouped_messages=[tm.message for tm in tms], grouped_tms=tms)
-                for i, original_msg in enumerate(messages):
-                    event_uid = st.EventUid(st.DummyEvent(chat_id, original_msg.id))
-                    if event_uid not in st.stored:
-                        st.stored[event_uid] = {}
-                    if isinstance(fwded_msgs, list) and i < len(fwded_msgs):
-                        st.stored[event_uid][d] = fwded_msgs[i]
-                    elif not isinstance(fwded_msgs, list):
-                        st.stored[event_uid][d] = fwded_msgs
-            except Exception as e:
-                logging.critical(f"🚨 live 模式组播失败: {e}")
-
-    st.GROUPED_CACHE.pop(grouped_id, None)
-    st.GROUPED_TIMERS.pop(grouped_id, None)
-    st.GROUPED_MAPPING.pop(grouped_id, None)
+        _submit_sends(
+            [(d, _send_group_to_dest, (chat_id, d, messages, tms)) for d in dest],
+            tms,
+        )
 
 
 async def _enqueue_grouped_messages(grouped_id: int) -> None:
-    await _enqueue_task(_send_grouped_messages, grouped_id)
+    await _send_grouped_messages(grouped_id)
+
+
+async def _send_single_to_dest(
+    chat_id: int, msg_id: int, reply_msg_id: Optional[int], event_uid: st.EventUid, d: int, tm: NbMessage
+) -> None:
+    # 每个目标使用独立副本，避免并发车道互相覆盖 reply_to
+    dtm = copy.copy(tm)
+    dtm.reply_to = await _lookup_reply_to(chat_id, reply_msg_id, d)
+    fwded_msg = await send_message(d, dtm)
+    await _record_sent(event_uid, chat_id, msg_id, d, fwded_msg)
+
+
+async def _send_bot_media_to_dest(
+    chat_id: int,
+    msg_id: int,
+    reply_msg_id: Optional[int],
+    event_uid: st.EventUid,
+    d: int,
+    bot_media: List[Message],
+    base_text: str,
+) -> None:
+    fwded_msg = await _send_bot_media_album(
+        d,
+        bot_media,
+        base_text=base_text,
+        reply_to=await _lookup_reply_to(chat_id, reply_msg_id, d),
+    )
+    await _record_sent(event_uid, chat_id, msg_id, d, fwded_msg)
 
 
 async def _handle_new_message(event: Union[Message, events.NewMessage]) -> None:
@@ -260,72 +408,68 @@ async def _handle_new_message(event: Union[Message, events.NewMessage]) -> None:
             await _auto_comment_keyword(event.client, chat_id, message.id, keyword)
     if message.grouped_id is not None:
         st.add_to_group_cache(chat_id, message.grouped_id, message)
+        # 媒体组稍后由定时器发送，记录等整组发送完成后才确认
+        sends = _event_sends.get()
+        if sends is not None:
+            sends.append(_album_done(message.grouped_id))
         return
 
     event_uid = st.EventUid(event)
     if len(st.stored) > const.KEEP_LAST_MANY:
-        del st.stored[next(iter(st.stored))]
+        oldest = next(iter(st.stored))
+        st.stored.evict(oldest)
+        st.delivered_digest.pop(oldest, None)
 
     dest = config.from_to.get(chat_id)
+    reply_msg_id = _get_reply_to_msg_id(message) if event.is_reply else None
     bot_media = []
     if bot_media_allowed:
         bot_media = await resolve_bot_media_from_message(event.client, message, forward)
     if bot_media:
         bot_media = _dedupe_messages(bot_media)
         st.stored[event_uid] = {}
-        for d in dest:
-            reply_to_id = None
-            if event.is_reply:
-                reply_msg_id = _get_reply_to_msg_id(event.message)
-                if reply_msg_id is not None:
-                    r_event = st.DummyEvent(chat_id, reply_msg_id)
-                    r_event_uid = st.EventUid(r_event)
-                    if r_event_uid in st.stored:
-                        fwded_reply = st.stored[r_event_uid].get(d)
-                        reply_to_id = _extract_msg_id(fwded_reply)
-            try:
-                fwded_msg = await _send_bot_media_album(
-                    d,
-                    bot_media,
-                    base_text=message.raw_text or message.text or "",
-                    reply_to=reply_to_id,
-                )
-                if fwded_msg is not None:
-                    st.stored[event_uid][d] = fwded_msg
-                    fwded_id = _extract_msg_id(fwded_msg)
-                    if fwded_id is not None:
-                        st.add_post_mapping(chat_id, message.id, d, fwded_id)
-            except Exception as e:
-                logging.error(f"❌ live bot 媒体发送失败: {e}")
+        base_text = message.raw_text or message.text or ""
+        _submit_sends(
+            [
+                (d, _send_bot_media_to_dest, (chat_id, message.id, reply_msg_id, event_uid, d, bot_media, base_text))
+                for d in dest
+            ],
+            [],
+        )
         return
     tm = await apply_plugins(message)
     if not tm:
         return
 
     st.stored[event_uid] = {}
-    for d in dest:
-        reply_to_id = None
-        if event.is_reply:
-            reply_msg_id = _get_reply_to_msg_id(event.message)
-            if reply_msg_id is not None:
-                r_event = st.DummyEvent(chat_id, reply_msg_id)
-                r_event_uid = st.EventUid(r_event)
-                if r_event_uid in st.stored:
-                    fwded_reply = st.stored[r_event_uid].get(d)
-                    reply_to_id = _extract_msg_id(fwded_reply)
-        tm.reply_to = reply_to_id
-
-        try:
-            fwded_msg = await send_message(d, tm)
-            if fwded_msg is not None:
-                st.stored[event_uid][d] = fwded_msg
-                fwded_id = _extract_msg_id(fwded_msg)
-                if fwded_id is not None:
-                    st.add_post_mapping(chat_id, message.id, d, fwded_id)
-        except Exception as e:
-            logging.error(f"❌ live 单条发送失败: {e}")
-
-    tm.clear()
+    digest = st.text_digest(tm.text)
+    futures = _submit_sends(
+        [(d, _send_single_to_dest, (chat_id, message.id, reply_msg_id, event_uid, d, tm)) for d in dest],
+        [tm],
+    )
+    asyncio.ensure_future(_record_digest_when_sent(event_uid, dest, digest, futures))
+
+
+async def _send_comment_to_dest(
+    chat_id: int,
+    msg_id: int,
+    dest_discussion_id: int,
+    dest_top_id: Optional[int],
+    tm: NbMessage,
+    bot_media: List[Message],
+    base_text: str,
+) -> None:
+    if bot_media:
+        fwded_msg = await _send_bot_media_album(
+            dest_discussion_id,
+            bot_media,
+            base_text=base_text,
+            comment_to_post=dest_top_id,
+        )
+    else:
+        fwded_msg = await send_message(dest_discussion_id, tm, comment_to_post=dest_top_id)
+    if fwded_msg is not None:
+        st.add_comment_mapping(chat_id, msg_id, dest_discussion_id, _extract_msg_id(fwded_msg))
 
 
 async def _handle_comment_message(event: Union[Message, events.NewMessage]) -> None:
@@ -363,6 +507,7 @@ async def _handle_comment_message(event: Union[Message, events.NewMessage]) -> N
 
     dest_map = await _resolve_comment_dest(event.client, message, forward)
     if dest_map is None:
+        tm.clear()
         return
 
     bot_media = []
@@ -372,40 +517,27 @@ async def _handle_comment_message(event: Union[Message, events.NewMessage]) -> N
     if bot_media:
         bot_media = _dedupe_messages(bot_media)
 
-    for dest_discussion_id, dest_top_id in dest_map.items():
-        try:
-            if bot_media:
-                fwded_msg = await _send_bot_media_album(
-                    dest_discussion_id,
-                    bot_media,
-                    base_text=message.raw_text or message.text or "",
-                    comment_to_post=dest_top_id,
-                )
-            else:
-                fwded_msg = await send_message(dest_discussion_id, tm, comment_to_post=dest_top_id)
-            if fwded_msg is not None:
-                st.add_comment_mapping(chat_id, message.id, dest_discussion_id, _extract_msg_id(fwded_msg))
-        except Exception as e:
-            logging.error(f"❌ 评论转发失败: {e}")
-
-    tm.clear()
-
-
-async def new_message_handler(event: Union[Message, events.NewMessage]) -> None:
-    await _enqueue_task(_handle_new_message, event)
-
-
-async def comment_message_handler(event: Union[Message, events.NewMessage]) -> None:
-    await _enqueue_task(_handle_comment_message, event)
-
-
-async def edited_message_handler(event) -> None:
+    base_text = message.raw_text or message.text or ""
+    _submit_sends(
+        [
+            (
+                dest_discussion_id,
+                _send_comment_to_dest,
+                (chat_id, message.id, dest_discussion_id, dest_top_id, tm, bot_media, base_text),
+            )
+            for dest_discussion_id, dest_top_id in dest_map.items()
+        ],
+        [tm],
+    )
+
+
+async def _handle_edited_message(event) -> None:
     chat_id = event.chat_id
     if chat_id not in config.from_to:
         return
 
     event_uid = st.EventUid(event)
-    if event_uid not in st.stored:
+    if not await st.stored.load(event_uid):
         return
 
     if CONFIG.live.delete_on_edit and event.message.text == CONFIG.live.delete_on_edit:
@@ -423,25 +555,41 @@ async def edited_message_handler(event) -> None:
         except Exception:
             pass
         del st.stored[event_uid]
+        st.delivered_digest.pop(event_uid, None)
         return
 
     dest = config.from_to.get(chat_id, [])
-    tm = await apply_plugins(event.message)
+    tm = await apply_plugins(event.message, text_only=True)
     if not tm:
         return
 
+    digest = st.text_digest(tm.text)
+    if st.delivered_digest.get(event_uid) == digest:
+        logging.info("✏️ 编辑后内容未变化，跳过同步 %s", event_uid)
+        tm.clear()
+        return
+
+    delivered = bool(dest)
     for d in dest:
         fwded = st.stored[event_uid].get(d)
         mid = _extract_msg_id(fwded)
-        if mid is not None:
-            try:
-                await event.client.edit_message(d, mid, tm.text)
-            except Exception as e:
-                logging.error(f"❌ 编辑同步失败: {e}")
+        if mid is None:
+            # 原消息还在车道中排队，这次编辑没有送达该目标
+            delivered = False
+            continue
+        try:
+            await rate_limit.acquire(d)
+            await event.client.edit_message(d, mid, tm.text)
+        except Exception as e:
+            delivered = False
+            logging.error("❌ 编辑同步失败: %s", e)
+    # 只有每个目标都编辑成功才记录，之后相同内容的编辑仍会重试
+    if delivered:
+        st.delivered_digest[event_uid] = digest
     tm.clear()
 
 
-async def deleted_message_handler(event) -> None:
+async def _handle_deleted_message(event) -> None:
     deleted_ids = getattr(event, 'deleted_ids', None)
     if deleted_ids is None:
         deleted_ids = getattr(event, 'deleted_id', None)
@@ -450,22 +598,239 @@ async def deleted_message_handler(event) -> None:
         else:
             return
 
+    # Telegram 对频道/超级群的删除会给出 chat_id，其余情况靠反向索引定位来源
+    event_chat_id = getattr(event, 'chat_id', None)
+    to_delete: Dict[int, List[int]] = {}
     for deleted_id in deleted_ids:
-        for chat_id in list(config.from_to.keys()):
-            r_event = st.DummyEvent(chat_id, deleted_id)
-            event_uid = st.EventUid(r_event)
-            if event_uid not in st.stored:
+        if event_chat_id is not None:
+            sources = [event_chat_id]
+        else:
+            sources = list(await st.stored.sources_of(deleted_id))
+        for chat_id in sources:
+            if chat_id not in config.from_to:
+                continue
+            event_uid = st.EventUid(st.DummyEvent(chat_id, deleted_id))
+            if not await st.stored.load(event_uid):
                 continue
-            dest_map = st.stored[event_uid]
+            dest_map = st.stored.pop(event_uid)
+            st.delivered_digest.pop(event_uid, None)
             for d, fwded in dest_map.items():
                 mid = _extract_msg_id(fwded)
-                if mid is None:
-                    continue
-                try:
-                    await event.client.delete_messages(d, mid)
-                except Exception:
-                    pass
-            del st.stored[event_uid]
+                if mid is not None:
+                    to_delete.setdefault(d, []).append(mid)
+
+    for d, mids in to_delete.items():
+        for chunk in _chunk_list(mids, 100):
+            try:
+                await rate_limit.acquire(d)
+                await event.client.delete_messages(d, chunk)
+            except Exception as e:
+                logging.warning("⚠️ 删除同步失败 dest=%s: %s", d, e)
+
+
+class _StoredEvent:
+    """Stand-in for a NewMessage event rebuilt from a re-fetched message."""
+
+    def __init__(self, message: Message) -> None:
+        self.message = message
+        self.chat_id = message.chat_id
+        self.id = message.id
+        self.client = message.client
+        self.is_reply = message.is_reply
+
+    async def get_sender(self):
+        return await self.message.get_sender()
+
+
+# 持久化队列：先落盘 (chat, msg, kind) 记录，再按顺序分发。
+# 在途数量受 LIVE_MAX_INFLIGHT 限制，超出部分只保留记录，稍后重新拉取消息。
+_fresh: Dict[Record, Union[Message, events.NewMessage]] = {}
+_inflight: set = set()
+_dispatch_wakeup = asyncio.Event()
+
+
+def _is_source(chat_id: int, kind: str) -> bool:
+    """账号收到的私聊、无关群组等消息不落盘；使用租约时记录所有节点的来源"""
+    if kind == "comment":
+        return chat_id in config.comment_sources
+    return chat_id in _all_from_to
+
+
+async def _persist_event(event, kind: str) -> None:
+    if not _is_source(event.chat_id, kind):
+        return
+    rec = (event.chat_id, event.message.id, kind)
+    metrics.record_in(event.chat_id)
+    owned = _owned_chats()
+    if (owned is None or event.chat_id in owned) and len(_inflight) + len(_fresh) < const.LIVE_MAX_INFLIGHT:
+        _fresh[rec] = event
+    await LIVE_STORE.put(next_seq(), *rec)
+    _dispatch_wakeup.set()
+
+
+async def _ack_when_done(rec: Record, sends: List[asyncio.Future]) -> None:
+    if sends:
+        await asyncio.gather(*sends, return_exceptions=True)
+    try:
+        await LIVE_STORE.ack(*rec)
+    except Exception as e:
+        logging.error("❌ live 队列确认失败 %s: %s", rec, e)
+    _inflight.discard(rec)
+    _refetch_backoff.pop(rec, None)
+    _dispatch_wakeup.set()
+
+
+async def _process_record(handler, event, rec: Record) -> None:
+    sends: List[asyncio.Future] = []
+    token = _event_sends.set(sends)
+    try:
+        await handler(event)
+    finally:
+        _event_sends.reset(token)
+        asyncio.ensure_future(_ack_when_done(rec, sends))
+
+
+# 重新拉取失败的记录：record -> (下次重试时间, 当前等待秒数)；同一来源的后续记录也暂缓，保持顺序
+_refetch_backoff: Dict[Record, Tuple[float, float]] = {}
+
+
+def _refetch_failed(recs: List[Record], error: Exception) -> None:
+    now = time.monotonic()
+    for rec in recs:
+        prev = _refetch_backoff.get(rec)
+        delay = const.LIVE_REFETCH_RETRY if prev is None else min(prev[1] * 2, const.LIVE_REFETCH_MAX_DELAY)
+        # FloodWait 给出了需要等待的时间
+        delay = max(delay, getattr(error, "seconds", 0) or 0)
+        _refetch_backoff[rec] = (now + delay, delay)
+
+
+def _backing_off() -> set:
+    """仍在等待重试的来源"""
+    now = time.monotonic()
+    return {rec[0] for rec, (retry_at, _) in _refetch_backoff.items() if retry_at > now}
+
+
+async def _refetch(client: TelegramClient, recs: List[Record]) -> Tuple[Dict[Record, _StoredEvent], set]:
+    """重新拉取消息，返回 (拉取到的事件, 拉取失败的记录)
+
+    Telegram 对已删除的消息返回 None，这些记录既不在结果中也不算失败；
+    无权访问来源等永久错误同样如此，重试也不会成功。
+    """
+    by_chat: Dict[int, List[Record]] = {}
+    for rec in recs:
+        by_chat.setdefault(rec[0], []).append(rec)
+
+    result = {}
+    failed = set()
+    for chat_id, chat_recs in by_chat.items():
+        for chunk in _chunk_list(chat_recs, 100):
+            try:
+                messages = await client.get_messages(chat_id, ids=[rec[1] for rec in chunk])
+            except (BadRequestError, ForbiddenError) as e:
+                logging.error("❌ 无法拉取来源消息 chat=%s，丢弃 %s 条记录: %s", chat_id, len(chunk), e)
+                for rec in chunk:
+                    _refetch_backoff.pop(rec, None)
+                continue
+            except Exception as e:
+                logging.warning("⚠️ 重新拉取消息失败 chat=%s，稍后重试: %s", chat_id, e)
+                _refetch_failed(chunk, e)
+                failed.update(chunk)
+                continue
+            for rec, message in zip(chunk, messages):
+                _refetch_backoff.pop(rec, None)
+                if message is not None:
+                    result[rec] = _StoredEvent(message)
+    return result, failed
+
+
+async def _dispatcher(client: TelegramClient) -> None:
+    handlers = {"new": _handle_new_message, "comment": _handle_comment_message}
+    while True:
+        try:
+            await asyncio.wait_for(_dispatch_wakeup.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            pass
+        _dispatch_wakeup.clear()
+
+        try:
+            while len(_inflight) < const.LIVE_MAX_INFLIGHT:
+                room = const.LIVE_MAX_INFLIGHT - len(_inflight)
+                # 退避中的来源不参与查询，积压再多也不会占满窗口挡住其他来源
+                pending = await LIVE_STORE.pending(room + len(_inflight), _owned_chats(), _backing_off())
+                recs = [rec for rec in pending if rec not in _inflight][:room]
+                if not recs:
+                    break
+                fetched, failed = await _refetch(client, [rec for rec in recs if rec not in _fresh])
+                for rec in recs:
+                    if rec in failed:
+                        # 保留记录，退避后重新拉取
+                        continue
+                    event = _fresh.pop(rec, None) or fetched.get(rec)
+                    handler = handlers.get(rec[2])
+                    if event is None or handler is None:
+                        # 消息已被删除、无法访问或类型未知，直接确认
+                        await LIVE_STORE.ack(*rec)
+                        continue
+                    _inflight.add(rec)
+                    EXECUTOR.submit(rec[0], _process_record, handler, event, rec)
+        except Exception as e:
+            logging.error("❌ live 队列分发失败: %s", e)
+
+
+# 同一来源的事件按到达顺序处理，不同来源之间完全并发
+async def new_message_handler(event: Union[Message, events.NewMessage]) -> None:
+    # 无关聊天的消息也不写入事件记录
+    if not _is_source(event.chat_id, "new"):
+        return
+    # 其他分片负责的聊天：每个工作进程都会收到全部更新。
+    # 使用租约时所有节点都写入共享队列，接手来源的节点可以继续处理
+    if LEASES is None and shard.is_sharded() and not shard.owns(event.chat_id):
+        return
+    if RECORDER is not None:
+        RECORDER.record("new", event)
+    await _persist_event(event, "new")
+
+
+async def comment_message_handler(event: Union[Message, events.NewMessage]) -> None:
+    if RECORDER is not None:
+        RECORDER.record("comment", event, config.comment_sources.get(event.chat_id))
+    await _persist_event(event, "comment")
+
+
+# 编辑合并：同一 (chat, msg) 的连续编辑只保留最后一个事件，窗口内无新编辑后才同步
+_pending_edits: Dict[Tuple[int, int], events.MessageEdited] = {}
+_edit_timers: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
+
+
+def _flush_edit(key: Tuple[int, int]) -> None:
+    _edit_timers.pop(key, None)
+    event = _pending_edits.pop(key, None)
+    if event is not None:
+        EXECUTOR.submit(event.chat_id, _handle_edited_message, event)
+
+
+async def edited_message_handler(event) -> None:
+    if event.chat_id not in config.from_to:
+        return
+    if RECORDER is not None:
+        RECORDER.record("edited", event)
+    window = CONFIG.live.edit_debounce
+    if window <= 0:
+        EXECUTOR.submit(event.chat_id, _handle_edited_message, event)
+        return
+
+    key = (event.chat_id, event.message.id)
+    _pending_edits[key] = event
+    timer = _edit_timers.pop(key, None)
+    if timer is not None:
+        timer.cancel()
+    _edit_timers[key] = asyncio.get_running_loop().call_later(window, _flush_edit, key)
+
+
+async def deleted_message_handler(event) -> None:
+    if RECORDER is not None:
+        RECORDER.record("deleted", event)
+    EXECUTOR.submit(event.chat_id, _handle_deleted_message, event)
 
 
 ALL_EVENTS = {
@@ -475,6 +840,21 @@ ALL_EVENTS = {
 }
 
 
+async def _comment_group_of(client: TelegramClient, forward: config.Forward, src: int) -> Optional[int]:
+    """评论来源的讨论组 ID；无法解析时返回 None"""
+    if forward.comments.source_mode == "discussion":
+        dg = forward.comments.source_discussion_group
+        if dg is None:
+            return None
+        if not isinstance(dg, int):
+            try:
+                dg = await config.get_id(client, dg)
+            except Exception:
+                return None
+        return dg
+    return await get_discussion_group_id(client, src)
+
+
 async def _setup_comment_listeners(client: TelegramClient) -> Dict[int, int]:
     comment_sources = {}
     comment_forward_map = {}
@@ -488,29 +868,240 @@ async def _setup_comment_listeners(client: TelegramClient) -> Dict[int, int]:
                 src = await config.get_id(client, forward.source)
             except Exception:
                 continue
+        if not _owns(src):
+            continue
 
-        if forward.comments.source_mode == "discussion":
-            dg = forward.comments.source_discussion_group
-            if dg is None: continue
-            if not isinstance(dg, int):
-                try: dg = await config.get_id(client, dg)
-                except Exception: continue
-            comment_sources[dg] = src
-            comment_forward_map[dg] = forward
-        else:
-            dg_id = await get_discussion_group_id(client, src)
-            if dg_id is None: continue
-            comment_sources[dg_id] = src
-            comment_forward_map[dg_id] = forward
+        dg = await _comment_group_of(client, forward, src)
+        if dg is None:
+            continue
+        comment_sources[dg] = src
+        comment_forward_map[dg] = forward
 
     return comment_sources, comment_forward_map
 
 
+def _owns(chat_id: int) -> bool:
+    """本节点（租约）或本分片（哈希）是否负责该来源"""
+    if LEASES is not None:
+        return LEASES.owns(chat_id)
+    return shard.owns(chat_id)
+
+
+def _owned_chats() -> Optional[set]:
+    """使用租约时本节点负责的来源及其讨论组；否则 None（队列中的记录全部由本进程处理）"""
+    if LEASES is None:
+        return None
+    return set(config.from_to) | set(config.comment_sources)
+
+
+def _apply_ownership() -> None:
+    if LEASES is None and not shard.is_sharded():
+        config.from_to = dict(_all_from_to)
+        config.forward_map = dict(_all_forward_map)
+        return
+    config.from_to = {src: dests for src, dests in _all_from_to.items() if _owns(src)}
+    config.forward_map = {src: fwd for src, fwd in _all_forward_map.items() if _owns(src)}
+    if LEASES is not None:
+        logging.info("🔑 节点 %s 负责 %s/%s 个来源", LEASES.node, len(config.from_to), len(_all_from_to))
+    else:
+        logging.info("🧩 分片 %s/%s 负责 %s 个来源", shard.INDEX, shard.COUNT, len(config.from_to))
+
+
+async def _load_forwards(client: TelegramClient) -> None:
+    """加载转发关系；多节点或多进程运行时只保留本节点负责的来源"""
+    global _all_from_to, _all_forward_map
+    _all_from_to = await config.load_from_to(client, CONFIG.forwards)
+    _all_forward_map = await config.load_forward_map(client, CONFIG.forwards)
+    if LEASES is not None:
+        LEASES.sources = set(_all_from_to)
+        await LEASES.refresh()
+    _apply_ownership()
+
+
+async def _on_leases_changed(client: TelegramClient) -> None:
+    _apply_ownership()
+    await _register_comment_listeners(client)
+    # 新接手的来源可能在队列中有积压
+    _dispatch_wakeup.set()
+
+
+async def _register_comment_listeners(client: TelegramClient) -> None:
+    config.comment_sources = {}
+    config.comment_forward_map = {}
+
+    has_comments = any(f.use_this and f.comments.enabled for f in CONFIG.forwards)
+    if has_comments:
+        comment_src, comment_fwd = await _setup_comment_listeners(client)
+        config.comment_sources = comment_src
+        config.comment_forward_map = comment_fwd
+    _bind_comment_handler(client)
+
+
+def _bind_comment_handler(client: TelegramClient) -> None:
+    client.remove_event_handler(comment_message_handler)
+    if config.comment_sources:
+        client.add_event_handler(
+            comment_message_handler, events.NewMessage(chats=list(config.comment_sources.keys()))
+        )
+
+
+def _drop_route(src: int) -> None:
+    _all_from_to.pop(src, None)
+    _all_forward_map.pop(src, None)
+    config.from_to.pop(src, None)
+    config.forward_map.pop(src, None)
+    for dg in [dg for dg, s in config.comment_sources.items() if s == src]:
+        del config.comment_sources[dg]
+        config.comment_forward_map.pop(dg, None)
+
+
+async def add_forward_route(client: TelegramClient, forward: config.Forward) -> int:
+    """/forward：只解析这一条转发，增量更新路由表和评论监听，返回来源 ID
+
+    解析失败时抛出异常，路由表保持不变。
+    """
+    src = await config.get_id(client, forward.source)
+    dests = list(await asyncio.gather(*(config.get_id(client, d) for d in forward.dest)))
+    dg = None
+    if forward.use_this and forward.comments.enabled:
+        dg = await _comment_group_of(client, forward, src)
+
+    # 同一来源的旧转发被替换
+    _drop_route(src)
+    if forward.use_this:
+        _all_from_to[src] = dests
+        _all_forward_map[src] = forward
+        if LEASES is not None:
+            # 新来源由某个节点在下次续约时认领
+            LEASES.sources.add(src)
+        if _owns(src):
+            config.from_to[src] = dests
+            config.forward_map[src] = forward
+            if dg is not None:
+                config.comment_sources[dg] = src
+                config.comment_forward_map[dg] = forward
+    _bind_comment_handler(client)
+    logging.info("➕ 转发路由已更新: %s → %s", src, dests)
+    return src
+
+
+async def remove_forward_route(client: TelegramClient, source: Union[int, str]) -> None:
+    """/remove：只解析被删除的来源，从路由表和评论监听中移除"""
+    src = await config.get_id(client, source)
+    _drop_route(src)
+    if LEASES is not None:
+        # 租约在下次续约时删除
+        LEASES.sources.discard(src)
+    _bind_comment_handler(client)
+    logging.info("➖ 转发路由已移除: %s", src)
+
+
+def _has_source(forward: config.Forward) -> bool:
+    return isinstance(forward.source, int) or forward.source.strip() != ""
+
+
+async def _update_forward_routes(
+    client: TelegramClient, old: List[config.Forward], new: List[config.Forward]
+) -> None:
+    """配置热更新：按来源比较新旧转发，只重建发生变化的路由
+
+    只改了 offset/end（nb past 每页都会写入）的转发不重新解析，只换成新的对象。
+    """
+    old_by_src = {f.source: f for f in old if _has_source(f)}
+    new_by_src = {f.source: f for f in new if _has_source(f)}
+    for source in old_by_src.keys() - new_by_src.keys():
+        try:
+            await remove_forward_route(client, source)
+        except Exception as e:
+            logging.error("❌ 移除转发路由失败 %s: %s", source, e)
+
+    for source, forward in new_by_src.items():
+        prev = old_by_src.get(source)
+        if prev is not None and config.same_route(prev, forward):
+            for routes in (_all_forward_map, config.forward_map, config.comment_forward_map):
+                for key, fwd in routes.items():
+                    if fwd is prev:
+                        routes[key] = forward
+            continue
+        try:
+            await add_forward_route(client, forward)
+        except Exception as e:
+            logging.error("❌ 更新转发路由失败 %s: %s", source, e)
+
+
+def _register_delete_handler(client: TelegramClient) -> None:
+    client.remove_event_handler(deleted_message_handler)
+    if CONFIG.live.delete_sync:
+        client.add_event_handler(*ALL_EVENTS["deleted"])
+
+
+async def _apply_config_update(client: TelegramClient, new_config: config.Config) -> None:
+    old_live = CONFIG.live
+    old_forwards = CONFIG.forwards
+    changed, plugins_changed = config.apply_config(new_config)
+    if not changed and not plugins_changed:
+        return
+    logging.info("🔁 配置热更新: 字段=%s 插件=%s", sorted(changed), sorted(plugins_changed))
+
+    if plugins_changed:
+        await reload_plugins(plugins_changed)
+    if "forwards" in changed:
+        await _update_forward_routes(client, old_forwards, CONFIG.forwards)
+    if "admins" in changed:
+        config.ADMINS.clear()
+        await config.load_admins(client)
+    if "live" in changed:
+        _register_delete_handler(client)
+        if old_live.sequential_updates != CONFIG.live.sequential_updates:
+            logging.warning("⚠️ sequential_updates 的修改需要重启 live 进程后生效")
+    if "login" in changed:
+        logging.warning("⚠️ 登录信息的修改需要重启 live 进程后生效")
+
+
+async def _config_watcher(client: TelegramClient) -> None:
+    """轮询配置版本（文件 mtime/size 或 Mongo version），变化时原地应用差异"""
+    version = await asyncio.to_thread(config.config_version)
+    while True:
+        await asyncio.sleep(const.CONFIG_POLL_INTERVAL)
+        try:
+            current = await asyncio.to_thread(config.config_version)
+            if current is None or current == version:
+                continue
+            # 读取失败（例如文件正写到一半）时不更新 version，下一轮重试
+            new_config = await asyncio.to_thread(config.load_config)
+            await _apply_config_update(client, new_config)
+            version = current
+        except Exception as e:
+            logging.error("❌ 配置热更新失败: %s", e)
+
+
+def _register_gauges() -> None:
+    metrics.register_gauge("send_queue", SCHEDULER.depth)
+    metrics.register_gauge("oldest_send_age", SCHEDULER.oldest_age)
+    metrics.register_gauge("handler_queue", EXECUTOR.depth)
+    metrics.register_gauge("inflight", lambda: len(_inflight))
+    metrics.register_gauge("pending_edits", lambda: len(_pending_edits))
+    metrics.register_gauge("album_cache", lambda: sum(
+        len(msgs) for group in st.GROUPED_CACHE.values() for msgs in group.values()
+    ))
+
+
 async def start_sync() -> None:
+    global _config_task, _dispatch_task, _metrics_task, _lease_task, LIVE_STORE, RECORDER, LEASES
     clean_session_files()
     await load_async_plugins()
 
-    SESSION = get_SESSION()
+    if LIVE_STORE is None:
+        LIVE_STORE = open_live_queue()
+        backlog = await LIVE_STORE.count()
+        if backlog:
+            logging.info("📦 恢复 live 队列积压 %s 条", backlog)
+
+    if RECORDER is None:
+        RECORDER = event_log.open_recorder()
+
+    # 各分片使用自己的 bot 会话文件，避免 SQLite 会话被多个进程锁住
+    SESSION = get_SESSION(default=shard.shard_file("nb_bot"))
     client = TelegramClient(SESSION, CONFIG.login.API_ID, CONFIG.login.API_HASH, sequential_updates=CONFIG.live.sequential_updates)
 
     if CONFIG.login.user_type == 0:
@@ -522,29 +1113,41 @@ async def start_sync() -> None:
         await client.start()
 
     config.is_bot = await client.is_bot()
-    logging.info(f"🤖 is_bot = {config.is_bot}")
+    logging.info("🤖 is_bot = %s", config.is_bot)
 
-    ALL_EVENTS.update(get_events())
+    if shard.is_primary():
+        ALL_EVENTS.update(get_events())
     await config.load_admins(client)
-    config.from_to = await config.load_from_to(client, CONFIG.forwards)
-    config.forward_map = await config.load_forward_map(client, CONFIG.forwards)
+    if LEASES is None:
+        LEASES = leases.open_leases()
+    await _load_forwards(client)
 
-    has_comments = any(f.use_this and f.comments.enabled for f in CONFIG.forwards)
-    if has_comments:
-        comment_src, comment_fwd = await _setup_comment_listeners(client)
-        config.comment_sources = comment_src
-        config.comment_forward_map = comment_fwd
-        if comment_src:
-            client.add_event_handler(comment_message_handler, events.NewMessage(chats=list(comment_src.keys())))
+    await _register_comment_listeners(client)
 
     for key, val in ALL_EVENTS.items():
-        if not CONFIG.live.delete_sync and key == "deleted":
+        if key == "deleted":
             continue
         client.add_event_handler(*val)
+    _register_delete_handler(client)
+
+    if _dispatch_task is None or _dispatch_task.done():
+        _dispatch_task = asyncio.create_task(_dispatcher(client))
+        _dispatch_wakeup.set()
+    if _config_task is None or _config_task.done():
+        _config_task = asyncio.create_task(_config_watcher(client))
+    if _metrics_task is None or _metrics_task.done():
+        _register_gauges()
+        _metrics_task = asyncio.create_task(metrics.publish(path=shard.shard_file(const.METRICS_FILE)))
+        await metrics.start_server()
 
-    global _queue_task
-    if _queue_task is None or _queue_task.done():
-        _queue_task = asyncio.create_task(_queue_worker())
+    if LEASES is not None and (_lease_task is None or _lease_task.done()):
+        _lease_task = asyncio.create_task(LEASES.run(functools.partial(_on_leases_changed, client)))
 
     logging.info("🟢 live 模式启动完成")
     await client.run_until_disconnected()
+    if LEASES is not None:
+        # 正常退出时立即交还租约，其他节点无需等待过期
+        try:
+            await asyncio.to_thread(LEASES.release_all)
+        except Exception as e:
+            logging.warning("⚠️ 交还租约失败: %s", e)
@@ -0,0 +1,188 @@
+"""Durable backlog of live events.
+
+Only ``(seq, chat_id, msg_id, kind)`` records are persisted, never the
+Telethon event objects, so a backlog of any size costs a few bytes per
+message and survives restarts. Records are removed once every send for
+them has finished. SQLite (WAL mode) is used locally; when
+``MONGO_CON_STR`` is set the records live in a Mongo collection next to
+the config instead; that collection is shared by all nodes, each
+dispatching only the records of the chats it owns (see ``nb.leases``).
+Every node stores every event there, so an acknowledged Mongo record is
+kept as a tombstone for ``LIVE_QUEUE_TOMBSTONE_TTL`` seconds: a slower
+node storing the same event later finds it done instead of queueing it
+again.
+
+All backend calls run on one dedicated thread, which keeps them off the
+event loop and applies them in submission order.
+"""
+
+import asyncio
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from concurrent.futures import ThreadPoolExecutor
+from typing import Collection, List, Optional, Tuple
+
+from nb import storage as stg
+from nb.const import LIVE_QUEUE_FILE, LIVE_QUEUE_TOMBSTONE_TTL
+from nb.shard import shard_file
+
+Record = Tuple[int, int, str]
+
+_last_seq = 0
+
+
+def next_seq() -> int:
+    """Return a strictly increasing sequence number that survives restarts."""
+    global _last_seq
+    _last_seq = max(_last_seq + 1, time.time_ns())
+    return _last_seq
+
+
+class LiveQueue(ABC):
+    """Base class of the durable queue backends."""
+
+    def __init__(self) -> None:
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nb-queue")
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def put(self, seq: int, chat_id: int, msg_id: int, kind: str) -> None:
+        await self._run(self._put, seq, chat_id, msg_id, kind)
+
+    async def ack(self, chat_id: int, msg_id: int, kind: str) -> None:
+        await self._run(self._ack, chat_id, msg_id, kind)
+
+    async def pending(
+        self,
+        limit: int,
+        chats: Optional[Collection[int]] = None,
+        exclude: Collection[int] = (),
+    ) -> List[Record]:
+        """Return up to ``limit`` unacknowledged records, oldest first.
+
+        Only records of ``chats`` if given, and none of the chats in ``exclude``.
+        """
+        return await self._run(self._pending, limit, chats, exclude)
+
+    async def count(self) -> int:
+        return await self._run(self._count)
+
+    @abstractmethod
+    def _put(self, seq: int, chat_id: int, msg_id: int, kind: str) -> None:
+        ...
+
+    @abstractmethod
+    def _ack(self, chat_id: int, msg_id: int, kind: str) -> None:
+        ...
+
+    @abstractmethod
+    def _pending(self, limit: int, chats: Optional[Collection[int]], exclude: Collection[int]) -> List[Record]:
+        ...
+
+    @abstractmethod
+    def _count(self) -> int:
+        ...
+
+
+class SqliteLiveQueue(LiveQueue):
+    def __init__(self, path: str = LIVE_QUEUE_FILE) -> None:
+        super().__init__()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS live_queue ("
+            " seq INTEGER PRIMARY KEY,"
+            " chat_id INTEGER NOT NULL,"
+            " msg_id INTEGER NOT NULL,"
+            " kind TEXT NOT NULL,"
+            " UNIQUE (chat_id, msg_id, kind))"
+        )
+
+    def _put(self, seq: int, chat_id: int, msg_id: int, kind: str) -> None:
+        self.conn.execute(
+            "INSERT OR IGNORE INTO live_queue (seq, chat_id, msg_id, kind) VALUES (?, ?, ?, ?)",
+            (seq, chat_id, msg_id, kind),
+        )
+
+    def _ack(self, chat_id: int, msg_id: int, kind: str) -> None:
+        self.conn.execute(
+            "DELETE FROM live_queue WHERE chat_id = ? AND msg_id = ? AND kind = ?",
+            (chat_id, msg_id, kind),
+        )
+
+    def _pending(self, limit: int, chats: Optional[Collection[int]], exclude: Collection[int]) -> List[Record]:
+        where = []
+        params = []
+        if chats is not None:
+            where.append(f"chat_id IN ({','.join('?' * len(chats))})")
+            params.extend(chats)
+        if exclude:
+            where.append(f"chat_id NOT IN ({','.join('?' * len(exclude))})")
+            params.extend(exclude)
+        sql = "SELECT chat_id, msg_id, kind FROM live_queue"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        rows = self.conn.execute(sql + " ORDER BY seq LIMIT ?", (*params, limit))
+        return [tuple(row) for row in rows]
+
+    def _count(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM live_queue").fetchone()[0]
+
+
+class MongoLiveQueue(LiveQueue):
+    def __init__(self, collection) -> None:
+        super().__init__()
+        self.col = collection
+        self.col.create_index("seq")
+        self.col.create_index([("chat_id", 1), ("seq", 1)])
+        # mongo removes tombstones once they are older than the TTL
+        self.col.create_index("done_at", expireAfterSeconds=int(LIVE_QUEUE_TOMBSTONE_TTL))
+
+    def _put(self, seq: int, chat_id: int, msg_id: int, kind: str) -> None:
+        self.col.update_one(
+            {"_id": f"{chat_id}:{msg_id}:{kind}"},
+            {"$setOnInsert": {"seq": seq, "chat_id": chat_id, "msg_id": msg_id, "kind": kind}},
+            upsert=True,
+        )
+
+    def _ack(self, chat_id: int, msg_id: int, kind: str) -> None:
+        # keep a tombstone, so a late _put of the same event is a no-op
+        self.col.update_one(
+            {"_id": f"{chat_id}:{msg_id}:{kind}"},
+            {"$set": {"done": True, "done_at": datetime.now(timezone.utc)}},
+        )
+
+    def _pending(self, limit: int, chats: Optional[Collection[int]], exclude: Collection[int]) -> List[Record]:
+        query = {"done": {"$ne": True}}
+        chat_query = {}
+        if chats is not None:
+            chat_query["$in"] = list(chats)
+        if exclude:
+            chat_query["$nin"] = list(exclude)
+        if chat_query:
+            query["chat_id"] = chat_query
+        docs = self.col.find(query, {"chat_id": 1, "msg_id": 1, "kind": 1}).sort("seq", 1).limit(limit)
+        return [(doc["chat_id"], doc["msg_id"], doc["kind"]) for doc in docs]
+
+    def _count(self) -> int:
+        return self.col.count_documents({"done": {"$ne": True}})
+
+
+def open_live_queue() -> LiveQueue:
+    """Open the durable queue on the same backend as the config.
+
+    The SQLite queue is one per shard; the Mongo queue is shared by every node.
+    """
+    if stg.CONFIG_TYPE == 2 and stg.mycol is not None:
+        col = stg.mycol.database[f"{stg.mycol.name}-queue"]
+        logging.info("Using mongo collection %s for the live queue", col.name)
+        return MongoLiveQueue(col)
+    path = shard_file(LIVE_QUEUE_FILE)
+    logging.info("Using %s for the live queue", path)
+    return SqliteLiveQueue(path)
@@ -0,0 +1,216 @@
+"""Worker log pipeline: rotated JSON-lines files and an incremental reader.
+
+The worker started from the web UI logs through ``setup_worker_logging``.
+Records are rate limited per call site, handed to a queue, and a
+background thread formats them as JSON lines into a
+``CompressedRotatingFileHandler``. ``logs.txt`` never grows past
+``LOG_MAX_BYTES`` and at most ``LOG_BACKUP_COUNT`` compressed backups are
+kept. The event loop only pays for the rate check and a queue put.
+
+The Run page follows the file with ``LogTail``, which only reads the
+bytes appended since its last poll. With ``nb live --workers N`` every
+worker writes its own ``logs.<i>.txt`` next to the supervisor's
+``logs.txt``; ``worker_log_files`` lists them.
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import time
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Deque, Dict, List, Optional, Tuple
+
+from nb.const import (
+    LOG_BACKUP_COUNT,
+    LOG_MAX_BYTES,
+    LOG_RATE_LIMIT,
+    LOG_RATE_WINDOW,
+)
+
+TAIL_MAX_BYTES = 64 * 1024
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that gzips every rotated file."""
+
+    def __init__(
+        self,
+        filename: str,
+        max_bytes: int = LOG_MAX_BYTES,
+        backup_count: int = LOG_BACKUP_COUNT,
+    ) -> None:
+        super().__init__(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf8"
+        )
+        self.namer = lambda name: f"{name}.gz"
+        self.rotator = _gzip_rotator
+
+
+class JsonFormatter(logging.Formatter):
+    """One compact JSON object per record."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "t": round(record.created, 3),
+            "lvl": record.levelname,
+            "msg": record.getMessage(),
+            "at": f"{record.module}:{record.lineno}",
+        }
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            data["suppressed"] = suppressed
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most ``rate`` records per call site every ``window`` seconds.
+
+    Errors always pass. The number of dropped records is attached to the
+    next record of the same call site that gets through.
+    """
+
+    def __init__(self, rate: int = LOG_RATE_LIMIT, window: float = LOG_RATE_WINDOW) -> None:
+        super().__init__()
+        self.rate = rate
+        self.window = window
+        # (path, line) -> [window start, records let through, records dropped]
+        self.sites: Dict[Tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        site = self.sites.get(key)
+        if site is None or record.created - site[0] >= self.window:
+            if site is not None and site[2]:
+                record.suppressed = site[2]
+            self.sites[key] = [record.created, 1, 0]
+            return True
+        if site[1] < self.rate:
+            site[1] += 1
+            return True
+        site[2] += 1
+        return False
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """Hand records to the writer thread without formatting them first.
+
+    The queue never leaves the process, so the record can be passed as is
+    and the ``%`` arguments are only merged by the writer thread.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_listener: Optional[QueueListener] = None
+
+
+def setup_worker_logging(path: str, level: int) -> None:
+    """Route all logging through a queue into a rotated JSON-lines file."""
+    global _listener
+    stop_worker_logging()
+    handler = CompressedRotatingFileHandler(path)
+    handler.setFormatter(JsonFormatter())
+    records: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    queue_handler = _DeferredQueueHandler(records)
+    queue_handler.addFilter(RateLimitFilter())
+    _listener = QueueListener(records, handler)
+    _listener.start()
+    logging.basicConfig(level=level, handlers=[queue_handler], force=True)
+
+
+@atexit.register
+def stop_worker_logging() -> None:
+    """Write out everything still queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def format_line(line: str) -> str:
+    """Render one JSON log line for humans; other lines pass through."""
+    if not line.startswith("{"):
+        return line
+    try:
+        data = json.loads(line)
+        text = (
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(data['t']))} "
+            f"{data['lvl']} {data['msg']}"
+        )
+    except (ValueError, KeyError, TypeError):
+        return line
+    if data.get("suppressed"):
+        text += f" (+{data['suppressed']} 条同类日志已省略)"
+    if data.get("exc"):
+        text += "\n" + data["exc"]
+    return text
+
+
+def worker_log_files(path: str) -> List[str]:
+    """``path`` followed by the per-worker files of a supervisor run, by worker index."""
+    root, ext = os.path.splitext(path)
+    pattern = re.compile(re.escape(os.path.basename(root)) + r"\.(\d+)" + re.escape(ext) + "$")
+    workers = []
+    for name in os.listdir(os.path.dirname(path) or "."):
+        match = pattern.match(name)
+        if match:
+            workers.append((int(match.group(1)), os.path.join(os.path.dirname(path), name)))
+    return [path] + [name for _, name in sorted(workers)]
+
+
+class LogTail:
+    """Keep the last ``max_lines`` lines of a growing, rotating log file.
+
+    Every ``poll`` reads only what was appended since the previous one,
+    and never more than the last ``TAIL_MAX_BYTES``, so the cost does not
+    depend on the size of the file. A rotated or truncated file is
+    detected by its inode and size, and read again from the start.
+    """
+
+    def __init__(self, path: str, max_lines: int = 100) -> None:
+        self.path = path
+        self.lines: Deque[str] = deque(maxlen=max_lines)
+        self.offset = 0
+        self.inode = None
+
+    def poll(self) -> List[str]:
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return list(self.lines)
+        if stat.st_ino != self.inode or stat.st_size < self.offset:
+            self.inode = stat.st_ino
+            self.offset = 0
+            self.lines.clear()
+        if stat.st_size == self.offset:
+            return list(self.lines)
+
+        start = max(self.offset, stat.st_size - TAIL_MAX_BYTES)
+        with open(self.path, "rb") as file:
+            file.seek(start)
+            data = file.read(stat.st_size - start)
+        if start > self.offset:
+            # skipped ahead: drop the partial first line
+            data = data[data.find(b"\n") + 1 :]
+        # leave an unfinished last line for the next poll
+        end = data.rfind(b"\n") + 1
+        self.offset = stat.st_size - (len(data) - end)
+        self.lines.extend(map(format_line, data[:end].decode("utf8", "replace").splitlines()))
+        return list(self.lines)
@@ -0,0 +1,299 @@
+"""Persistent message id mappings.
+
+Keeps the source -> destination message ids behind ``storage.stored``,
+``post_id_mapping``, ``comment_msg_mapping`` and
+``discussion_to_channel_post`` in a local SQLite database (WAL mode), so
+reply threading, edit/delete sync and comment forwarding keep working for
+everything forwarded before a restart.
+
+When the config lives in Mongo the mappings are kept in Mongo collections
+next to it instead, shared by every node: a node that takes over a source
+through ``nb.leases`` keeps syncing edits, deletes, replies and comments
+of what the previous owner forwarded.
+
+The in-memory dicts in ``nb.storage`` stay in front as a hot cache; this
+module is only consulted on a cache miss. The ``a*`` read methods run the
+Mongo queries in a worker thread; the local SQLite file is read inline. Writes are buffered and flushed
+in one batch once ``FLUSH_ROWS`` rows are pending or ``FLUSH_INTERVAL``
+seconds have passed. Reads do not flush: anything still buffered is
+recent enough to be in the hot cache.
+"""
+
+import asyncio
+import atexit
+import logging
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Set, Tuple
+
+from nb.const import MAPPING_DB_FILE
+
+FLUSH_ROWS = 200
+FLUSH_INTERVAL = 1.0
+# several workers (nb live --workers) and nb past write the same file
+BUSY_TIMEOUT_MS = 10000
+
+# kinds of message mappings
+STORED = "stored"
+POST = "post"
+COMMENT = "comment"
+
+
+class MappingStore(ABC):
+    """Write buffering shared by the backends."""
+
+    # errors after which a flush is retried
+    errors: Tuple[type, ...] = ()
+
+    def __init__(self) -> None:
+        self._messages: List[Tuple[str, int, int, int, int]] = []
+        self._discussions: List[Tuple[int, int, int]] = []
+        self._last_flush = time.monotonic()
+        self._flush_scheduled = False
+
+    # ------------------------------------------------------------ writes
+
+    def put(self, kind: str, src_chat: int, src_msg: int, dest_chat: int, dest_msg: int) -> None:
+        self._messages.append((kind, src_chat, src_msg, dest_chat, dest_msg))
+        self._maybe_flush()
+
+    def put_discussion(self, discussion_id: int, top_id: int, channel_post: int) -> None:
+        self._discussions.append((discussion_id, top_id, channel_post))
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        pending = len(self._messages) + len(self._discussions)
+        if pending >= FLUSH_ROWS or time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+        else:
+            # make sure a quiet period still gets its writes on disk
+            self._schedule_flush()
+
+    def _schedule_flush(self) -> None:
+        if self._flush_scheduled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._flush_scheduled = True
+        loop.call_later(FLUSH_INTERVAL, self.flush)
+
+    def flush(self) -> None:
+        self._flush_scheduled = False
+        self._last_flush = time.monotonic()
+        if not self._messages and not self._discussions:
+            return
+        messages, self._messages = self._messages, []
+        discussions, self._discussions = self._discussions, []
+        try:
+            self._write(messages, discussions)
+        except self.errors as err:
+            # 放回缓冲区，下次刷新时重试（例如其他进程正持有写锁）
+            self._messages = messages + self._messages
+            self._discussions = discussions + self._discussions
+            self._schedule_flush()
+            logging.error("❌ 映射数据库写入失败，稍后重试: %s", err)
+
+    @abstractmethod
+    def _write(self, messages: List[Tuple[str, int, int, int, int]], discussions: List[Tuple[int, int, int]]) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, kind: str, src_chat: int, src_msg: int) -> None:
+        ...
+
+    # ------------------------------------------------------------- reads
+
+    @abstractmethod
+    def get(self, kind: str, src_chat: int, src_msg: int) -> Dict[int, int]:
+        """Return ``{dest_chat: dest_msg}`` for one source message."""
+
+    @abstractmethod
+    def sources_of(self, kind: str, src_msg: int) -> Set[int]:
+        """Source chats that have a mapping for a message with this id."""
+
+    @abstractmethod
+    def find_source(self, kind: str, dest_chat: int, dest_msg: int) -> Optional[Tuple[int, int]]:
+        """Reverse lookup: the source message a destination message came from."""
+
+    @abstractmethod
+    def get_discussion(self, discussion_id: int, top_id: int) -> Optional[int]:
+        ...
+
+    # ------------------------------------------------------- async reads
+
+    # a remote backend is queried in a worker thread, off the event loop
+    blocking_reads = False
+
+    async def _read(self, func, *args):
+        if self.blocking_reads:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def aget(self, kind: str, src_chat: int, src_msg: int) -> Dict[int, int]:
+        return await self._read(self.get, kind, src_chat, src_msg)
+
+    async def asources_of(self, kind: str, src_msg: int) -> Set[int]:
+        return await self._read(self.sources_of, kind, src_msg)
+
+    async def aget_discussion(self, discussion_id: int, top_id: int) -> Optional[int]:
+        return await self._read(self.get_discussion, discussion_id, top_id)
+
+
+class MappingDB(MappingStore):
+    errors = (sqlite3.Error,)
+
+    def __init__(self, path: str = MAPPING_DB_FILE) -> None:
+        super().__init__()
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                kind TEXT NOT NULL,
+                src_chat INTEGER NOT NULL,
+                src_msg INTEGER NOT NULL,
+                dest_chat INTEGER NOT NULL,
+                dest_msg INTEGER NOT NULL,
+                PRIMARY KEY (kind, src_chat, src_msg, dest_chat)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS messages_by_src_msg ON messages (kind, src_msg);
+            CREATE INDEX IF NOT EXISTS messages_by_dest ON messages (kind, dest_chat, dest_msg);
+            CREATE TABLE IF NOT EXISTS discussions (
+                discussion_id INTEGER NOT NULL,
+                top_id INTEGER NOT NULL,
+                channel_post INTEGER NOT NULL,
+                PRIMARY KEY (discussion_id, top_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS discussions_by_post ON discussions (channel_post);
+            """
+        )
+
+    def _write(self, messages, discussions) -> None:
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?)", messages
+            )
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO discussions VALUES (?, ?, ?)", discussions
+            )
+
+    def delete(self, kind: str, src_chat: int, src_msg: int) -> None:
+        self.flush()
+        with self.conn:
+            self.conn.execute(
+                "DELETE FROM messages WHERE kind = ? AND src_chat = ? AND src_msg = ?",
+                (kind, src_chat, src_msg),
+            )
+
+    def get(self, kind: str, src_chat: int, src_msg: int) -> Dict[int, int]:
+        rows = self.conn.execute(
+            "SELECT dest_chat, dest_msg FROM messages"
+            " WHERE kind = ? AND src_chat = ? AND src_msg = ?",
+            (kind, src_chat, src_msg),
+        )
+        return dict(rows)
+
+    def sources_of(self, kind: str, src_msg: int) -> Set[int]:
+        rows = self.conn.execute(
+            "SELECT DISTINCT src_chat FROM messages WHERE kind = ? AND src_msg = ?",
+            (kind, src_msg),
+        )
+        return {row[0] for row in rows}
+
+    def find_source(self, kind: str, dest_chat: int, dest_msg: int) -> Optional[Tuple[int, int]]:
+        return self.conn.execute(
+            "SELECT src_chat, src_msg FROM messages"
+            " WHERE kind = ? AND dest_chat = ? AND dest_msg = ? LIMIT 1",
+            (kind, dest_chat, dest_msg),
+        ).fetchone()
+
+    def get_discussion(self, discussion_id: int, top_id: int) -> Optional[int]:
+        row = self.conn.execute(
+            "SELECT channel_post FROM discussions WHERE discussion_id = ? AND top_id = ?",
+            (discussion_id, top_id),
+        ).fetchone()
+        return row[0] if row else None
+
+
+class MongoMappingDB(MappingStore):
+    """The same mappings in two Mongo collections, shared by every node."""
+
+    blocking_reads = True
+
+    def __init__(self, messages, discussions) -> None:
+        from pymongo.errors import PyMongoError
+
+        super().__init__()
+        self.errors = (PyMongoError,)
+        self.messages = messages
+        self.discussions = discussions
+        self.messages.create_index([("kind", 1), ("src_chat", 1), ("src_msg", 1)])
+        self.messages.create_index([("kind", 1), ("src_msg", 1)])
+        self.messages.create_index([("kind", 1), ("dest_chat", 1), ("dest_msg", 1)])
+
+    def _write(self, messages, discussions) -> None:
+        from pymongo import UpdateOne
+
+        if messages:
+            self.messages.bulk_write([
+                UpdateOne(
+                    {"_id": f"{kind}:{src_chat}:{src_msg}:{dest_chat}"},
+                    {"$set": {
+                        "kind": kind, "src_chat": src_chat, "src_msg": src_msg,
+                        "dest_chat": dest_chat, "dest_msg": dest_msg,
+                    }},
+                    upsert=True,
+                )
+                for kind, src_chat, src_msg, dest_chat, dest_msg in messages
+            ])
+        if discussions:
+            self.discussions.bulk_write([
+                UpdateOne({"_id": f"{discussion_id}:{top_id}"}, {"$set": {"channel_post": channel_post}}, upsert=True)
+                for discussion_id, top_id, channel_post in discussions
+            ])
+
+    def delete(self, kind: str, src_chat: int, src_msg: int) -> None:
+        self.flush()
+        self.messages.delete_many({"kind": kind, "src_chat": src_chat, "src_msg": src_msg})
+
+    def get(self, kind: str, src_chat: int, src_msg: int) -> Dict[int, int]:
+        docs = self.messages.find(
+            {"kind": kind, "src_chat": src_chat, "src_msg": src_msg}, {"dest_chat": 1, "dest_msg": 1}
+        )
+        return {doc["dest_chat"]: doc["dest_msg"] for doc in docs}
+
+    def sources_of(self, kind: str, src_msg: int) -> Set[int]:
+        return set(self.messages.distinct("src_chat", {"kind": kind, "src_msg": src_msg}))
+
+    def find_source(self, kind: str, dest_chat: int, dest_msg: int) -> Optional[Tuple[int, int]]:
+        doc = self.messages.find_one({"kind": kind, "dest_chat": dest_chat, "dest_msg": dest_msg})
+        return (doc["src_chat"], doc["src_msg"]) if doc else None
+
+    def get_discussion(self, discussion_id: int, top_id: int) -> Optional[int]:
+        doc = self.discussions.find_one({"_id": f"{discussion_id}:{top_id}"})
+        return doc["channel_post"] if doc else None
+
+
+_db: Optional[MappingStore] = None
+
+
+def get_db() -> MappingStore:
+    """Open the mapping database on first use, on the same backend as the config."""
+    global _db
+    if _db is None:
+        from nb import storage as stg
+
+        if stg.CONFIG_TYPE == 2 and stg.mycol is not None:
+            db = stg.mycol.database
+            _db = MongoMappingDB(db[f"{stg.mycol.name}-mappings"], db[f"{stg.mycol.name}-discussions"])
+            logging.info("Using mongo collection %s-mappings for message mappings", stg.mycol.name)
+        else:
+            _db = MappingDB()
+            logging.info("Using %s for message mappings", MAPPING_DB_FILE)
+        atexit.register(_db.flush)
+    return _db
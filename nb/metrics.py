@@ -0,0 +1,305 @@
+"""Runtime metrics of the worker.
+
+Handlers, the send scheduler and the plugin chain record counters and
+timing samples here. ``publish`` writes a compact JSON snapshot to
+``METRICS_FILE`` every ``METRICS_INTERVAL`` seconds, which the web UI
+reads to chart throughput.
+
+When ``NB_METRICS_PORT`` is set, ``start_server`` also serves the same
+data as Prometheus counters, gauges and histograms on ``/metrics``.
+Recording is a dict lookup plus an addition (and a bisect for
+histograms), cheap enough to leave on.
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from nb.const import METRICS_FILE, METRICS_INTERVAL, METRICS_PORT_ENV_VAR
+
+# 每类耗时只保留最近的样本，分位数按这些样本计算
+SAMPLE_SIZE = 1000
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+FLOOD_WAIT_BUCKETS = (1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{k}="{v}"' for k, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    def __init__(self, name: str, doc: str, labels: Sequence[str] = ()) -> None:
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.values: Dict[Tuple[str, ...], float] = defaultdict(float)
+        _instruments.append(self)
+
+    def inc(self, *labels: Any, value: float = 1.0) -> None:
+        self.values[tuple(map(str, labels))] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def set(self, value: float, *labels: Any) -> None:
+        self.values[tuple(map(str, labels))] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, doc: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> None:
+        self.name, self.doc, self.labels = name, doc, tuple(labels)
+        self.buckets = tuple(buckets)
+        # labels -> [per bucket counts (last one is +Inf), sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+        _instruments.append(self)
+
+    def observe(self, value: float, *labels: Any) -> None:
+        key = tuple(map(str, labels))
+        series = self.series.get(key)
+        if series is None:
+            series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total) in self.series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+_instruments: List[Any] = []
+
+SENDS = Counter("nb_sends_total", "Send attempts by destination and outcome.", ["dest", "outcome"])
+SEND_SECONDS = Histogram("nb_send_seconds", "Time one send took.")
+QUEUE_WAIT_SECONDS = Histogram("nb_send_queue_wait_seconds", "Time a send waited in its lane.")
+FLOOD_WAITS = Histogram("nb_flood_wait_seconds", "FloodWaitError durations.", buckets=FLOOD_WAIT_BUCKETS)
+PLUGIN_SECONDS = Histogram("nb_plugin_seconds", "Plugin time per message.", ["plugin"])
+MESSAGES = Counter("nb_messages_total", "Messages by source chat and direction.", ["source", "direction"])
+MEDIA_BYTES = Counter("nb_media_bytes_total", "Media bytes transferred.", ["direction"])
+VALUES = Gauge("nb_value", "Sampled values (queues, caches, past offset lag).", ["name", "key"])
+
+started_at = time.time()
+
+# per source chat
+messages_in: Dict[int, int] = defaultdict(int)
+messages_out: Dict[int, int] = defaultdict(int)
+send_errors: Dict[int, int] = defaultdict(int)
+
+# flood_wait_seconds, bytes_up, bytes_down
+counters: Dict[str, float] = defaultdict(float)
+
+send_latency: Deque[float] = deque(maxlen=SAMPLE_SIZE)
+queue_wait: Deque[float] = deque(maxlen=SAMPLE_SIZE)
+plugin_timings: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=SAMPLE_SIZE))
+
+gauges: Dict[str, Callable[[], float]] = {}
+
+
+def record_in(chat_id: int) -> None:
+    messages_in[chat_id] += 1
+    MESSAGES.inc(chat_id, "in")
+
+
+def record_out(chat_id: int, ok: bool = True) -> None:
+    if ok:
+        messages_out[chat_id] += 1
+        MESSAGES.inc(chat_id, "out")
+    else:
+        send_errors[chat_id] += 1
+        MESSAGES.inc(chat_id, "error")
+
+
+def record_send(waited: float, took: float) -> None:
+    """One finished send job: time spent queued and time the send took."""
+    queue_wait.append(waited)
+    send_latency.append(took)
+    QUEUE_WAIT_SECONDS.observe(waited)
+    SEND_SECONDS.observe(took)
+
+
+def record_outcome(dest: int, outcome: str) -> None:
+    """Outcome of one send attempt: ok, error or flood_wait."""
+    SENDS.inc(dest, outcome)
+
+
+def record_flood_wait(seconds: float) -> None:
+    counters["flood_wait_seconds"] += seconds
+    FLOOD_WAITS.observe(seconds)
+
+
+def record_plugin(pid: str, seconds: float) -> None:
+    plugin_timings[pid].append(seconds)
+    PLUGIN_SECONDS.observe(seconds, pid)
+
+
+def record_bytes(direction: str, size: int) -> None:
+    """direction is "up" or "down"."""
+    counters[f"bytes_{direction}"] += size
+    MEDIA_BYTES.inc(direction, value=size)
+
+
+def set_value(name: str, value: float, key: Any = "") -> None:
+    """Set a sampled value that is pushed rather than polled, e.g. offset lag."""
+    VALUES.set(value, name, key)
+
+
+def register_gauge(name: str, func: Callable[[], float]) -> None:
+    """Sample ``func()`` into every snapshot, e.g. a queue length."""
+    gauges[name] = func
+
+
+def percentiles(samples: Iterable[float]) -> Dict[str, float]:
+    values = sorted(samples)
+    if not values:
+        return {"count": 0}
+
+    def pick(q: float) -> float:
+        return values[min(len(values) - 1, int(q * len(values)))]
+
+    return {
+        "count": len(values),
+        "p50": pick(0.5),
+        "p90": pick(0.9),
+        "p99": pick(0.99),
+        "max": values[-1],
+    }
+
+
+def snapshot() -> Dict[str, Any]:
+    sampled = {}
+    for name, func in gauges.items():
+        try:
+            sampled[name] = func()
+        except Exception:
+            continue
+    return {
+        "time": time.time(),
+        "started_at": started_at,
+        "pid": os.getpid(),
+        "messages_in": {str(k): v for k, v in messages_in.items()},
+        "messages_out": {str(k): v for k, v in messages_out.items()},
+        "send_errors": {str(k): v for k, v in send_errors.items()},
+        "counters": dict(counters),
+        "gauges": sampled,
+        "send_latency": percentiles(send_latency),
+        "queue_wait": percentiles(queue_wait),
+        "plugins": {pid: percentiles(samples) for pid, samples in plugin_timings.items()},
+    }
+
+
+def write_snapshot(path: str = METRICS_FILE) -> None:
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf8") as file:
+        json.dump(snapshot(), file)
+    os.replace(tmp, path)
+
+
+async def publish(interval: float = METRICS_INTERVAL, path: str = METRICS_FILE) -> None:
+    """Write a snapshot every ``interval`` seconds until cancelled."""
+    while True:
+        try:
+            write_snapshot(path)
+        except Exception as e:
+            logging.warning("⚠️ 写入监控数据失败: %s", e)
+        await asyncio.sleep(interval)
+
+
+def read_snapshot(path: str = METRICS_FILE) -> Dict[str, Any]:
+    """Read the last published snapshot; empty if the worker never wrote one."""
+    try:
+        with open(path, encoding="utf8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def track_send(send: Callable) -> Callable:
+    """Wrap an async ``send(dest, ...)`` to record its outcome and duration."""
+
+    async def wrapper(dest, *args, **kwargs):
+        started = time.monotonic()
+        try:
+            result = await send(dest, *args, **kwargs)
+        except Exception as e:
+            record_outcome(dest, "flood_wait" if hasattr(e, "seconds") else "error")
+            raise
+        took = time.monotonic() - started
+        record_outcome(dest, "ok")
+        send_latency.append(took)
+        SEND_SECONDS.observe(took)
+        return result
+
+    return wrapper
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    for name, func in gauges.items():
+        try:
+            VALUES.set(func(), name, "")
+        except Exception:
+            continue
+    lines: List[str] = []
+    for instrument in _instruments:
+        lines.extend(instrument.render())
+    return "\n".join(lines) + "\n"
+
+
+async def _handle_scrape(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    try:
+        request = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request.split()
+        if len(parts) > 1 and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            "Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            "Connection: close\r\n\r\n".encode()
+            + body
+        )
+        await writer.drain()
+    except Exception as e:
+        logging.debug("metrics scrape failed: %s", e)
+    finally:
+        writer.close()
+
+
+async def start_server() -> Optional[asyncio.AbstractServer]:
+    """Serve /metrics on NB_METRICS_PORT; does nothing when it is not set."""
+    port = os.getenv(METRICS_PORT_ENV_VAR)
+    if not port:
+        return None
+    server = await asyncio.start_server(_handle_scrape, "0.0.0.0", int(port))
+    logging.info("📈 Prometheus 指标已开启: http://0.0.0.0:%s/metrics", port)
+    return server
@@ -4,17 +4,23 @@ import asyncio
 import logging
 import random
 from collections import defaultdict
-from typing import List, Dict, Optional
+from typing import AsyncIterator, List, Dict, Optional, Tuple
 
 from telethon import TelegramClient
 from telethon.errors.rpcerrorlist import FloodWaitError, MsgIdInvalidError
 from telethon.tl.custom.message import Message
 from telethon.tl.patched import MessageService
 
-from nb import config
+from nb import config, const, metrics, rate_limit
 from nb import storage as st
 from nb.config import CONFIG, get_SESSION, write_config
-from nb.plugins import apply_plugins, apply_plugins_to_group, load_async_plugins
+from nb.plugins import (
+    NbMessage,
+    apply_plugins,
+    apply_plugins_batch,
+    apply_plugins_to_group,
+    load_async_plugins,
+)
 from nb.utils import (
     clean_session_files,
     send_message,
@@ -27,6 +33,9 @@ from nb.utils import (
     resolve_bot_media_from_message,
 )
 
+# 记录每次发送的目标、结果与耗时；与其他进程共享账号的发送速率
+send_message = rate_limit.limit_send(metrics.track_send(send_message))
+
 
 def _extract_msg_id(fwded) -> Optional[int]:
     if fwded is None:
@@ -68,24 +77,24 @@ async def _collect_bot_media_from_comments(
     forward,
 ) -> List[Message]:
     if not _bot_media_allowed(forward):
-        logging.info(f"🤖 bot_media 未启用, 跳过 post={src_post_id}")
+        logging.info("🤖 bot_media 未启用, 跳过 post=%s", src_post_id)
         return []
 
-    logging.info(f"🤖 开始获取讨论消息 channel={src_channel_id} post={src_post_id}")
+    logging.info("🤖 开始获取讨论消息 channel=%s post=%s", src_channel_id, src_post_id)
 
     try:
         disc_msg = await get_discussion_message(client, src_channel_id, src_post_id)
     except Exception as e:
-        logging.warning(f"⚠️ 获取讨论消息异常 post={src_post_id}: {e}")
+        logging.warning("⚠️ 获取讨论消息异常 post=%s: %s", src_post_id, e)
         return []
 
     if disc_msg is None:
-        logging.info(f"🤖 帖子 {src_post_id} 无讨论消息, 跳过")
+        logging.info("🤖 帖子 %s 无讨论消息, 跳过", src_post_id)
         return []
 
     src_discussion_id = disc_msg.chat_id
     src_top_id = disc_msg.id
-    logging.info(f"🤖 讨论组={src_discussion_id} top_id={src_top_id}")
+    logging.info("🤖 讨论组=%s top_id=%s", src_discussion_id, src_top_id)
 
     comment_count = 0
     collected: List[Message] = []
@@ -95,37 +104,38 @@ async def _collect_bot_media_from_comments(
             src_discussion_id, reply_to=src_top_id, reverse=True,
         ):
             if isinstance(comment, MessageService):
-                logging.debug(f"🤖 跳过 MessageService #{comment.id}")
+                logging.debug("🤖 跳过 MessageService #%s", comment.id)
                 continue
 
             comment_count += 1
-            text_preview = (comment.raw_text or comment.text or "")[:150]
-            has_markup = comment.reply_markup is not None
-            sender_id = comment.sender_id
-            fwd = comment.fwd_from
-            logging.info(
-                f"🤖 评论#{comment.id} sender={sender_id} fwd={fwd is not None} "
-                f"markup={has_markup} text={text_preview!r}"
-            )
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info(
+                    "🤖 评论#%s sender=%s fwd=%s markup=%s text=%r",
+                    comment.id,
+                    comment.sender_id,
+                    comment.fwd_from is not None,
+                    comment.reply_markup is not None,
+                    (comment.raw_text or comment.text or "")[:150],
+                )
 
             try:
                 bot_media = await resolve_bot_media_from_message(client, comment, forward)
             except Exception as e:
-                logging.warning(f"⚠️ 评论#{comment.id} bot媒体解析异常: {e}")
+                logging.warning("⚠️ 评论#%s bot媒体解析异常: %s", comment.id, e)
                 bot_media = []
 
             if bot_media:
-                logging.info(f"🤖 ✅ 评论#{comment.id} 命中 {len(bot_media)} 条bot媒体")
+                logging.info("🤖 ✅ 评论#%s 命中 %s 条bot媒体", comment.id, len(bot_media))
                 collected.extend(bot_media)
             else:
-                logging.debug(f"🤖 评论#{comment.id} 无bot媒体")
+                logging.debug("🤖 评论#%s 无bot媒体", comment.id)
     except MsgIdInvalidError as e:
-        logging.warning(f"⚠️ 讨论区消息 ID 无效, 跳过评论拉取 post={src_post_id}: {e}")
+        logging.warning("⚠️ 讨论区消息 ID 无效, 跳过评论拉取 post=%s: %s", src_post_id, e)
         return []
 
     logging.info(
-        f"🤖 评论区扫描完成 post={src_post_id}: "
-        f"{comment_count} 条评论, 收集 {len(collected)} 条媒体"
+        "🤖 评论区扫描完成 post=%s: %s 条评论, 收集 %s 条媒体",
+        src_post_id, comment_count, len(collected),
     )
     return _dedupe_messages(collected) if collected else []
 
@@ -158,7 +168,7 @@ async def _send_combined_album(
             if fwded_id is not None:
                 st.add_post_mapping(src, first_msg_id, d, fwded_id)
         except Exception as e:
-            logging.critical(f"🚨 合并媒体组播失败: {e}")
+            logging.critical("🚨 合并媒体组播失败: %s", e)
     for tm in tms:
         tm.clear()
     return True
@@ -240,7 +250,7 @@ async def _send_past_grouped(
                 if fwded_id is not None:
                     st.add_post_mapping(src, first_msg_id, d, fwded_id)
             except Exception as e:
-                logging.critical(f"🚨 bot 媒体组播失败: {e}")
+                logging.critical("🚨 bot 媒体组播失败: %s", e)
         return True
     tms = await apply_plugins_to_group(messages)
     if not tms:
@@ -270,7 +280,7 @@ async def _send_past_grouped(
                 st.add_post_mapping(src, first_msg_id, d, fwded_id)
 
         except Exception as e:
-            logging.critical(f"🚨 组播失败: {e}")
+            logging.critical("🚨 组播失败: %s", e)
 
     return True
 
@@ -295,10 +305,10 @@ async def _flush_grouped_buffer(
         forward.offset = group_last_id
         write_config(CONFIG, persist=False)
 
-        logging.info(f"✅ 媒体组 {gid} ({len(msgs)} 条) 发送完成, offset → {group_last_id}")
+        logging.info("✅ 媒体组 %s (%s 条) 发送完成, offset → %s", gid, len(msgs), group_last_id)
 
-        delay_seconds = random.randint(60, 300)
-        logging.info(f"⏸️ 媒体组发送后休息 {delay_seconds} 秒")
+        delay_seconds = random.randint(*const.PAST_DELAY_RANGE)
+        logging.info("⏸️ 媒体组发送后休息 %s 秒", delay_seconds)
         await asyncio.sleep(delay_seconds)
 
     grouped_buffer.clear()
@@ -320,7 +330,7 @@ async def _forward_comments_for_post(
 
     src_disc_msg = await get_discussion_message(client, src_channel_id, src_post_id)
     if src_disc_msg is None:
-        logging.debug(f"帖子 {src_post_id} 没有讨论消息，跳过评论")
+        logging.debug("帖子 %s 没有讨论消息，跳过评论", src_post_id)
         return
 
     src_discussion_id = src_disc_msg.chat_id
@@ -338,18 +348,18 @@ async def _forward_comments_for_post(
             except Exception:
                 continue
 
-        dest_post_id = st.get_dest_post_id(
+        dest_post_id = await st.get_dest_post_id(
             src_channel_id, src_post_id, dest_resolved
         )
         if dest_post_id is None:
-            logging.debug(f"帖子 {src_post_id} 在目标 {dest_resolved} 没有映射，跳过评论")
+            logging.debug("帖子 %s 在目标 %s 没有映射，跳过评论", src_post_id, dest_resolved)
             continue
 
         if comments_cfg.dest_mode == "comments":
             dest_disc_msg = await get_discussion_message(client, dest_resolved, dest_post_id)
             if dest_disc_msg:
                 dest_targets[dest_disc_msg.chat_id] = dest_disc_msg.id
-                logging.info(f"💬 评论目标: discussion={dest_disc_msg.chat_id}, reply_to={dest_disc_msg.id}")
+                logging.info("💬 评论目标: discussion=%s, reply_to=%s", dest_disc_msg.chat_id, dest_disc_msg.id)
         elif comments_cfg.dest_mode == "discussion":
             for dg in comments_cfg.dest_discussion_groups:
                 dg_id = dg
@@ -361,7 +371,7 @@ async def _forward_comments_for_post(
                 dest_targets[dg_id] = None
 
     if not dest_targets:
-        logging.debug(f"帖子 {src_post_id} 没有有效的评论目标")
+        logging.debug("帖子 %s 没有有效的评论目标", src_post_id)
         return
 
     comment_count = 0
@@ -395,7 +405,7 @@ async def _forward_comments_for_post(
                 await _send_comment_group(client, grouped_buffer[old_gid], dest_targets)
                 comment_count += len(grouped_buffer[old_gid])
                 del grouped_buffer[old_gid]
-                delay = random.randint(60, 300)
+                delay = random.randint(*const.PAST_DELAY_RANGE)
                 await asyncio.sleep(delay)
 
             grouped_buffer[comment.grouped_id].append(comment)
@@ -405,7 +415,7 @@ async def _forward_comments_for_post(
             await _send_comment_group(client, grouped_buffer[old_gid], dest_targets)
             comment_count += len(grouped_buffer[old_gid])
             del grouped_buffer[old_gid]
-            delay = random.randint(60, 300)
+            delay = random.randint(*const.PAST_DELAY_RANGE)
             await asyncio.sleep(delay)
 
         bot_media = []
@@ -428,12 +438,12 @@ async def _forward_comments_for_post(
                             dest_disc_id, _extract_msg_id(fwded),
                         )
                 except Exception as e:
-                    logging.error(f"❌ 评论 bot 媒体发送失败: {e}")
+                    logging.error("❌ 评论 bot 媒体发送失败: %s", e)
         else:
             await _send_single_comment(client, comment, dest_targets)
         comment_count += 1
 
-        delay = random.randint(60, 300)
+        delay = random.randint(*const.PAST_DELAY_RANGE)
         await asyncio.sleep(delay)
 
     for old_gid in list(grouped_buffer.keys()):
@@ -441,7 +451,7 @@ async def _forward_comments_for_post(
         comment_count += len(grouped_buffer[old_gid])
 
     if comment_count > 0:
-        logging.info(f"💬 帖子 {src_post_id} 评论转发完成: {comment_count} 条")
+        logging.info("💬 帖子 %s 评论转发完成: %s 条", src_post_id, comment_count)
 
 
 async def _send_single_comment(
@@ -461,20 +471,21 @@ async def _send_single_comment(
                     comment.chat_id, comment.id,
                     dest_disc_id, _extract_msg_id(fwded),
                 )
-                logging.info(f"💬 评论转发成功: {comment.chat_id}/{comment.id} → {dest_disc_id}")
+                logging.info("💬 评论转发成功: %s/%s → %s", comment.chat_id, comment.id, dest_disc_id)
             else:
-                logging.warning(f"⚠️ 评论转发返回 None: {comment.id}")
+                logging.warning("⚠️ 评论转发返回 None: %s", comment.id)
         except FloodWaitError as fwe:
-            logging.warning(f"⛔ FloodWait (评论): {fwe.seconds} 秒")
+            logging.warning("⛔ FloodWait (评论): %s 秒", fwe.seconds)
+            metrics.record_flood_wait(fwe.seconds)
             await asyncio.sleep(fwe.seconds + 10)
             try:
                 fwded = await send_message(dest_disc_id, tm, comment_to_post=dest_top_id)
                 if fwded:
-                    logging.info(f"💬 评论重试成功")
+                    logging.info("💬 评论重试成功")
             except Exception as e2:
-                logging.error(f"❌ 评论重试失败: {e2}")
+                logging.error("❌ 评论重试失败: %s", e2)
         except Exception as e:
-            logging.error(f"❌ 评论发送失败: {e}")
+            logging.error("❌ 评论发送失败: %s", e)
 
     tm.clear()
 
@@ -506,11 +517,12 @@ async def _send_comment_group(
                     comments[0].chat_id, comments[0].id,
                     dest_disc_id, _extract_msg_id(fwded),
                 )
-                logging.info(f"💬 评论媒体组成功: {len(comments)} 条 → {dest_disc_id}")
+                logging.info("💬 评论媒体组成功: %s 条 → %s", len(comments), dest_disc_id)
             else:
-                logging.warning(f"⚠️ 评论媒体组返回 None")
+                logging.warning("⚠️ 评论媒体组返回 None")
         except FloodWaitError as fwe:
-            logging.warning(f"⛔ FloodWait (评论组): {fwe.seconds} 秒")
+            logging.warning("⛔ FloodWait (评论组): %s 秒", fwe.seconds)
+            metrics.record_flood_wait(fwe.seconds)
             await asyncio.sleep(fwe.seconds + 10)
             try:
                 fwded = await send_message(
@@ -519,11 +531,11 @@ async def _send_comment_group(
                     grouped_tms=tms, comment_to_post=dest_top_id,
                 )
                 if fwded:
-                    logging.info(f"💬 评论媒体组重试成功")
+                    logging.info("💬 评论媒体组重试成功")
             except Exception as e2:
-                logging.error(f"❌ 评论媒体组重试失败: {e2}")
+                logging.error("❌ 评论媒体组重试失败: %s", e2)
         except Exception as e:
-            logging.error(f"❌ 评论媒体组失败: {e}")
+            logging.error("❌ 评论媒体组失败: %s", e)
 
     for tm in tms:
         tm.clear()
@@ -534,6 +546,53 @@ async def _send_comment_group(
 # =====================================================================
 
 
+async def _iter_prepared(
+    client: TelegramClient, src: int, forward
+) -> AsyncIterator[Tuple[Message, Dict[int, Optional[NbMessage]]]]:
+    """每 PAST_BATCH_SIZE 条拉取一个窗口，并对窗口内的普通单条消息批量执行插件。
+
+    产出 (message, prepared)，prepared 中存在 message.id 时即为批量插件结果
+    （None 表示已被过滤）。调用方未取走的结果在处理完该消息后清理。
+    启用 bot 媒体时单条消息可能改走 bot 媒体分支，此时不做预处理，以免提前下载媒体。
+    """
+    prepared: Dict[int, Optional[NbMessage]] = {}
+
+    async def _pages():
+        page: List[Message] = []
+        async for message in client.iter_messages(src, reverse=True, offset_id=forward.offset):
+            page.append(message)
+            if len(page) >= const.PAST_BATCH_SIZE:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    pages = _pages()
+    try:
+        async for page in pages:
+            if not _bot_media_allowed(forward):
+                singles = [
+                    m for m in page
+                    if not isinstance(m, MessageService)
+                    and m.grouped_id is None
+                    and not (forward.end and m.id > forward.end)
+                ]
+                if singles:
+                    tms = await apply_plugins_batch(singles)
+                    prepared.update((m.id, tm) for m, tm in zip(singles, tms))
+            for message in page:
+                yield message, prepared
+                unused = prepared.pop(message.id, None)
+                if unused:
+                    unused.clear()
+    finally:
+        await pages.aclose()
+        for tm in prepared.values():
+            if tm:
+                tm.clear()
+        prepared.clear()
+
+
 async def forward_job() -> None:
     clean_session_files()
     await load_async_plugins()
@@ -546,19 +605,24 @@ async def forward_job() -> None:
     async with TelegramClient(SESSION, CONFIG.login.API_ID, CONFIG.login.API_HASH) as client:
         config.from_to = await config.load_from_to(client, CONFIG.forwards)
 
+        await metrics.start_server()
         for from_to, forward in zip(config.from_to.items(), CONFIG.forwards):
             src, dest = from_to
             last_id = 0
+            latest = await client.get_messages(src, limit=1)
+            latest_id = latest[0].id if latest else 0
             grouped_buffer: Dict[int, List[Message]] = defaultdict(list)
             prev_grouped_id: Optional[int] = None
 
-            async for message in client.iter_messages(src, reverse=True, offset_id=forward.offset):
+            messages = _iter_prepared(client, src, forward)
+            async for message, prepared in messages:
                 if isinstance(message, MessageService):
                     continue
 
                 if forward.end and message.id > forward.end:
-                    logging.info(f"📍 到达 end={forward.end}, 停止")
+                    logging.info("📍 到达 end=%s, 停止", forward.end)
                     break
+                metrics.set_value("past_offset_lag", max(latest_id - message.id, 0), src)
 
                 try:
                     current_grouped_id = message.grouped_id
@@ -575,7 +639,8 @@ async def forward_job() -> None:
                             if flushed_last:
                                 last_id = max(last_id, flushed_last)
                         except FloodWaitError as fwe:
-                            logging.warning(f"⛔ FloodWait (组刷新): {fwe.seconds} 秒")
+                            logging.warning("⛔ FloodWait (组刷新): %s 秒", fwe.seconds)
+                            metrics.record_flood_wait(fwe.seconds)
                             await asyncio.sleep(fwe.seconds)
                             flushed_last = await _flush_grouped_buffer(
                                 client, src, dest, grouped_buffer, forward
@@ -612,7 +677,7 @@ async def forward_job() -> None:
                                     if reply_msg_id is not None:
                                         r_event = st.DummyEvent(message.chat_id, reply_msg_id)
                                         r_event_uid = st.EventUid(r_event)
-                                        if r_event_uid in st.stored:
+                                        if await st.stored.load(r_event_uid):
                                             fwded_reply = st.stored[r_event_uid].get(d)
                                             if fwded_reply is not None:
                                                 if isinstance(fwded_reply, int):
@@ -633,7 +698,7 @@ async def forward_job() -> None:
                                         if fwded_id is not None:
                                             st.add_post_mapping(src, message.id, d, fwded_id)
                                 except Exception as e:
-                                    logging.error(f"❌ 合并媒体发送失败: {e}")
+                                    logging.error("❌ 合并媒体发送失败: %s", e)
                             for tm in tms:
                                 tm.clear()
                         else:
@@ -655,7 +720,7 @@ async def forward_job() -> None:
                                     if reply_msg_id is not None:
                                         r_event = st.DummyEvent(message.chat_id, reply_msg_id)
                                         r_event_uid = st.EventUid(r_event)
-                                        if r_event_uid in st.stored:
+                                        if await st.stored.load(r_event_uid):
                                             fwded_reply = st.stored[r_event_uid].get(d)
                                             if fwded_reply is not None:
                                                 if isinstance(fwded_reply, int):
@@ -675,12 +740,15 @@ async def forward_job() -> None:
                                         if fwded_id is not None:
                                             st.add_post_mapping(src, message.id, d, fwded_id)
                                 except Exception as e:
-                                    logging.error(f"❌ bot 媒体发送失败: {e}")
+                                    logging.error("❌ bot 媒体发送失败: %s", e)
                             last_id = message.id
                             forward.offset = last_id
                             write_config(CONFIG, persist=False)
                         else:
-                            tm = await apply_plugins(message)
+                            if message.id in prepared:
+                                tm = prepared.pop(message.id)
+                            else:
+                                tm = await apply_plugins(message)
                             if not tm:
                                 continue
 
@@ -694,7 +762,7 @@ async def forward_job() -> None:
                                     if reply_msg_id is not None:
                                         r_event = st.DummyEvent(message.chat_id, reply_msg_id)
                                         r_event_uid = st.EventUid(r_event)
-                                        if r_event_uid in st.stored:
+                                        if await st.stored.load(r_event_uid):
                                             fwded_reply = st.stored[r_event_uid].get(d)
                                             if fwded_reply is not None:
                                                 if isinstance(fwded_reply, int):
@@ -711,9 +779,9 @@ async def forward_job() -> None:
                                         if fwded_id is not None:
                                             st.add_post_mapping(src, message.id, d, fwded_id)
                                     else:
-                                        logging.warning(f"⚠️ 发送返回 None, dest={d}, msg={message.id}")
+                                        logging.warning("⚠️ 发送返回 None, dest=%s, msg=%s", d, message.id)
                                 except Exception as e:
-                                    logging.error(f"❌ 单条发送失败: {e}")
+                                    logging.error("❌ 单条发送失败: %s", e)
 
                             tm.clear()
                             last_id = message.id
@@ -724,21 +792,24 @@ async def forward_job() -> None:
                         try:
                             await _forward_comments_for_post(client, src, message.id, forward)
                         except Exception as e:
-                            logging.error(f"❌ 帖子 {message.id} 评论转发失败: {e}")
+                            logging.error("❌ 帖子 %s 评论转发失败: %s", message.id, e)
 
-                    delay_seconds = random.randint(60, 300)
-                    logging.info(f"⏸️ 休息 {delay_seconds} 秒 (消息 {message.id})")
+                    delay_seconds = random.randint(*const.PAST_DELAY_RANGE)
+                    logging.info("⏸️ 休息 %s 秒 (消息 %s)", delay_seconds, message.id)
                     await asyncio.sleep(delay_seconds)
 
                 except FloodWaitError as fwe:
-                    logging.warning(f"⛔ FloodWait: {fwe.seconds} 秒")
+                    logging.warning("⛔ FloodWait: %s 秒", fwe.seconds)
+                    metrics.record_flood_wait(fwe.seconds)
                     await asyncio.sleep(fwe.seconds)
                 except Exception as err:
                     logging.exception(err)
+            # 到达 end 提前退出时立即关闭，清理尚未使用的预处理结果
+            await messages.aclose()
 
             if grouped_buffer:
-                logging.info(f"📦 刷新剩余 {len(grouped_buffer)} 个媒体组")
+                logging.info("📦 刷新剩余 %s 个媒体组", len(grouped_buffer))
                 try:
                     await _flush_grouped_buffer(client, src, dest, grouped_buffer, forward)
                 except Exception as e:
-                    logging.exception(f"🚨 刷新剩余组失败: {e}")
+                    logging.exception("🚨 刷新剩余组失败: %s", e)
@@ -4,7 +4,9 @@
 
 import inspect
 import logging
-from typing import Any, Dict, List, Optional
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
 
 from telethon.tl.custom.message import Message
 from telethon.tl.types import (
@@ -15,6 +17,7 @@ from telethon.tl.types import (
     KeyboardButtonRow,
 )
 
+from nb import metrics
 from nb.config import CONFIG
 from nb.plugin_models import ASYNC_PLUGIN_IDS, InlineButtonMode
 from nb.utils import cleanup, stamp
@@ -125,20 +128,95 @@ def _process_single_button(button, mode, url_replacements, text_replacements):
 # =====================================================================
 
 
+_UNSET = object()
+
+
 class NbMessage:
+    """插件流水线中的消息包装。
+
+    text / raw_text / file_type / reply_markup 等字段在首次访问时才计算并缓存，
+    被 filter 提前丢弃的消息几乎没有额外开销。
+    """
+
+    __slots__ = (
+        "message",
+        "new_file",
+        "cleanup",
+        "reply_to",
+        "file",
+        "_text",
+        "_raw_text",
+        "_sender_id",
+        "_file_type",
+        "_client",
+        "_reply_markup",
+    )
+
     def __init__(self, message: Message) -> None:
         self.message = message
-        self.text = self.message.text or ""
-        self.raw_text = self.message.raw_text or ""
-        self.sender_id = self.message.sender_id
-        self.file_type = self.guess_file_type()
         self.new_file = None
         self.cleanup = False
         self.reply_to = None
-        self.client = self.message.client
-
+        self.file = None
+        self._text = _UNSET
+        self._raw_text = _UNSET
+        self._sender_id = _UNSET
+        self._file_type = _UNSET
+        self._client = _UNSET
+        self._reply_markup = _UNSET
+
+    @property
+    def text(self) -> str:
+        if self._text is _UNSET:
+            self._text = self.message.text or ""
+        return self._text
+
+    @text.setter
+    def text(self, value: str) -> None:
+        self._text = value
+
+    @property
+    def raw_text(self) -> str:
+        if self._raw_text is _UNSET:
+            self._raw_text = self.message.raw_text or ""
+        return self._raw_text
+
+    @raw_text.setter
+    def raw_text(self, value: str) -> None:
+        self._raw_text = value
+
+    @property
+    def sender_id(self):
+        if self._sender_id is _UNSET:
+            self._sender_id = self.message.sender_id
+        return self._sender_id
+
+    @property
+    def file_type(self) -> str:
+        if self._file_type is _UNSET:
+            self._file_type = self.guess_file_type()
+        return self._file_type
+
+    @property
+    def client(self):
+        if self._client is _UNSET:
+            self._client = self.message.client
+        return self._client
+
+    @client.setter
+    def client(self, value) -> None:
+        self._client = value
+
+    @property
+    def reply_markup(self):
         # Inline Button 处理
-        self.reply_markup = self._build_reply_markup()
+        if self._reply_markup is _UNSET:
+            self._reply_markup = self._build_reply_markup()
+        return self._reply_markup
+
+    @reply_markup.setter
+    def reply_markup(self, value) -> None:
+        self._reply_markup = value
 
     def _build_reply_markup(self):
         """根据配置处理消息的 reply_markup"""
@@ -162,6 +240,10 @@ class NbMessage:
         if self.file_type == "nofile":
             raise FileNotFoundError("No file exists in this message.")
         self.file = stamp(await self.message.download_media(""), self.sender_id)
+        try:
+            metrics.record_bytes("down", os.path.getsize(self.file))
+        except (OSError, TypeError):
+            pass
         return self.file
 
     def guess_file_type(self) -> str:
@@ -183,6 +265,10 @@ class NbMessage:
 
 class NbPlugin:
     id_ = "plugin"
+    # 插件是否修改文字 / 是否处理媒体（下载、改写文件）。
+    # 编辑同步只运行 affects_text 的插件；同时处理媒体的插件改为调用 modify_text。
+    affects_text = True
+    affects_media = True
 
     def __init__(self, data: Dict[str, Any]) -> None:
         self.data = data
@@ -196,52 +282,103 @@ class NbPlugin:
     def modify_group(self, tms: List[NbMessage]) -> List[NbMessage]:
         return [self.modify(tm) for tm in tms if tm]
 
+    def modify_text(self, tm: NbMessage) -> Optional[NbMessage]:
+        """只处理文字、不得下载媒体的版本，供编辑同步使用。
+
+        默认等同 modify；modify 为异步时返回其协程，由 apply_plugins 等待。
+        """
+        return self.modify(tm)
+
+    def modify_batch(self, tms: List[NbMessage]) -> List[Optional[NbMessage]]:
+        """一次处理一页互不相关的消息。
+
+        返回与输入等长的列表，被丢弃的消息对应位置为 None；
+        单条失败时对应位置放入异常，只有这些消息会回退到 modify 重做。
+        未重写此方法的插件由 _modify_batch 逐条回退到 modify。
+        """
+        return [self.modify(tm) for tm in tms]
+
 
 PLUGINS = CONFIG.plugins
 _plugins: Dict[str, NbPlugin] = {}
 
 
+def _load_plugin(pid: str) -> Optional[NbPlugin]:
+    cfg = getattr(PLUGINS, pid, None)
+    if not cfg or not getattr(cfg, "check", False):
+        return None
+
+    try:
+        mod = __import__(f"nb.plugins.{pid}", fromlist=[""])
+        cls = getattr(mod, f"Nb{pid.title()}")
+        plugin = cls(cfg)
+        if plugin.id_ != pid:
+            logging.error("ID mismatch: %s != %s", plugin.id_, pid)
+            return None
+        logging.info("✅ 插件加载: %s", pid)
+        return plugin
+    except Exception as e:
+        logging.error("❌ 加载失败 %s: %s", pid, e)
+        return None
+
+
 def load_plugins() -> Dict[str, NbPlugin]:
     global _plugins
     _plugins = {}
 
     for pid in PLUGIN_ORDER:
-        cfg = getattr(PLUGINS, pid, None)
-        if not cfg or not getattr(cfg, "check", False):
-            continue
-
-        try:
-            mod = __import__(f"nb.plugins.{pid}", fromlist=[""])
-            cls = getattr(mod, f"Nb{pid.title()}")
-            plugin = cls(cfg)
-            if plugin.id_ != pid:
-                logging.error(f"ID mismatch: {plugin.id_} != {pid}")
-                continue
+        plugin = _load_plugin(pid)
+        if plugin is not None:
             _plugins[pid] = plugin
-            logging.info(f"✅ 插件加载: {pid}")
-        except Exception as e:
-            logging.error(f"❌ 加载失败 {pid}: {e}")
 
     return _plugins
 
 
-async def apply_plugins(message: Message) -> Optional[NbMessage]:
+async def reload_plugins(pids: Iterable[str]) -> None:
+    """只重建配置发生变化的插件实例，其余插件保持不动"""
+    pids = set(pids)
+    for pid in PLUGIN_ORDER:
+        if pid not in pids:
+            continue
+        plugin = _load_plugin(pid)
+        if plugin is None:
+            if _plugins.pop(pid, None) is not None:
+                logging.info("🔌 插件已卸载: %s", pid)
+            continue
+        if pid in ASYNC_PLUGIN_IDS:
+            await plugin.__ainit__()
+        _plugins[pid] = plugin
+
+
+async def apply_plugins(message: Message, text_only: bool = False) -> Optional[NbMessage]:
+    """对单条消息执行插件链。
+
+    text_only=True 时只运行影响文字的插件，且不会下载媒体（用于编辑同步）。
+    """
     tm = NbMessage(message)
     for pid in PLUGIN_ORDER:
         if pid not in _plugins:
             continue
         plugin = _plugins[pid]
+        modify = plugin.modify
+        if text_only:
+            if not plugin.affects_text:
+                continue
+            if plugin.affects_media:
+                modify = plugin.modify_text
+        started = time.perf_counter()
         try:
-            if inspect.iscoroutinefunction(plugin.modify):
-                ntm = await plugin.modify(tm)
-            else:
-                ntm = plugin.modify(tm)
+            ntm = modify(tm)
+            # 默认的 modify_text 是同步方法，但可能转调异步的 modify
+            if inspect.isawaitable(ntm):
+                ntm = await ntm
+            metrics.record_plugin(pid, time.perf_counter() - started)
             if not ntm:
                 tm.clear()
                 return None
             tm = ntm
         except Exception as e:
-            logging.error(f"❌ 插件执行失败 [{pid}]: {e}")
+            logging.error("❌ 插件执行失败 [%s]: %s", pid, e)
     return tm
 
 
@@ -262,6 +399,8 @@ async def apply_plugins_to_group(
         if pid not in _plugins:
             continue
         plugin = _plugins[pid]
+        count = len(tms) or 1
+        started = time.perf_counter()
         try:
             if hasattr(plugin, 'modify_group'):
                 if inspect.iscoroutinefunction(plugin.modify_group):
@@ -279,7 +418,8 @@ async def apply_plugins_to_group(
                         new_tms.append(result)
                 tms = new_tms
         except Exception as e:
-            logging.error(f"❌ 组插件失败 [{pid}]: {e}")
+            logging.error("❌ 组插件失败 [%s]: %s", pid, e)
+        metrics.record_plugin(pid, (time.perf_counter() - started) / count)
         tms = [tm for tm in tms if tm]
     if fail_open and not tms:
         tms = [NbMessage(msg) for msg in messages]
@@ -289,11 +429,81 @@ async def apply_plugins_to_group(
     return tms
 
 
+def _overrides_batch(plugin: NbPlugin) -> bool:
+    return type(plugin).modify_batch is not NbPlugin.modify_batch
+
+
+async def _modify_each(plugin: NbPlugin, tms: List[NbMessage]) -> List[Optional[NbMessage]]:
+    """默认适配器：逐条调用 modify，单条异常时保留原消息（与 apply_plugins 一致）"""
+    results: List[Optional[NbMessage]] = []
+    for tm in tms:
+        try:
+            if inspect.iscoroutinefunction(plugin.modify):
+                results.append(await plugin.modify(tm))
+            else:
+                results.append(plugin.modify(tm))
+        except Exception as e:
+            logging.error("❌ 插件执行失败 [%s]: %s", plugin.id_, e)
+            results.append(tm)
+    return results
+
+
+async def _modify_batch(plugin: NbPlugin, tms: List[NbMessage]) -> List[Optional[NbMessage]]:
+    if not _overrides_batch(plugin):
+        return await _modify_each(plugin, tms)
+    try:
+        if inspect.iscoroutinefunction(plugin.modify_batch):
+            results = await plugin.modify_batch(tms)
+        else:
+            results = plugin.modify_batch(tms)
+        if len(results) == len(tms):
+            failed = [i for i, r in enumerate(results) if isinstance(r, BaseException)]
+            if not failed:
+                return results
+            for i in failed:
+                logging.error("❌ 批量插件单条失败 [%s], 逐条重做: %s", plugin.id_, results[i])
+            results = list(results)
+            redone = await _modify_each(plugin, [tms[i] for i in failed])
+            for i, ntm in zip(failed, redone):
+                results[i] = ntm
+            return results
+        logging.error("❌ 批量插件返回长度不一致 [%s], 回退逐条处理", plugin.id_)
+    except Exception as e:
+        logging.error("❌ 批量插件失败 [%s], 回退逐条处理: %s", plugin.id_, e)
+    return await _modify_each(plugin, tms)
+
+
+async def apply_plugins_batch(messages: List[Message]) -> List[Optional[NbMessage]]:
+    """对一页独立消息批量执行插件链。
+
+    返回与 messages 等长的列表，被过滤的消息对应位置为 None。
+    """
+    results: List[Optional[NbMessage]] = [NbMessage(msg) for msg in messages]
+    for pid in PLUGIN_ORDER:
+        if pid not in _plugins:
+            continue
+        alive = [i for i, tm in enumerate(results) if tm]
+        if not alive:
+            break
+        batch = [results[i] for i in alive]
+        started = time.perf_counter()
+        out = await _modify_batch(_plugins[pid], batch)
+        # 按单条消息的平均耗时记录，与逐条执行的样本可比
+        metrics.record_plugin(pid, (time.perf_counter() - started) / len(batch))
+        for i, tm, ntm in zip(alive, batch, out):
+            if not ntm:
+                tm.clear()
+                results[i] = None
+            else:
+                results[i] = ntm
+    return results
+
+
 async def load_async_plugins() -> None:
     for pid in ASYNC_PLUGIN_IDS:
         if pid in _plugins:
             await _plugins[pid].__ainit__()
-            logging.info(f"🔌 异步插件已加载: {pid}")
+            logging.info("🔌 异步插件已加载: %s", pid)
 
 
 _plugins = load_plugins()
@@ -8,12 +8,13 @@ from nb.plugins import NbMessage, NbPlugin
 
 class NbCaption(NbPlugin):
     id_ = "caption"
+    affects_media = False
 
     def __init__(self, data) -> None:
         self.caption = data
         self._header = data.header.strip() if data.header else ""
         self._footer = data.footer.strip() if data.footer else ""
-        logging.info(f"📝 加载标题插件: header='{self._header}', footer='{self._footer}'")
+        logging.info("📝 加载标题插件: header='%s', footer='%s'", self._header, self._footer)
 
     def modify(self, tm: NbMessage) -> NbMessage:
         """单条消息：正常添加 header 和 footer"""
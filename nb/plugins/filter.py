@@ -1,5 +1,5 @@
 import logging
-from typing import List
+from typing import List, Optional
 
 from nb.plugin_models import TextFilter
 from nb.plugins import NbMessage, NbPlugin
@@ -8,6 +8,7 @@ from nb.utils import match
 
 class NbFilter(NbPlugin):
     id_ = "filter"
+    affects_media = False
 
     def __init__(self, data) -> None:
         self.filters = data
@@ -39,6 +40,16 @@ class NbFilter(NbPlugin):
                 filtered.append(tm)
         return filtered
 
+    def modify_batch(self, tms: List[NbMessage]) -> List[Optional[NbMessage]]:
+        """Filter a page of messages, logging one summary instead of per message."""
+        results = [
+            tm if self.users_safe(tm) and self.files_safe(tm) and self.text_safe(tm) else None
+            for tm in tms
+        ]
+        passed = sum(1 for tm in results if tm)
+        logging.info("Batch filter: %s/%s messages passed", passed, len(tms))
+        return results
+
     def text_safe(self, tm: NbMessage) -> bool:
         flist = self.filters.text
 
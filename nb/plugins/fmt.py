@@ -10,10 +10,11 @@ from nb.plugins import NbMessage, NbPlugin
 
 class NbFmt(NbPlugin):
     id_ = "fmt"
+    affects_media = False
 
     def __init__(self, data) -> None:
         self.format = data
-        logging.info(f"🎨 加载格式插件: {data.style}")
+        logging.info("🎨 加载格式插件: %s", data.style)
 
     def modify(self, tm: NbMessage) -> NbMessage:
         if self.format.style is Style.PRESERVE or not tm.raw_text:
@@ -1,11 +1,10 @@
+import asyncio  
 import logging  
 import os  
 import shutil  
-from typing import Any, Dict, List  
+from typing import Any, Dict, List, Optional  
   
-import requests  
 from pydantic import BaseModel  
-from watermark import File, Position, Watermark, apply_watermark  
   
 from nb.plugin_models import MarkConfig  
 from nb.plugins import NbMessage, NbPlugin  
@@ -16,8 +15,10 @@ def download_image(url: str, filename: str = "image.png") -> bool:
     if filename in os.listdir():  
         logging.info("Image for watermarking already exists.")  
         return True  
+    import requests  
+  
     try:  
-        logging.info(f"Downloading image {url}")  
+        logging.info("Downloading image %s", url)  
         response = requests.get(url, stream=True)  
         if response.status_code == 200:  
             logging.info("Got Response 200")  
@@ -34,23 +35,33 @@ def download_image(url: str, filename: str = "image.png") -> bool:
   
 class NbMark(NbPlugin):  
     id_ = "mark"  
+    affects_text = False  
   
     def __init__(self, data) -> None:  
         self.data = data  
   
+    def _watermark(self) -> "Watermark":  
+        # watermark is only needed once a mark is actually applied  
+        from watermark import File, Watermark  
+  
+        if self.data.image.startswith("https://"):  
+            download_image(self.data.image)  
+            return Watermark(File("image.png"), self.data.position)  
+        return Watermark(File(self.data.image), self.data.position)  
+  
+    def _apply(self, downloaded_file: str, wtm: "Watermark") -> str:  
+        from watermark import File, apply_watermark  
+  
+        new_file = apply_watermark(File(downloaded_file), wtm, frame_rate=self.data.frame_rate)  
+        cleanup(downloaded_file)  
+        return new_file  
+  
     async def modify(self, tm: NbMessage) -> NbMessage:  
         if not tm.file_type in ["gif", "video", "photo"]:  
             return tm  
         downloaded_file = await tm.get_file()  
-        base = File(downloaded_file)  
-        if self.data.image.startswith("https://"):  
-            download_image(self.data.image)  
-            overlay = File("image.png")  
-        else:  
-            overlay = File(self.data.image)  
-        wtm = Watermark(overlay, self.data.position)  
-        tm.new_file = apply_watermark(base, wtm, frame_rate=self.data.frame_rate)  
-        cleanup(downloaded_file)  
+        wtm = self._watermark()  
+        tm.new_file = self._apply(downloaded_file, wtm)  
         tm.cleanup = True  
         return tm  
   
@@ -60,3 +71,27 @@ class NbMark(NbPlugin):
             if tm.file_type in ["gif", "video", "photo"]:  
                 await self.modify(tm)  
         return tms
+  
+    async def modify_batch(self, tms: List[NbMessage]) -> List[Optional[NbMessage]]:  
+        """Watermark a page of media, encoding in a worker pool."""  
+        media = [tm for tm in tms if tm.file_type in ["gif", "video", "photo"]]  
+        if not media:  
+            return tms  
+        wtm = self._watermark()  
+        loop = asyncio.get_running_loop()  
+        sem = asyncio.Semaphore(os.cpu_count() or 1)  
+  
+        async def _mark(tm: NbMessage) -> None:  
+            async with sem:  
+                downloaded_file = await tm.get_file()  
+                try:  
+                    tm.new_file = await loop.run_in_executor(None, self._apply, downloaded_file, wtm)  
+                except Exception:  
+                    cleanup(downloaded_file)  
+                    raise  
+                tm.cleanup = True  
+  
+        # a failed message is redone alone; the others keep their watermarked files  
+        done = await asyncio.gather(*(_mark(tm) for tm in media), return_exceptions=True)  
+        failed = {id(tm): err for tm, err in zip(media, done) if isinstance(err, BaseException)}  
+        return [failed.get(id(tm), tm) for tm in tms]
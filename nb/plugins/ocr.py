@@ -1,15 +1,38 @@
-import pytesseract
-from PIL import Image
+import asyncio
+import os
+from collections import OrderedDict
+from typing import List, Optional
 
 from nb.plugins import NbMessage, NbPlugin
 from nb.utils import cleanup
 
+CACHE_SIZE = 1000
+
+
+def _image_to_string(file: str, lang: str) -> str:
+    import pytesseract
+    from PIL import Image
+
+    with Image.open(file) as image:
+        return pytesseract.image_to_string(image, lang=lang)
+
 
 class NbOcr(NbPlugin):
     id_ = "ocr"
 
     def __init__(self, data) -> None:
         self.data = data
+        # photo id -> OCR text, lets edit sync reuse results without downloading
+        self._cache: "OrderedDict[int, str]" = OrderedDict()
+
+    def _remember(self, tm: NbMessage) -> None:
+        photo = getattr(tm.message, "photo", None)
+        if photo is None:
+            return
+        self._cache[photo.id] = tm.text
+        self._cache.move_to_end(photo.id)
+        if len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
 
     async def modify(self, tm: NbMessage) -> NbMessage:
 
@@ -19,8 +42,38 @@ class NbOcr(NbPlugin):
         file = await tm.get_file()
         lang = getattr(self.data, "lang", "chi_sim")
         try:
-            tm.text = pytesseract.image_to_string(Image.open(file), lang=lang)
+            tm.text = _image_to_string(file, lang)
+            self._remember(tm)
         except Exception as e:
             tm.text = f"OCR Error: {e}"
         cleanup(file)
         return tm
+
+    def modify_text(self, tm: NbMessage) -> NbMessage:
+        """Serve OCR text from the cache only; never downloads the photo."""
+        photo = getattr(tm.message, "photo", None)
+        if tm.file_type == "photo" and photo is not None and photo.id in self._cache:
+            tm.text = self._cache[photo.id]
+        return tm
+
+    async def modify_batch(self, tms: List[NbMessage]) -> List[Optional[NbMessage]]:
+        """Download a page of photos and run tesseract on them in a worker pool."""
+        lang = getattr(self.data, "lang", "chi_sim")
+        loop = asyncio.get_running_loop()
+        sem = asyncio.Semaphore(os.cpu_count() or 1)
+
+        async def _ocr(tm: NbMessage) -> None:
+            async with sem:
+                file = await tm.get_file()
+                try:
+                    tm.text = await loop.run_in_executor(None, _image_to_string, file, lang)
+                    self._remember(tm)
+                except Exception as e:
+                    tm.text = f"OCR Error: {e}"
+                cleanup(file)
+
+        photos = [tm for tm in tms if tm.file_type == "photo"]
+        # a failed download only fails its own message, which is redone alone
+        done = await asyncio.gather(*(_ocr(tm) for tm in photos), return_exceptions=True)
+        failed = {id(tm): err for tm, err in zip(photos, done) if isinstance(err, BaseException)}
+        return [failed.get(id(tm), tm) for tm in tms]
@@ -1,7 +1,7 @@
 # nb/plugins/replace.py —— 已修复：no name 'replace' is not defined
 
 import logging
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
 # ✅ 关键修复：显式导入 replace 函数
 from nb.utils import replace as utils_replace
@@ -10,10 +10,11 @@ from nb.plugins import NbMessage, NbPlugin
 
 class NbReplace(NbPlugin):
     id_ = "replace"
+    affects_media = False
 
     def __init__(self, data):
         self.replace = data
-        logging.info(f"🔧 加载替换规则: {data.text}")
+        logging.info("🔧 加载替换规则: %s", data.text)
 
     def modify(self, tm: NbMessage) -> NbMessage:
         raw_text = tm.raw_text  # ✅ 始终基于原始文本操作
@@ -35,3 +36,21 @@ class NbReplace(NbPlugin):
                     text = utils_replace(original, new, text, self.replace.regex)
                 tm.text = text
         return tms
+
+    def modify_batch(self, tms: List[NbMessage]) -> List[Optional[NbMessage]]:
+        """批量替换：同一页中相同的原文只计算一次"""
+        rules = list(self.replace.text.items())
+        regex = self.replace.regex
+        done: Dict[str, str] = {}
+        for tm in tms:
+            raw_text = tm.raw_text
+            if not raw_text:
+                continue
+            text = done.get(raw_text)
+            if text is None:
+                text = raw_text
+                for original, new in rules:
+                    text = utils_replace(original, new, text, regex)
+                done[raw_text] = text
+            tm.text = text
+        return tms
@@ -7,6 +7,7 @@ from telethon import TelegramClient
 
 class NbSender(NbPlugin):
     id_ = "sender"
+    affects_text = False
     
     async def __ainit__(self) -> None:
         sender = TelegramClient(
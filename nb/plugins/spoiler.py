@@ -5,6 +5,7 @@ from nb.plugins import NbMessage, NbPlugin
 
 class NbSpoiler(NbPlugin):
     id_ = "spoiler"
+    affects_text = False
 
     def __init__(self, data) -> None:
         self.data = data
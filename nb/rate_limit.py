@@ -0,0 +1,172 @@
+"""Send rate limits shared by every nb process of one account on this host.
+
+``nb live`` and an ``nb past`` backfill (or several workers) may send
+with the same account at the same time. Every send first takes a token
+from two buckets kept in a local SQLite database (WAL mode): one for the
+account and one for the account and destination chat. The buckets refill
+continuously at the configured rates, so all processes together stay
+below them.
+
+When any process gets a FloodWaitError the account is paused in the same
+database: every process waits for it before its next send instead of
+running into FloodWaits of its own.
+
+All database calls run on one dedicated thread, off the event loop.
+"""
+
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from telethon.errors.rpcerrorlist import FloodWaitError
+
+from nb.config import CONFIG
+from nb.const import RATE_LIMIT_FILE
+
+# the account-wide bucket is stored with this destination
+ACCOUNT = 0
+# 单次等待的上限，之后重新检查（配置或暂停可能已变化）
+MAX_WAIT = 5.0
+
+
+def account_key() -> str:
+    """A stable key for the logged in account that does not reveal its credentials."""
+    login = CONFIG.login
+    if login.user_type == 1 and login.SESSION_STRING:
+        return "user:" + hashlib.sha256(login.SESSION_STRING.encode()).hexdigest()[:16]
+    # the part of a bot token before ':' is the public bot id
+    return "bot:" + (login.BOT_TOKEN.split(":")[0] or "default")
+
+
+class RateLimiter:
+    def __init__(self, path: str = RATE_LIMIT_FILE) -> None:
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                account TEXT NOT NULL,
+                dest INTEGER NOT NULL,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (account, dest)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS pauses (
+                account TEXT PRIMARY KEY,
+                until REAL NOT NULL
+            );
+            """
+        )
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="nb-ratelimit")
+        self._paused_logged = 0.0
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    # ------------------------------------------------------------ buckets
+
+    def _refill(self, account: str, dest: int, rate: float, burst: float, now: float) -> float:
+        row = self.conn.execute(
+            "SELECT tokens, updated FROM buckets WHERE account = ? AND dest = ?", (account, dest)
+        ).fetchone()
+        if row is None:
+            return burst
+        tokens, updated = row
+        return min(burst, tokens + max(0.0, now - updated) * rate)
+
+    def _take(self, account: str, dest: int) -> Tuple[float, float]:
+        """Take one token from both buckets, or return how long to wait for them.
+
+        Returns ``(wait, paused_until)``; ``wait`` is 0 when the tokens were taken.
+        """
+        limits = CONFIG.rate_limit
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self.conn.execute("SELECT until FROM pauses WHERE account = ?", (account,)).fetchone()
+            if row is not None and row[0] > now:
+                return row[0] - now, row[0]
+
+            buckets = [(ACCOUNT, limits.per_second, limits.burst)]
+            if dest != ACCOUNT:
+                buckets.append((dest, limits.dest_per_second, limits.dest_burst))
+            wait, levels = 0.0, []
+            for key, rate, burst in buckets:
+                if rate <= 0:  # 0 表示不限制
+                    continue
+                tokens = self._refill(account, key, rate, burst, now)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / rate)
+                levels.append((key, tokens))
+            if wait > 0:
+                return wait, 0.0
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO buckets (account, dest, tokens, updated) VALUES (?, ?, ?, ?)",
+                [(account, key, tokens - 1, now) for key, tokens in levels],
+            )
+            return 0.0, 0.0
+        finally:
+            self.conn.execute("COMMIT")
+
+    def _pause(self, account: str, seconds: float) -> None:
+        self.conn.execute(
+            "INSERT INTO pauses (account, until) VALUES (?, ?)"
+            " ON CONFLICT (account) DO UPDATE SET until = MAX(until, excluded.until)",
+            (account, time.time() + seconds),
+        )
+
+    # -------------------------------------------------------------- async
+
+    async def acquire(self, dest: int = ACCOUNT) -> None:
+        """Wait until the account, and ``dest`` unless 0, may send once more."""
+        account = account_key()
+        while CONFIG.rate_limit.enabled:
+            wait, paused_until = await self._run(self._take, account, dest)
+            if wait <= 0:
+                return
+            if paused_until and paused_until != self._paused_logged:
+                self._paused_logged = paused_until
+                logging.info("⏸️ 账号 FloodWait 暂停中，%.0f 秒后继续发送", wait)
+            await asyncio.sleep(min(wait, MAX_WAIT))
+
+    async def flood_wait(self, seconds: float) -> None:
+        """Pause the account in every process for ``seconds``."""
+        await self._run(self._pause, account_key(), seconds)
+        logging.warning("⛔ FloodWait %s 秒，已通知共享此账号的所有进程暂停", seconds)
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_limiter() -> RateLimiter:
+    global _limiter
+    if _limiter is None:
+        _limiter = RateLimiter()
+    return _limiter
+
+
+async def acquire(dest: int = ACCOUNT) -> None:
+    if CONFIG.rate_limit.enabled:
+        await get_limiter().acquire(dest)
+
+
+def limit_send(send: Callable) -> Callable:
+    """Wrap an async ``send(dest, ...)`` to wait for the shared rate limits first
+    and to broadcast the FloodWaits it runs into."""
+
+    async def wrapper(dest, *args, **kwargs) -> Any:
+        await acquire(dest)
+        try:
+            return await send(dest, *args, **kwargs)
+        except FloodWaitError as fwe:
+            if CONFIG.rate_limit.enabled:
+                await get_limiter().flood_wait(fwe.seconds)
+            raise
+
+    return wrapper
@@ -0,0 +1,163 @@
+"""Per-destination send lanes for live mode.
+
+Every destination chat gets its own FIFO lane. Lanes run concurrently,
+while jobs inside one lane run in order and are spaced by the configured
+send interval, so a busy destination never delays a quiet one.
+"""
+
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Tuple
+
+from telethon.errors.rpcerrorlist import FloodWaitError
+
+from nb import metrics
+
+MAX_FLOOD_RETRIES = 3
+
+Job = Tuple[float, Callable[..., Awaitable[Any]], tuple, asyncio.Future]
+
+
+class Lane:
+    """A FIFO of send jobs for one destination."""
+
+    def __init__(self, key: Hashable) -> None:
+        self.key = key
+        self.jobs: Deque[Job] = deque()
+        self.task: Optional[asyncio.Task] = None
+        self.next_send_at = 0.0
+        self.paused_until = 0.0
+        self.sent = 0
+
+    def oldest_age(self, now: float) -> float:
+        if not self.jobs:
+            return 0.0
+        return now - self.jobs[0][0]
+
+
+class LiveScheduler:
+    """Schedule send jobs onto per-destination lanes.
+
+    ``interval`` returns the minimum number of seconds between two jobs of
+    the same lane; it is called for every job so config changes apply
+    immediately. A FloodWaitError pauses only the lane that received it.
+    """
+
+    def __init__(self, interval: Callable[[], float]) -> None:
+        self.interval = interval
+        self.lanes: Dict[Hashable, Lane] = {}
+
+    def submit(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args) -> asyncio.Future:
+        """Queue ``func(*args)`` on the lane ``key`` and return its future."""
+        loop = asyncio.get_running_loop()
+        lane = self.lanes.get(key)
+        if lane is None:
+            lane = self.lanes[key] = Lane(key)
+        fut = loop.create_future()
+        # errors are already logged by the lane, mark them as retrieved
+        fut.add_done_callback(lambda f: f.cancelled() or f.exception())
+        lane.jobs.append((time.monotonic(), func, args, fut))
+        if lane.task is None or lane.task.done():
+            lane.task = asyncio.create_task(self._run_lane(lane))
+        return fut
+
+    def pause(self, key: Hashable, seconds: float) -> None:
+        lane = self.lanes.get(key)
+        if lane is not None:
+            lane.paused_until = max(lane.paused_until, time.monotonic() + seconds)
+
+    async def _run_lane(self, lane: Lane) -> None:
+        retries = 0
+        while lane.jobs:
+            wait = max(lane.next_send_at, lane.paused_until) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            queued_at, func, args, fut = lane.jobs[0]
+            started = time.monotonic()
+            try:
+                result = await func(*args)
+            except FloodWaitError as fwe:
+                logging.warning("⛔ FloodWait lane=%s: %s 秒", lane.key, fwe.seconds)
+                metrics.record_flood_wait(fwe.seconds)
+                metrics.record_outcome(lane.key, "flood_wait")
+                self.pause(lane.key, fwe.seconds)
+                retries += 1
+                if retries <= MAX_FLOOD_RETRIES:
+                    continue
+                if not fut.done():
+                    fut.set_exception(fwe)
+            except Exception as e:
+                logging.error("❌ live 发送失败 lane=%s: %s", lane.key, e)
+                metrics.record_outcome(lane.key, "error")
+                if not fut.done():
+                    fut.set_exception(e)
+            else:
+                lane.sent += 1
+                metrics.record_outcome(lane.key, "ok")
+                metrics.record_send(started - queued_at, time.monotonic() - started)
+                if not fut.done():
+                    fut.set_result(result)
+            retries = 0
+            lane.jobs.popleft()
+            lane.next_send_at = time.monotonic() + self.interval()
+
+    def depth(self) -> int:
+        """Total number of jobs waiting in all lanes."""
+        return sum(len(lane.jobs) for lane in self.lanes.values())
+
+    def oldest_age(self) -> float:
+        """Age in seconds of the oldest waiting job across all lanes."""
+        now = time.monotonic()
+        return max((lane.oldest_age(now) for lane in self.lanes.values()), default=0.0)
+
+    def stats(self) -> Dict[Hashable, Dict[str, float]]:
+        """Queue depth, oldest item age and sent count for every lane."""
+        now = time.monotonic()
+        return {
+            key: {
+                "depth": len(lane.jobs),
+                "oldest_age": lane.oldest_age(now),
+                "sent": lane.sent,
+            }
+            for key, lane in self.lanes.items()
+        }
+
+
+class KeyedExecutor:
+    """Run handlers in order per key and concurrently across keys.
+
+    Each key with pending work gets its own worker coroutine, which exits
+    once the key's queue is drained.
+    """
+
+    def __init__(self) -> None:
+        self.queues: Dict[Hashable, Deque[Tuple[Callable[..., Awaitable[Any]], tuple]]] = {}
+        self.tasks: Dict[Hashable, asyncio.Task] = {}
+
+    def submit(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args) -> None:
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+        queue.append((func, args))
+        if key not in self.tasks:
+            self.tasks[key] = asyncio.create_task(self._drain(key))
+
+    async def _drain(self, key: Hashable) -> None:
+        queue = self.queues[key]
+        try:
+            while queue:
+                func, args = queue.popleft()
+                try:
+                    await func(*args)
+                except Exception as e:
+                    logging.exception("❌ live 处理失败 key=%s: %s", key, e)
+        finally:
+            self.queues.pop(key, None)
+            self.tasks.pop(key, None)
+
+    def depth(self) -> int:
+        """Number of handler calls waiting across all keys."""
+        return sum(len(queue) for queue in self.queues.values())
@@ -0,0 +1,63 @@
+"""Which forwards this live worker handles when ``nb live --workers N`` runs.
+
+The supervisor (``nb.supervisor``) starts every worker with
+``NB_SHARD=i/N``. A worker only handles the sources whose chat id hashes
+to its index; every worker still receives all updates of the account and
+ignores the others. Files owned by one process (live queue, metrics
+snapshot, log file, bot session) get the worker index as suffix, while
+the config, the mapping database and the rate limits stay shared.
+
+Without ``NB_SHARD`` there is one shard and nothing changes. When the
+config lives in Mongo, ``nb.leases`` decides the ownership instead and
+all workers share the Mongo live queue.
+"""
+
+import os
+import zlib
+from typing import Optional, Tuple
+
+from nb.const import SHARD_ENV_VAR
+
+
+def _parse(value: str) -> Tuple[int, int]:
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        return 0, 1
+    if count < 1 or not 0 <= index < count:
+        return 0, 1
+    return index, count
+
+
+INDEX, COUNT = _parse(os.getenv(SHARD_ENV_VAR, ""))
+
+
+def is_sharded() -> bool:
+    return COUNT > 1
+
+
+def is_primary() -> bool:
+    """Only the first worker answers bot commands."""
+    return INDEX == 0
+
+
+def shard_of(chat_id: int, count: int = COUNT) -> int:
+    # crc32 instead of hash(): the same in every process
+    return zlib.crc32(str(chat_id).encode()) % count
+
+
+def owns(chat_id: int) -> bool:
+    return COUNT == 1 or shard_of(chat_id) == INDEX
+
+
+def shard_file(path: str, index: Optional[int] = None) -> str:
+    """``nb.queue.db`` -> ``nb.queue.2.db`` for worker 2 (this one by default).
+
+    Unchanged in a process that is not a sharded worker, unless ``index`` is given.
+    """
+    if index is None:
+        if not is_sharded():
+            return path
+        index = INDEX
+    root, ext = os.path.splitext(path)
+    return f"{root}.{index}{ext}"
@@ -1,10 +1,16 @@
-from typing import Dict, List, Optional
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 import asyncio
+import hashlib
 import logging
+import time
 
-from pymongo.collection import Collection
 from telethon.tl.custom.message import Message
 
+from nb.mapping_db import COMMENT, POST, STORED, get_db
+
+if TYPE_CHECKING:
+    from pymongo.collection import Collection
+
 
 class EventUid:
     """The objects of this class uniquely identifies a message with its chat id and message id."""
@@ -32,9 +38,149 @@ class DummyEvent:
         self.id = msg_id
 
 
-stored: Dict[EventUid, Dict[int, Message]] = {}
+def _dest_msg_id(fwded) -> Optional[int]:
+    """Message id of a forwarded message, album or plain id."""
+    if isinstance(fwded, int):
+        return fwded
+    if isinstance(fwded, list):
+        return fwded[0].id if fwded and hasattr(fwded[0], "id") else None
+    return getattr(fwded, "id", None)
+
+
+class DestMap(dict):
+    """``{dest: fwded}`` of one source message, written through to the mapping db.
+
+    Entries loaded back from the db hold plain message ids instead of
+    Message objects.
+    """
+
+    def __init__(self, uid: EventUid, *args) -> None:
+        super().__init__(*args)
+        self.uid = uid
+        for dest, fwded in self.items():
+            self._persist(dest, fwded)
+
+    def _persist(self, dest: int, fwded) -> None:
+        msg_id = _dest_msg_id(fwded)
+        if msg_id is not None:
+            get_db().put(STORED, self.uid.chat_id, self.uid.msg_id, dest, msg_id)
+
+    def __setitem__(self, dest: int, fwded) -> None:
+        super().__setitem__(dest, fwded)
+        self._persist(dest, fwded)
+
+
+class StoredMap(dict):
+    """``EventUid -> {dest: fwded}`` with a reverse index msg_id -> source chats.
+
+    Delete events usually carry only message ids; the index answers
+    "which sources forwarded a message with this id" without probing every
+    configured source.
+
+    Only the last ``KEEP_LAST_MANY`` entries are kept in memory (see
+    ``evict``); older ones are loaded back from the mapping db on demand.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._by_msg_id: Dict[int, Set[int]] = {}
+
+    def _index(self, key: EventUid) -> None:
+        self._by_msg_id.setdefault(key.msg_id, set()).add(key.chat_id)
+
+    def _unindex(self, key: EventUid) -> None:
+        chats = self._by_msg_id.get(key.msg_id)
+        if chats is not None:
+            chats.discard(key.chat_id)
+            if not chats:
+                del self._by_msg_id[key.msg_id]
+
+    def _install(self, key: EventUid, rows: Dict[int, int]) -> bool:
+        if not rows:
+            return False
+        value = DestMap(key)
+        dict.update(value, rows)
+        super().__setitem__(key, value)
+        self._index(key)
+        return True
+
+    def _load(self, key: EventUid) -> bool:
+        """Pull a mapping evicted from memory back in from the db."""
+        return self._install(key, get_db().get(STORED, key.chat_id, key.msg_id))
+
+    async def load(self, key: EventUid) -> bool:
+        """``key in self`` without blocking the event loop on a db lookup."""
+        if super().__contains__(key):
+            return True
+        rows = await get_db().aget(STORED, key.chat_id, key.msg_id)
+        # another task may have stored or loaded it meanwhile
+        return super().__contains__(key) or self._install(key, rows)
+
+    def __contains__(self, key) -> bool:
+        return super().__contains__(key) or self._load(key)
+
+    def __missing__(self, key: EventUid):
+        if self._load(key):
+            return super().__getitem__(key)
+        raise KeyError(key)
+
+    def get(self, key: EventUid, default=None):
+        return self[key] if key in self else default
+
+    def __setitem__(self, key: EventUid, value: Dict[int, Message]) -> None:
+        if not isinstance(value, DestMap):
+            value = DestMap(key, value)
+        super().__setitem__(key, value)
+        self._index(key)
+
+    def __delitem__(self, key: EventUid) -> None:
+        self.pop(key)
+
+    def setdefault(self, key: EventUid, default=None):
+        if key not in self:
+            self[key] = {} if default is None else default
+        return self[key]
+
+    def pop(self, key: EventUid, *default):
+        if key in self:
+            self._unindex(key)
+            get_db().delete(STORED, key.chat_id, key.msg_id)
+        return super().pop(key, *default)
+
+    def evict(self, key: EventUid) -> None:
+        """Drop an entry from memory only; it stays in the mapping db."""
+        if super().__contains__(key):
+            super().__delitem__(key)
+            self._unindex(key)
+
+    def clear(self) -> None:
+        super().clear()
+        self._by_msg_id.clear()
+
+    async def sources_of(self, msg_id: int) -> Set[int]:
+        """Chat ids of the sources that have a stored message with this id.
+
+        Answered from the in-memory index when it knows the id; the mapping
+        db is only asked for ids that were evicted or never seen.
+        """
+        chats = self._by_msg_id.get(msg_id)
+        if chats:
+            return set(chats)
+        return await get_db().asources_of(STORED, msg_id)
+
+
+stored: StoredMap = StoredMap()
+
+# 最近一次同步到目标的文本摘要，编辑后内容未变化时跳过 edit_message
+# 结构: { EventUid: digest }
+delivered_digest: Dict[EventUid, str] = {}
+
+
+def text_digest(text: Optional[str]) -> str:
+    return hashlib.blake2b((text or "").encode("utf8"), digest_size=16).hexdigest()
+
 CONFIG_TYPE: int = 0
-mycol: Collection = None
+mycol: "Collection" = None
 
 # =====================================================================
 #  帖子 ID 映射（评论区功能核心）
@@ -47,7 +193,34 @@ post_id_mapping: Dict[tuple, Dict[int, int]] = {}
 # 讨论组消息 → 对应的频道帖子 ID
 # 结构: { (discussion_group_id, reply_to_top_id): src_channel_post_id }
 # Telegram 评论区消息的 reply_to.reply_to_top_id 指向讨论组中的"频道帖子副本"
-discussion_to_channel_post: Dict[tuple, int] = {}
+class DiscussionMap(dict):
+    """写入时同步到映射数据库，内存未命中时回查数据库"""
+
+    def __setitem__(self, key: tuple, channel_post: int) -> None:
+        super().__setitem__(key, channel_post)
+        get_db().put_discussion(key[0], key[1], channel_post)
+
+    def get(self, key: tuple, default=None):
+        if key in self:
+            return super().get(key)
+        channel_post = get_db().get_discussion(*key)
+        if channel_post is None:
+            return default
+        super().__setitem__(key, channel_post)
+        return channel_post
+
+    async def load(self, key: tuple, default=None):
+        """同 get，回查数据库时不阻塞事件循环"""
+        if key in self:
+            return super().get(key)
+        channel_post = await get_db().aget_discussion(*key)
+        if channel_post is None:
+            return default
+        super().__setitem__(key, channel_post)
+        return channel_post
+
+
+discussion_to_channel_post: Dict[tuple, int] = DiscussionMap()
 
 # 评论消息的映射（用于编辑/删除同步）
 # 结构: { (src_discussion_group_id, comment_msg_id): { dest_chat_id: dest_msg_id } }
@@ -67,9 +240,10 @@ def add_post_mapping(
     if key not in post_id_mapping:
         post_id_mapping[key] = {}
     post_id_mapping[key][dest_channel_id] = dest_post_id
+    get_db().put(POST, src_channel_id, src_post_id, dest_channel_id, dest_post_id)
     logging.info(
-        f"📌 帖子映射: src({src_channel_id}, {src_post_id}) "
-        f"→ dest({dest_channel_id}, {dest_post_id})"
+        "📌 帖子映射: src(%s, %s) → dest(%s, %s)",
+        src_channel_id, src_post_id, dest_channel_id, dest_post_id,
     )
 
     # 自动清理过旧的映射
@@ -78,14 +252,17 @@ def add_post_mapping(
         del post_id_mapping[oldest_key]
 
 
-def get_dest_post_id(
+async def get_dest_post_id(
     src_channel_id: int,
     src_post_id: int,
     dest_channel_id: int,
 ) -> Optional[int]:
     """查询目标频道中对应的帖子 ID"""
     key = (src_channel_id, src_post_id)
-    mapping = post_id_mapping.get(key, {})
+    mapping = post_id_mapping.get(key)
+    if mapping is None:
+        # 内存中已清理的旧帖子，回查映射数据库
+        mapping = await get_db().aget(POST, src_channel_id, src_post_id)
     return mapping.get(dest_channel_id)
 
 
@@ -100,6 +277,11 @@ def add_comment_mapping(
     if key not in comment_msg_mapping:
         comment_msg_mapping[key] = {}
     comment_msg_mapping[key][dest_chat_id] = dest_msg_id
+    get_db().put(COMMENT, src_discussion_id, src_comment_id, dest_chat_id, dest_msg_id)
+
+    if len(comment_msg_mapping) > KEEP_LAST_MANY_POSTS:
+        oldest_key = next(iter(comment_msg_mapping))
+        del comment_msg_mapping[oldest_key]
 
 
 def get_comment_dest(
@@ -108,17 +290,35 @@ def get_comment_dest(
 ) -> Optional[Dict[int, int]]:
     """查询评论在目标的映射"""
     key = (src_discussion_id, src_comment_id)
-    return comment_msg_mapping.get(key)
+    mapping = comment_msg_mapping.get(key)
+    if mapping is None:
+        mapping = get_db().get(COMMENT, src_discussion_id, src_comment_id) or None
+    return mapping
 
 
 # =====================================================================
-#  媒体组临时缓存与超时管理（保持不变）
+#  媒体组临时缓存与自适应超时
 # =====================================================================
+# 一个媒体组最多 10 条，收齐后立即发送；否则按该聊天观测到的
+# 消息间隔动态决定等待时间，避免快的组空等、慢的上传被拆成两组。
 GROUPED_CACHE: Dict[int, Dict[int, List[Message]]] = {}
 GROUPED_TIMERS: Dict[int, asyncio.TimerHandle] = {}
-GROUPED_TIMEOUT = 1.5
+GROUPED_TIMEOUT = 1.5  # 尚无观测数据时的默认等待
+GROUPED_MIN_TIMEOUT = 0.3
+GROUPED_MAX_TIMEOUT = 6.0
+GROUPED_GAP_FACTOR = 3.0  # 等待时间 = 间隔估计 × 系数
+GROUPED_MAX_ITEMS = 10  # Telegram 媒体组上限
+GROUPED_MAX_MESSAGES = 1000  # 缓存中所有媒体组的消息总数上限
 GROUPED_MAPPING: Dict[int, Dict[int, List[int]]] = {}
 
+# (chat_id, msg_id) → grouped_id
+GROUPED_INDEX: Dict[Tuple[int, int], int] = {}
+# 每个聊天的组内消息间隔估计 (EWMA, 秒)
+GROUPED_GAPS: Dict[int, float] = {}
+# grouped_id → (上一条到达时间, 本组已观测到的最大间隔)
+_group_arrivals: Dict[int, Tuple[float, float]] = {}
+_grouped_count = 0
+
 
 async def _flush_group(grouped_id: int) -> None:
     """超时或组完整时发送缓存中的媒体组"""
@@ -129,12 +329,48 @@ async def _flush_group(grouped_id: int) -> None:
         await _enqueue_grouped_messages(grouped_id)
     except Exception as e:
         logging.exception(
-            f"Failed to send grouped messages for grouped_id={grouped_id}: {e}"
+            "Failed to send grouped messages for grouped_id=%s: %s", grouped_id, e
         )
 
 
+def _group_timeout(chat_id: int, group_gap: float) -> float:
+    learned = GROUPED_GAPS.get(chat_id)
+    if learned is None and not group_gap:
+        return GROUPED_TIMEOUT
+    gap = max(learned or 0.0, group_gap)
+    return min(max(gap * GROUPED_GAP_FACTOR, GROUPED_MIN_TIMEOUT), GROUPED_MAX_TIMEOUT)
+
+
+def _observe_arrival(chat_id: int, grouped_id: int) -> float:
+    """更新间隔估计，返回本组目前的最大间隔"""
+    now = time.monotonic()
+    last, group_gap = _group_arrivals.get(grouped_id, (None, 0.0))
+    if last is not None:
+        gap = now - last
+        group_gap = max(group_gap, gap)
+        prev = GROUPED_GAPS.get(chat_id)
+        GROUPED_GAPS[chat_id] = gap if prev is None else 0.8 * prev + 0.2 * gap
+    _group_arrivals[grouped_id] = (now, group_gap)
+    return group_gap
+
+
+def _schedule_flush(grouped_id: int, delay: float) -> None:
+    timer = GROUPED_TIMERS.pop(grouped_id, None)
+    if timer is not None:
+        timer.cancel()
+    if delay <= 0:
+        asyncio.ensure_future(_flush_group(grouped_id))
+        return
+    loop = asyncio.get_running_loop()
+    GROUPED_TIMERS[grouped_id] = loop.call_later(
+        delay,
+        lambda gid=grouped_id: asyncio.ensure_future(_flush_group(gid)),
+    )
+
+
 def add_to_group_cache(chat_id: int, grouped_id: int, message: Message) -> None:
-    """将消息加入媒体组缓存，并启动/重置超时定时器"""
+    """将消息加入媒体组缓存；组满立即发送，否则按自适应超时等待"""
+    global _grouped_count
     if grouped_id not in GROUPED_CACHE:
         GROUPED_CACHE[grouped_id] = {}
         GROUPED_MAPPING[grouped_id] = {}
@@ -143,20 +379,42 @@ def add_to_group_cache(chat_id: int, grouped_id: int, message: Message) -> None:
         GROUPED_MAPPING[grouped_id][chat_id] = []
     GROUPED_CACHE[grouped_id][chat_id].append(message)
     GROUPED_MAPPING[grouped_id][chat_id].append(message.id)
-
-    if grouped_id in GROUPED_TIMERS:
-        GROUPED_TIMERS[grouped_id].cancel()
-
-    loop = asyncio.get_running_loop()
-    GROUPED_TIMERS[grouped_id] = loop.call_later(
-        GROUPED_TIMEOUT,
-        lambda gid=grouped_id: asyncio.ensure_future(_flush_group(gid)),
-    )
+    GROUPED_INDEX[(chat_id, message.id)] = grouped_id
+    _grouped_count += 1
+
+    group_gap = _observe_arrival(chat_id, grouped_id)
+    if len(GROUPED_CACHE[grouped_id][chat_id]) >= GROUPED_MAX_ITEMS:
+        _schedule_flush(grouped_id, 0)
+    else:
+        _schedule_flush(grouped_id, _group_timeout(chat_id, group_gap))
+
+    # 缓存过大时提前发送最早的媒体组
+    if _grouped_count > GROUPED_MAX_MESSAGES:
+        oldest = next(iter(GROUPED_CACHE))
+        if oldest != grouped_id:
+            logging.warning("⚠️ 媒体组缓存已满，提前发送 grouped_id=%s", oldest)
+            _schedule_flush(oldest, 0)
+
+
+def pop_group(grouped_id: int) -> Dict[int, List[Message]]:
+    """取出一个媒体组并清理它的定时器与索引"""
+    global _grouped_count
+    chat_messages_map = GROUPED_CACHE.pop(grouped_id, {})
+    timer = GROUPED_TIMERS.pop(grouped_id, None)
+    if timer is not None:
+        timer.cancel()
+    GROUPED_MAPPING.pop(grouped_id, None)
+    _group_arrivals.pop(grouped_id, None)
+    for chat_id, messages in chat_messages_map.items():
+        _grouped_count -= len(messages)
+        for message in messages:
+            GROUPED_INDEX.pop((chat_id, message.id), None)
+    return chat_messages_map
 
 
 def get_grouped_messages(chat_id: int, msg_id: int) -> Optional[List[int]]:
     """根据消息ID获取同组所有消息ID"""
-    for grouped_id, mapping in GROUPED_MAPPING.items():
-        if chat_id in mapping and msg_id in mapping[chat_id]:
-            return mapping[chat_id]
-    return None
+    grouped_id = GROUPED_INDEX.get((chat_id, msg_id))
+    if grouped_id is None:
+        return None
+    return GROUPED_MAPPING[grouped_id][chat_id]
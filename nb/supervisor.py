@@ -0,0 +1,205 @@
+"""Run ``nb live`` as several worker processes, one shard of the forwards each.
+
+``nb live --workers N`` starts N copies of ``nb live`` with
+``NB_SHARD=i/N`` (see ``nb.shard``). Each worker has its own event loop,
+plugin instances, live queue and Telegram connection, so OCR, watermarks
+and the other CPU heavy plugins use N cores.
+
+The supervisor restarts a worker that exits, waiting longer after every
+crash in a row, and merges the metrics snapshots of the workers into
+``METRICS_FILE`` for the web UI. SIGTERM and SIGINT are passed on to the
+workers.
+"""
+
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+from nb import metrics
+from nb.const import (
+    LOG_FILE_ENV_VAR,
+    METRICS_FILE,
+    METRICS_INTERVAL,
+    METRICS_PORT_ENV_VAR,
+    RECORD_ENV_VAR,
+    SHARD_ENV_VAR,
+    WORKER_RESTART_DELAY,
+    WORKER_RESTART_MAX_DELAY,
+    WORKERS_ENV_VAR,
+)
+from nb.shard import shard_file
+
+# 运行超过此秒数后再退出，不算连续崩溃
+STABLE_AFTER = 60.0
+STOP_TIMEOUT = 10.0
+
+
+class Worker:
+    def __init__(self, index: int, count: int, args: List[str]) -> None:
+        self.index = index
+        self.count = count
+        self.args = args
+        self.proc: Optional[subprocess.Popen] = None
+        self.started = 0.0
+        self.restarts = 0
+        self.delay = WORKER_RESTART_DELAY
+        self.restart_at = 0.0
+
+    def env(self) -> Dict[str, str]:
+        env = dict(os.environ)
+        env.pop(WORKERS_ENV_VAR, None)
+        env[SHARD_ENV_VAR] = f"{self.index}/{self.count}"
+        # files written by a single process get the worker index as suffix
+        for name in (LOG_FILE_ENV_VAR, RECORD_ENV_VAR):
+            if env.get(name):
+                env[name] = shard_file(env[name], self.index)
+        if env.get(METRICS_PORT_ENV_VAR):
+            env[METRICS_PORT_ENV_VAR] = str(int(env[METRICS_PORT_ENV_VAR]) + self.index)
+        return env
+
+    def start(self) -> None:
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "nb.cli", "live", *self.args], env=self.env()
+        )
+        self.started = time.monotonic()
+        logging.info("🧩 工作进程 %s/%s 已启动 pid=%s", self.index, self.count, self.proc.pid)
+
+    def check(self, now: float) -> None:
+        """Restart the worker when it has exited and its backoff has passed."""
+        if self.proc is None:
+            if now >= self.restart_at:
+                self.restarts += 1
+                self.start()
+            return
+        code = self.proc.poll()
+        if code is None:
+            return
+        if now - self.started > STABLE_AFTER:
+            self.delay = WORKER_RESTART_DELAY
+        logging.error("💥 工作进程 %s 退出 (code=%s)，%.0f 秒后重启", self.index, code, self.delay)
+        self.proc = None
+        self.restart_at = now + self.delay
+        self.delay = min(self.delay * 2, WORKER_RESTART_MAX_DELAY)
+
+    def stop(self) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+
+    def wait(self, deadline: float) -> None:
+        if self.proc is None:
+            return
+        try:
+            self.proc.wait(max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            logging.warning("⚠️ 工作进程 %s 未及时退出，强制结束", self.index)
+            self.proc.kill()
+
+
+def _add(into: Dict[str, float], values: Dict[str, float]) -> None:
+    for key, value in values.items():
+        into[key] = into.get(key, 0) + value
+
+
+def _merge_gauges(into: Dict[str, float], values: Dict[str, float]) -> None:
+    # 队列长度等数量相加；年龄、延迟类（*_age、*_lag）取最大值
+    for key, value in values.items():
+        if key.endswith(("_age", "_lag")):
+            into[key] = max(into.get(key, 0), value)
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def _worst(into: Dict[str, float], stats: Dict[str, float]) -> None:
+    # 分位数无法精确合并：计数相加，各分位取最慢的工作进程
+    for key, value in stats.items():
+        into[key] = into.get(key, 0) + value if key == "count" else max(into.get(key, 0), value)
+
+
+def merge_snapshots(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """One snapshot for all workers: counts are summed, ages and percentiles are the worst worker's."""
+    merged: Dict[str, Any] = {
+        "time": time.time(),
+        "started_at": min((s.get("started_at", time.time()) for s in snapshots), default=time.time()),
+        "pid": os.getpid(),
+        "messages_in": {},
+        "messages_out": {},
+        "send_errors": {},
+        "counters": {},
+        "gauges": {},
+        "send_latency": {},
+        "queue_wait": {},
+        "plugins": defaultdict(dict),
+    }
+    for snap in snapshots:
+        for key in ("messages_in", "messages_out", "send_errors", "counters"):
+            _add(merged[key], snap.get(key, {}))
+        _merge_gauges(merged["gauges"], snap.get("gauges", {}))
+        for key in ("send_latency", "queue_wait"):
+            _worst(merged[key], snap.get(key, {}))
+        for pid, stats in snap.get("plugins", {}).items():
+            _worst(merged["plugins"][pid], stats)
+    merged["plugins"] = dict(merged["plugins"])
+    return merged
+
+
+class Supervisor:
+    def __init__(self, count: int, args: List[str]) -> None:
+        self.workers = [Worker(i, count, args) for i in range(count)]
+        self.stopping = False
+
+    def _stop(self, signum, frame) -> None:
+        logging.info("🛑 收到信号 %s，正在停止 %s 个工作进程", signum, len(self.workers))
+        self.stopping = True
+
+    def _publish_metrics(self) -> None:
+        snapshots = []
+        for worker in self.workers:
+            snap = metrics.read_snapshot(shard_file(METRICS_FILE, worker.index))
+            if snap:
+                snapshots.append(snap)
+        merged = merge_snapshots(snapshots)
+        merged["workers"] = {
+            str(w.index): {"pid": w.proc.pid if w.proc else None, "restarts": w.restarts}
+            for w in self.workers
+        }
+        tmp = f"{METRICS_FILE}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf8") as file:
+                json.dump(merged, file)
+            os.replace(tmp, METRICS_FILE)
+        except OSError as e:
+            logging.warning("⚠️ 写入监控数据失败: %s", e)
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        for worker in self.workers:
+            worker.start()
+        next_publish = time.monotonic() + METRICS_INTERVAL
+        while not self.stopping:
+            now = time.monotonic()
+            for worker in self.workers:
+                worker.check(now)
+            if now >= next_publish:
+                self._publish_metrics()
+                next_publish = now + METRICS_INTERVAL
+            time.sleep(0.5)
+
+        for worker in self.workers:
+            worker.stop()
+        deadline = time.monotonic() + STOP_TIMEOUT
+        for worker in self.workers:
+            worker.wait(deadline)
+        logging.info("🛑 所有工作进程已停止")
+
+
+def run_supervisor(count: int, args: List[str]) -> None:
+    """Run ``count`` live workers until SIGTERM/SIGINT; ``args`` are passed to each."""
+    logging.info("🧩 以 %s 个工作进程运行 live 模式", count)
+    Supervisor(count, args).run()
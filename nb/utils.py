@@ -3,8 +3,6 @@
 import os
 from typing import Dict, List
 
-import streamlit as st
-from streamlit.components.v1 import html
 from nb.config import write_config
 
 
@@ -86,6 +84,9 @@ def inject_custom_css(theme: str = "light"):
         }
         """
 
+    # streamlit 只在 Web 界面需要，worker 导入本模块时不加载
+    import streamlit as st
+
     st.markdown(
         f"""
         <style>
@@ -294,6 +295,8 @@ def apply_theme(st, CONFIG, hidden_container):
                 script += f"localStorage.setItem('stActiveTheme-/{page_name}-v1', '{{\"name\":\"{theme}\"}}');"
 
     script += "parent.location.reload()</script>"
+    from streamlit.components.v1 import html
+
     with hidden_container:
         html(script, height=0, width=0)
 
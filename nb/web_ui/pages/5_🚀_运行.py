@@ -11,6 +11,8 @@ import html
 import streamlit as st
 import streamlit.components.v1 as components
 from nb.config import CONFIG, read_config, write_config
+from nb.const import LOG_FILE_ENV_VAR, WORKER_OUTPUT_FILE
+from nb.log_files import LogTail, worker_log_files
 from nb.web_ui.password import check_password
 from nb.web_ui.utils import switch_theme
 
@@ -18,7 +20,7 @@ CONFIG = read_config()
 
 PID_FILE = os.path.join(os.getcwd(), "nb.pid")
 LOG_FILE = os.path.join(os.getcwd(), "logs.txt")
-OLD_LOG_FILE = os.path.join(os.getcwd(), "old_logs.txt")
+OUTPUT_FILE = os.path.join(os.getcwd(), WORKER_OUTPUT_FILE)
 
 # --- Process Utils (保持不变) ---
 def rerun():
@@ -128,17 +130,16 @@ def kill_process(pid: int, force: bool = False) -> bool:
     return _kill_posix(pid, force)
 
 def start_nb_process(mode: str) -> int:
-    if os.path.exists(LOG_FILE):
-        try: os.rename(LOG_FILE, OLD_LOG_FILE)
-        except: pass
     cwd = os.getcwd()
     python = sys.executable
     env = os.environ.copy()
     env["PYTHONUNBUFFERED"] = "1"
     env["PYTHONPATH"] = cwd
+    # 日志由 worker 自行按大小轮转压缩写入 LOG_FILE，stdout 只剩启动信息
+    env[LOG_FILE_ENV_VAR] = LOG_FILE
     cmd = [python, "-u", "-m", "nb.cli", mode, "--loud"]
     try:
-        fd = os.open(LOG_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        fd = os.open(OUTPUT_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
         proc = subprocess.Popen(cmd, stdout=fd, stderr=fd, stdin=subprocess.DEVNULL, cwd=cwd, env=env, start_new_session=True)
         os.close(fd)
         time.sleep(2)
@@ -292,14 +293,26 @@ if check_password(st):
         st.write("") # Spacer to align vertically if needed
         auto_refresh = st.toggle("自动刷新", value=False)
 
+    # --workers 时每个工作进程写自己的 logs.N.txt；nb.out.txt 是启动输出
+    log_files = [path for path in worker_log_files(LOG_FILE) + [OUTPUT_FILE] if os.path.exists(path)]
+    log_path = None
+    if len(log_files) > 1:
+        log_path = st.selectbox("日志文件", log_files, format_func=os.path.basename)
+    elif log_files:
+        log_path = log_files[0]
+
     log_content = "暂无日志。"
-    if os.path.exists(LOG_FILE):
+    if log_path is not None:
+        # 只读取上次刷新后新增的部分，开销与日志大小无关
+        if "log_tails" not in st.session_state:
+            st.session_state.log_tails = {}
+        if log_path not in st.session_state.log_tails:
+            st.session_state.log_tails[log_path] = LogTail(log_path, max_lines=100)
         try:
-            with open(LOG_FILE, "r") as f:
-                lines = f.readlines()
-                raw_content = "".join(lines[-100:]) if lines else "等待输出..."
-                # ✅ 关键修复：转义 HTML 字符，防止破坏 DOM 结构
-                log_content = html.escape(raw_content)
+            lines = st.session_state.log_tails[log_path].poll()
+            raw_content = "\n".join(lines) if lines else "等待输出..."
+            # ✅ 关键修复：转义 HTML 字符，防止破坏 DOM 结构
+            log_content = html.escape(raw_content)
         except: pass
     
     # 恢复日志显示框样式（白色背景）
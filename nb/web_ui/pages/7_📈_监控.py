@@ -0,0 +1,130 @@
+import time
+from collections import deque
+
+import streamlit as st
+
+from nb import metrics
+from nb.config import read_config
+from nb.const import METRICS_INTERVAL
+from nb.web_ui.password import check_password
+from nb.web_ui.utils import hide_st, switch_theme
+
+CONFIG = read_config()
+
+st.set_page_config(page_title="监控", page_icon="📈", layout="wide")
+hide_st(st)
+switch_theme(st, CONFIG)
+
+
+def rerun():
+    if hasattr(st, "rerun"):
+        st.rerun()
+    elif hasattr(st, "experimental_rerun"):
+        st.experimental_rerun()
+
+
+def _ms(stats: dict) -> dict:
+    return {k: round(v * 1000, 1) if k != "count" else v for k, v in stats.items()}
+
+
+def _mb(value: float) -> str:
+    return f"{value / 1024 / 1024:.1f} MB"
+
+
+if check_password(st):
+    st.title("运行监控")
+
+    snap = metrics.read_snapshot()
+    if not snap:
+        st.info("暂无监控数据：请先在「运行」页面启动 live 模式。")
+        st.stop()
+
+    age = time.time() - snap["time"]
+    if age > 3 * METRICS_INTERVAL:
+        st.warning(f"监控数据已 {int(age)} 秒未更新，worker 可能已停止。")
+
+    total_in = sum(snap["messages_in"].values())
+    total_out = sum(snap["messages_out"].values())
+    total_err = sum(snap["send_errors"].values())
+    counters = snap["counters"]
+    gauges = snap["gauges"]
+
+    # 保存最近的快照用于绘制吞吐曲线
+    if "metrics_history" not in st.session_state:
+        st.session_state.metrics_history = deque(maxlen=360)
+    history = st.session_state.metrics_history
+    if not history or history[-1]["time"] != snap["time"]:
+        history.append({"time": snap["time"], "in": total_in, "out": total_out})
+
+    c1, c2, c3, c4, c5, c6 = st.columns(6)
+    c1.metric("收到消息", total_in)
+    c2.metric("已发送", total_out)
+    c3.metric("发送失败", total_err)
+    c4.metric("发送队列", int(gauges.get("send_queue", 0)))
+    c5.metric("FloodWait 累计", f"{int(counters.get('flood_wait_seconds', 0))} 秒")
+    c6.metric("上传 / 下载", f"{_mb(counters.get('bytes_up', 0))} / {_mb(counters.get('bytes_down', 0))}")
+
+    st.subheader("吞吐 (条/分钟)")
+    if len(history) >= 2:
+        rates = {"收到": [], "发送": []}
+        for prev, cur in zip(history, list(history)[1:]):
+            span = (cur["time"] - prev["time"]) / 60 or 1
+            rates["收到"].append(max(cur["in"] - prev["in"], 0) / span)
+            rates["发送"].append(max(cur["out"] - prev["out"], 0) / span)
+        st.line_chart(rates)
+    else:
+        st.caption("打开自动刷新后逐步绘制。")
+
+    left, right = st.columns(2)
+    with left:
+        st.subheader("按转发统计")
+        chats = sorted(set(snap["messages_in"]) | set(snap["messages_out"]) | set(snap["send_errors"]))
+        st.dataframe(
+            [
+                {
+                    "源聊天": chat,
+                    "收到": snap["messages_in"].get(chat, 0),
+                    "发送": snap["messages_out"].get(chat, 0),
+                    "失败": snap["send_errors"].get(chat, 0),
+                }
+                for chat in chats
+            ],
+            use_container_width=True,
+        )
+
+        st.subheader("队列")
+        st.dataframe(
+            [{"队列": name, "当前值": round(value, 2)} for name, value in gauges.items()],
+            use_container_width=True,
+        )
+
+    with right:
+        st.subheader("发送耗时 (毫秒)")
+        st.dataframe(
+            [
+                {"阶段": "排队", **_ms(snap["queue_wait"])},
+                {"阶段": "发送", **_ms(snap["send_latency"])},
+            ],
+            use_container_width=True,
+        )
+
+        st.subheader("插件耗时 (毫秒/条)")
+        plugins = {pid: _ms(stats) for pid, stats in snap["plugins"].items() if stats["count"]}
+        if plugins:
+            st.bar_chart({"p50": {pid: stats["p50"] for pid, stats in plugins.items()}})
+            st.dataframe(
+                [{"插件": pid, **stats} for pid, stats in plugins.items()],
+                use_container_width=True,
+            )
+        else:
+            st.caption("暂无插件耗时数据。")
+
+    c_refresh, c_auto = st.columns([1, 3])
+    with c_refresh:
+        if st.button("🔄 刷新", use_container_width=True):
+            rerun()
+    with c_auto:
+        auto_refresh = st.toggle("自动刷新", value=False)
+    if auto_refresh:
+        time.sleep(METRICS_INTERVAL)
+        rerun()